@@ -1,6 +1,7 @@
 from pathlib import Path
 import numpy as np
 import torch
+from numpy.lib.format import open_memmap
 from nncore.segmentation.datasets import DATASET_REGISTRY
 
 
@@ -21,7 +22,9 @@ class Cam2BEVDataset(torch.utils.data.Dataset):
         with np.load(self.data_paths[idx]) as data:
             image = data['image']  # 1, H, W
             mask = data['mask']    # 1, H, W
+        return self._to_item(image, mask)
 
+    def _to_item(self, image, mask):
         if self.raw:
             return (image, mask)
 
@@ -41,6 +44,90 @@ class Cam2BEVDataset(torch.utils.data.Dataset):
         zeros = torch.zeros(*x.size(), self.num_classes, dtype=x.dtype)
         return zeros.scatter(scatter_dim, x_tensor, 1)
 
+def convert_to_memmap(data_dir: str, out_dir: str, compress: bool = False):
+    """Consolidate a `preprocess_np` directory into two uint8 N x H x W arrays
+
+    Writes `images.npy` and `masks.npy` to out_dir, sample by sample through
+    `open_memmap` so the dataset never has to fit in RAM.
+
+    Args:
+        data_dir (str): folder of per-sample `.npz` files
+        out_dir (str): output folder
+        compress (bool, optional): also write chunked zstd copies for cold storage. Defaults to False.
+    """
+    paths = sorted(Path(data_dir).glob('*.npz'))
+    assert len(paths) > 0, f"No .npz file found in {data_dir}"
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    with np.load(paths[0]) as data:
+        shape = data['image'].shape[1:]  # H, W
+    images = open_memmap(out_dir / 'images.npy', mode='w+', dtype=np.uint8, shape=(len(paths), *shape))
+    masks = open_memmap(out_dir / 'masks.npy', mode='w+', dtype=np.uint8, shape=(len(paths), *shape))
+    for i, path in enumerate(paths):
+        with np.load(path) as data:
+            images[i] = data['image'][0]
+            masks[i] = data['mask'][0]
+    images.flush()
+    masks.flush()
+    del images, masks
+
+    if compress:
+        for name in ('images.npy', 'masks.npy'):
+            zstd_compress(out_dir / name)
+
+
+def zstd_compress(path: Path, chunk_size: int = 1 << 24):
+    """Write `path` to `path.zst`, streamed in chunks"""
+    import zstandard
+
+    with open(path, 'rb') as src, open(f'{path}.zst', 'wb') as dst:
+        with zstandard.ZstdCompressor().stream_writer(dst) as writer:
+            for chunk in iter(lambda: src.read(chunk_size), b''):
+                writer.write(chunk)
+
+
+def zstd_decompress(path: Path, chunk_size: int = 1 << 24):
+    """Restore `path` from `path.zst`, streamed in chunks"""
+    import zstandard
+
+    with open(f'{path}.zst', 'rb') as src, open(path, 'wb') as dst:
+        zstandard.ZstdDecompressor().copy_stream(src, dst, read_size=chunk_size, write_size=chunk_size)
+
+
+@DATASET_REGISTRY.register()
+class Cam2BEVMemmapDataset(Cam2BEVDataset):
+    """Cam2BEV Dataset read from the arrays written by `convert_to_memmap`
+
+    Arrays are opened with `mmap_mode='r'` on first access in each worker, so
+    workers share the page cache and samples are indexed without decompression.
+    If only the `.zst` copies are present, they are decompressed once.
+    """
+
+    def __init__(self, data_dir: str, num_classes: int = 10, raw: bool = False):
+        self.data_dir = Path(data_dir)
+        for name in ('images.npy', 'masks.npy'):
+            path = self.data_dir / name
+            if not path.exists() and Path(f'{path}.zst').exists():
+                zstd_decompress(path)
+        self.num_classes = num_classes
+        self.raw = raw
+        # memmaps are opened lazily so they are not pickled into the workers
+        self._images = self._masks = None
+        self._len = len(np.load(self.data_dir / 'images.npy', mmap_mode='r'))
+
+    def __getitem__(self, idx):
+        if self._images is None:
+            self._images = np.load(self.data_dir / 'images.npy', mmap_mode='r')
+            self._masks = np.load(self.data_dir / 'masks.npy', mmap_mode='r')
+        image = self._images[idx][None]  # 1, H, W
+        mask = self._masks[idx][None]    # 1, H, W
+        return self._to_item(np.array(image), np.array(mask))
+
+    def __len__(self):
+        return self._len
+
+
 def main():
     dataset = Cam2BEVDataset('./preprocess_np/val', num_classes=10, raw=True)
     print(len(dataset))
@@ -68,4 +155,10 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
+    # python dataset.py                                   plot a sample
+    # python dataset.py ./preprocess_np/val ./memmap/val  convert to memmap arrays
+    import sys
+    if len(sys.argv) >= 3:
+        convert_to_memmap(sys.argv[1], sys.argv[2], compress='--compress' in sys.argv)
+    else:
+        main()
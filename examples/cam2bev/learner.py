@@ -1,4 +1,4 @@
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Optional
 
 import numpy as np
 import torch
@@ -6,7 +6,7 @@ import torchvision
 from nncore.core.learner.supervisedlearner import SupervisedLearner
 from nncore.core.metrics.metric_template import Metric
 from nncore.utils.device import get_device
-from nncore.utils.utils import inverse_normalize_batch, tensor2plt
+from nncore.utils.utils import inverse_normalize_batch
 from torch import device
 from torch.nn import Module
 from torch.optim import Optimizer
@@ -29,9 +29,10 @@ class Cam2BEVLearner(SupervisedLearner):
         val_data (DataLoader): validation dataloader
         device (torch.device): training device
         model (Module): model to optimize
-        scheduler (lr_scheduler): learning rate scheduler  
+        scheduler (LRScheduler): learning rate scheduler, a plain torch scheduler is wrapped to step every epoch
         optimizer (torch.optim.Optimizer): optimizer 
         metrics (Dict[str, Metric]): evaluate metrics
+        batch_transform (Optional[Dict[str, Callable]], optional): on-device batch transforms keyed by stage. Defaults to None.
     """
 
     def __init__(
@@ -44,6 +45,7 @@ class Cam2BEVLearner(SupervisedLearner):
         scheduler,
         optimizer: Optimizer,
         device: device = get_device(),
+        batch_transform: Optional[Dict[str, Callable]] = None,
     ):
         super().__init__(
             cfg=cfg,
@@ -54,6 +56,7 @@ class Cam2BEVLearner(SupervisedLearner):
             scheduler=scheduler,
             optimizer=optimizer,
             device=device,
+            batch_transform=batch_transform,
         )
 
     def save_result(self, pred, batch, stage: str):
@@ -76,15 +79,10 @@ class Cam2BEVLearner(SupervisedLearner):
         save_image(lbls, str(save_dir / "last_batch_labels.png"))
         save_image(outs, str(save_dir / "last_batch_preds.png"))
 
-        rbgs_plt = tensor2plt(rgbs, title="inputs")
-        lbls_plt = tensor2plt(lbls.long(), title="labels")
-        outs_plt = tensor2plt(outs.long(), title="predictions")
-
-        self.tsboard.update_figure(
-            f"{stage}/samples/last_batch",
-            [rbgs_plt, lbls_plt, outs_plt],
-            step=self.epoch,
-        )
+        # tensors go to the logger thread, no matplotlib rendering in the training loop
+        self.tsboard.update_image(f"{stage}/samples/inputs", rgbs / 255, step=self.epoch)
+        self.tsboard.update_image(f"{stage}/samples/labels", lbls / 255, step=self.epoch)
+        self.tsboard.update_image(f"{stage}/samples/predictions", outs / 255, step=self.epoch)
 
     def _image_batch_show(self, batch, ncol=5, fig_size=(30, 10), normalize=False):
         grid_img = torchvision.utils.make_grid(batch, nrow=ncol, normalize=normalize)
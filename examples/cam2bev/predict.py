@@ -1,5 +1,5 @@
 import sys
-from typing import List
+from typing import List, Optional
 
 sys.path.insert(0, "../../")
 
@@ -10,6 +10,7 @@ import matplotlib.pyplot as plt
 import numpy as np
 import torch
 import torch.nn as nn
+from nncore.core.inference import SlidingWindowInference
 from nncore.segmentation.models import MODEL_REGISTRY
 from nncore.utils.device import detach, get_device
 from nncore.utils.getter import get_instance
@@ -30,9 +31,12 @@ class SegmentationModel(nn.Module):
     def __init__(
         self,
         model: nn.Module,
+        tiled: Optional[SlidingWindowInference] = None,
     ):
         super(SegmentationModel, self).__init__()
         self.model = model
+        # tiled inference at native resolution instead of resizing
+        self.tiled = tiled
         self.onehot_encode = OneHotEncoding(10)
         self.color_encode = ColorEncoding(parse_convert_xml('convert_10.xml'))
         self.resize = Resize()
@@ -48,12 +52,12 @@ class SegmentationModel(nn.Module):
 
         for image_path in progress_bar:
             image = np.array(Image.open(image_path))
-            inputs, _ = self.resize(image)
+            inputs = image if self.tiled is not None else self.resize(image)[0]
             inputs = self.color_encode(inputs)
             inputs = self.onehot_encode(inputs)
             inputs = torch.tensor(inputs).unsqueeze_(0).permute(0, 3, 1, 2)  # 1, C, H, W
             inputs = inputs.float().to(device)
-            preds = model(inputs)['out']
+            preds = self.tiled(inputs) if self.tiled is not None else self.model(inputs)['out']
             outputs = detach(preds)
             yield inputs, outputs
 
@@ -63,6 +67,10 @@ if __name__ == "__main__":
     parser.add_argument('checkpoint_dir', type=str)
     parser.add_argument('input_image_paths', type=str, nargs='+')
     parser.add_argument('--output_dir', type=str, default='outputs')
+    parser.add_argument('--tiled', action='store_true', help='predict at native resolution with overlapping tiles')
+    parser.add_argument('--tile_size', type=int, nargs=2, default=[256, 512], help='H W of the tiles')
+    parser.add_argument('--overlap', type=float, default=0.25, help='fraction of a tile shared with its neighbour')
+    parser.add_argument('--tile_batch_size', type=int, default=8, help='tiles per forward call')
 
     args = parser.parse_args()
 
@@ -72,7 +80,17 @@ if __name__ == "__main__":
     load_model(model, checkpoint_dir / "best_loss.pth")
     device = get_device()
     print('Run on', device)
-    inference_model = SegmentationModel(model).to(device).eval()
+    tiled = (
+        SlidingWindowInference(
+            model,
+            tile_size=tuple(args.tile_size),
+            overlap=args.overlap,
+            batch_size=args.tile_batch_size,
+        )
+        if args.tiled
+        else None
+    )
+    inference_model = SegmentationModel(model, tiled).to(device).eval()
     predicts = inference_model.predict(
         args.input_image_paths,
         device=device,
@@ -1,45 +1,64 @@
-from re import I
 import sys
-from importlib import import_module
-
+from argparse import ArgumentParser
+from functools import partial
+from pathlib import Path
 
 sys.path.insert(0, "../../")
 
-from nncore.utils.getter import get_instance
-from nncore.utils import load_model, load_yaml, get_device, image_batch_show
-from nncore.models.wrapper import SegmentationModel
-from nncore.utils.segmentation import multi_class_prediction
-from torchvision.utils import save_image
+import numpy as np
+from nncore.core.datasets import DECODER_REGISTRY
+from nncore.core.inference.pool import InferencePool
+from nncore.segmentation.inference import SegmentationPredictor
+from nncore.segmentation.utils import color_map
+from nncore.utils.device import get_device
+from nncore.utils.loading import load_yaml
+from PIL import Image
 
 
-from pathlib import Path
-
 if __name__ == "__main__":
-    checkpoint_folder = Path("./runs/default_2021_09_18-20_28_41/checkpoints")
-    cfg = load_yaml(checkpoint_folder / "config.yaml")
-    model = get_instance(cfg["pipeline"]["model"])
-    load_model(model, checkpoint_folder / "best_loss.pth")
-    device = get_device()
-    inference_model = SegmentationModel(model, None)
-    rgbs, pred = inference_model.predict(
-        [
-            "./data/images/1.png",
-            "./data/images/1.png",
-            "./data/images/1.png",
-            "./data/images/1.png",
-        ],
-        device=device,
-        batch_size=2,
-        return_inp=True,
+    parser = ArgumentParser()
+    parser.add_argument("checkpoint_dir", type=str)
+    parser.add_argument("input_image_paths", type=str, nargs="+")
+    parser.add_argument("--checkpoint", type=str, default="best_loss.pth")
+    parser.add_argument("--output-dir", type=str, default="demo")
+    parser.add_argument("--image-size", type=int, nargs=2, default=[224, 224], help="H W of the resized inputs")
+    parser.add_argument("--tiled", action="store_true", help="predict at native resolution with overlapping tiles")
+    parser.add_argument("--tile-size", type=int, nargs=2, default=[224, 224], help="H W of the tiles")
+    parser.add_argument("--overlap", type=float, default=0.25, help="fraction of a tile shared with its neighbour")
+    parser.add_argument("--tile-batch-size", type=int, default=8, help="tiles per forward call")
+    parser.add_argument("--tta", action="store_true", help="test-time augmentation from the tta section of the config, hflip if missing")
+    parser.add_argument("--replicas", type=int, default=1, help="CPU model replicas in worker processes")
+    parser.add_argument("--threads", type=int, help="torch threads per replica, the cores split evenly if not set")
+    args = parser.parse_args()
+
+    cfg = load_yaml(Path(args.checkpoint_dir) / "config.yaml")
+    tiled = (
+        dict(tile_size=tuple(args.tile_size), overlap=args.overlap, batch_size=args.tile_batch_size)
+        if args.tiled
+        else None
+    )
+    factory = partial(
+        SegmentationPredictor.from_checkpoint,
+        args.checkpoint_dir,
+        args.checkpoint,
+        image_size=None if args.tiled else args.image_size,
+        tiled=tiled,
+        tta=(cfg["pipeline"].get("tta") or {}) if args.tta else None,
     )
-    print(rgbs.shape)
-    print(pred.shape)
+    decode = DECODER_REGISTRY.get("pil")
+    images = (decode(path) for path in args.input_image_paths)
+    if args.replicas > 1:
+        pool = InferencePool(factory, replicas=args.replicas, threads=args.threads)
+        preds = pool.map(images)
+    else:
+        predictor = factory(device=get_device())
+        preds = (predictor([image])[0] for image in images)
+    cmap = color_map()
 
-    save_dir = Path("./demo")
+    save_dir = Path(args.output_dir)
     save_dir.mkdir(parents=True, exist_ok=True)
-    pred = multi_class_prediction(pred).unsqueeze(1)
-    outs = image_batch_show(pred)
-    rgbs = image_batch_show(rgbs)
-
-    save_image(rgbs, str(save_dir / "pred.png"), normalize=True)
-    save_image(outs, str(save_dir / "rbgs.png"))
+    for path, pred in zip(args.input_image_paths, preds):
+        Image.fromarray(cmap[pred].astype(np.uint8)).save(save_dir / f"{Path(path).stem}_pred.png")
+        print(f"{path}: {pred.shape} -> {save_dir / (Path(path).stem + '_pred.png')}")
+    if args.replicas > 1:
+        pool.close()
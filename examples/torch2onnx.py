@@ -6,6 +6,7 @@ import torch.nn as nn
 import torch.onnx
 import yaml
 from nncore.utils import getter
+from nncore.utils.utils import load_model
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser("Export model to onnx")
@@ -24,8 +25,7 @@ if __name__ == "__main__":
     # Load model
     model_config = config["pipeline"]["model"]
     model: nn.Module = getter.get_instance(model_config)
-    ckpt = torch.load(args.checkpoint, map_location="cpu")
-    model.load_state_dict(ckpt["model_state_dict"])
+    load_model(model, args.checkpoint)
 
     model_name: str = model_config["name"]
     in_shape_str = "x".join(map(str, args.in_shape))
@@ -1,4 +1,19 @@
-from nncore.core.registry import Registry
+from nncore.core.registry import Registry, lazy_import
 DATASET_REGISTRY = Registry('DATASET')
+DECODER_REGISTRY = Registry('DECODER')
 
-from .default_datasets import TestImageDataset
\ No newline at end of file
+from .cache import SharedCacheDataset, find_cache
+from .indexed import IndexedDataset
+from .normalization import IMAGENET_MEAN, IMAGENET_STD, input_normalization, normalization
+from .sampler import ResumableSampler
+
+DECODER_REGISTRY.register_lazy(["pil", "cv2", "torchvision", "matplotlib"], "nncore.core.datasets.decoders")
+
+__getattr__ = lazy_import(
+    __name__,
+    {
+        "benchmark_decoders": ".decoders",
+        "TestImageDataset": ".default_datasets",
+        "Manifest": ".manifest",
+    },
+)
@@ -0,0 +1,142 @@
+import multiprocessing as mp
+from typing import Any, Dict, List, Tuple
+
+import torch
+
+__all__ = ["SharedCacheDataset", "find_cache"]
+
+
+def _align(n: int, alignment: int = 8) -> int:
+    return (n + alignment - 1) // alignment * alignment
+
+
+class SharedCacheDataset(torch.utils.data.Dataset):
+    r"""SharedCacheDataset keeps decoded samples in shared memory
+
+    Samples of the wrapped dataset are filled lazily into fixed-size slots of
+    one shared uint8 buffer on first access, so every DataLoader worker and
+    every later epoch reads them from RAM instead of decoding the files again.
+    When the memory cap is reached, slots are recycled with the clock
+    (second-chance LRU) policy.
+
+    The slot layout is taken from the first sample, so the wrapped dataset has
+    to return a dict of tensors with the same shapes for every index. Random
+    augmentations would be frozen by the cache, wrap a `decode_only` dataset
+    and augment with batch transforms instead.
+
+    Args:
+        dataset (Dataset): dataset to cache
+        capacity_mb (float, optional): memory cap of the buffer in MB. Defaults to 1024.
+
+    Examples:
+
+        dataset = SharedCacheDataset(LyftDataset.from_folder(...), capacity_mb=4096)
+        dataloader = DataLoader(dataset, batch_size=16, num_workers=4)
+        print(dataset.stats())
+    """
+
+    def __init__(self, dataset, capacity_mb: float = 1024):
+        super(SharedCacheDataset, self).__init__()
+        self.dataset = dataset
+
+        sample = dataset[0]
+        assert isinstance(sample, dict) and all(
+            torch.is_tensor(v) for v in sample.values()
+        ), "SharedCacheDataset only supports samples that are dicts of tensors"
+        self.layout: List[Tuple[str, torch.dtype, torch.Size, int, int]] = []
+        offset = 0
+        for key, value in sample.items():
+            nbytes = value.numel() * value.element_size()
+            self.layout.append((key, value.dtype, value.shape, offset, nbytes))
+            offset = _align(offset + nbytes)
+        self.slot_bytes = max(offset, 8)
+
+        self.num_slots = min(len(dataset), int(capacity_mb * 2 ** 20) // self.slot_bytes)
+        assert (
+            self.num_slots > 0
+        ), f"capacity_mb={capacity_mb} cannot hold one sample of {self.slot_bytes} bytes"
+
+        self.buffer = torch.empty(self.num_slots, self.slot_bytes, dtype=torch.uint8).share_memory_()
+        self.slot_of_idx = torch.full((len(dataset),), -1, dtype=torch.long).share_memory_()
+        self.idx_of_slot = torch.full((self.num_slots,), -1, dtype=torch.long).share_memory_()
+        self.referenced = torch.zeros(self.num_slots, dtype=torch.bool).share_memory_()
+        # clock hand, hits, misses, evictions
+        self.counters = torch.zeros(4, dtype=torch.long).share_memory_()
+        self.lock = mp.Lock()
+
+    def __len__(self) -> int:
+        return len(self.dataset)
+
+    def __getitem__(self, idx: int) -> Dict[str, torch.Tensor]:
+        with self.lock:
+            slot = int(self.slot_of_idx[idx])
+            if slot >= 0:
+                self.counters[1] += 1
+                self.referenced[slot] = True
+                return self._read(slot)
+            self.counters[2] += 1
+
+        # decode outside the lock so workers do not wait for each other
+        item = self.dataset[idx]
+        with self.lock:
+            if int(self.slot_of_idx[idx]) < 0:
+                self._write(self._evict(), idx, item)
+        return item
+
+    def _evict(self) -> int:
+        hand = int(self.counters[0])
+        while self.referenced[hand]:
+            self.referenced[hand] = False
+            hand = (hand + 1) % self.num_slots
+        self.counters[0] = (hand + 1) % self.num_slots
+
+        old_idx = int(self.idx_of_slot[hand])
+        if old_idx >= 0:
+            self.slot_of_idx[old_idx] = -1
+            self.counters[3] += 1
+        return hand
+
+    def _view(self, slot: int, dtype: torch.dtype, shape: torch.Size, offset: int, nbytes: int):
+        return self.buffer[slot, offset : offset + nbytes].view(dtype).view(shape)
+
+    def _write(self, slot: int, idx: int, item: Dict[str, torch.Tensor]) -> None:
+        for key, dtype, shape, offset, nbytes in self.layout:
+            self._view(slot, dtype, shape, offset, nbytes).copy_(item[key])
+        self.idx_of_slot[slot] = idx
+        self.slot_of_idx[idx] = slot
+        self.referenced[slot] = True
+
+    def _read(self, slot: int) -> Dict[str, torch.Tensor]:
+        return {
+            key: self._view(slot, dtype, shape, offset, nbytes).clone()
+            for key, dtype, shape, offset, nbytes in self.layout
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache counters summed over all workers since the last reset"""
+        hits, misses, evictions = (int(c) for c in self.counters[1:])
+        return {
+            "hits": hits,
+            "misses": misses,
+            "evictions": evictions,
+            "hit_rate": hits / max(1, hits + misses),
+            "cached": int((self.idx_of_slot >= 0).sum()),
+            "capacity": self.num_slots,
+        }
+
+    def reset_stats(self) -> None:
+        self.counters[1:] = 0
+
+    def summary(self) -> None:
+        s = self.stats()
+        print(
+            f"Cache hit rate: {s['hit_rate']:.4f} ({s['hits']} hits, {s['misses']} misses, "
+            f"{s['evictions']} evictions, {s['cached']}/{s['capacity']} slots used)"
+        )
+
+
+def find_cache(dataset) -> Any:
+    """Return the SharedCacheDataset under `dataset` (e.g. a random_split Subset), or None"""
+    while dataset is not None and not isinstance(dataset, SharedCacheDataset):
+        dataset = getattr(dataset, "dataset", None)
+    return dataset
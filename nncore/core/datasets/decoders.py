@@ -0,0 +1,110 @@
+"""Image decode backends for datasets
+
+Every backend reads an image file and returns a uint8 numpy array, H x W x C
+for color images and H x W for single channel ones. Float conversion is left
+to the normalize step of the dataset transforms.
+
+Select one from the dataset args in the pipeline YAML:
+
+    dataset:
+      name: LyftDataset.from_folder
+      args:
+        decoder: cv2
+"""
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+from . import DECODER_REGISTRY
+
+
+def decode_pil(path: str) -> np.ndarray:
+    """Decode with PIL (or a drop-in PIL-SIMD install)"""
+    with Image.open(path) as im:
+        return np.asarray(im)
+
+
+def decode_cv2(path: str) -> np.ndarray:
+    """Decode with OpenCV `IMREAD_UNCHANGED`, converted from BGR(A) to RGB(A)"""
+    import cv2
+
+    im = cv2.imread(str(path), cv2.IMREAD_UNCHANGED)
+    if im is None:
+        raise FileNotFoundError(f"{path} could not be decoded")
+    if im.ndim == 3 and im.shape[2] == 3:
+        im = cv2.cvtColor(im, cv2.COLOR_BGR2RGB)
+    elif im.ndim == 3 and im.shape[2] == 4:
+        im = cv2.cvtColor(im, cv2.COLOR_BGRA2RGBA)
+    return im
+
+
+def decode_torchvision(path: str) -> np.ndarray:
+    """Decode with `torchvision.io.decode_png`"""
+    from torchvision.io import decode_png, read_file
+
+    im = decode_png(read_file(str(path)))  # C x H x W
+    return im.permute(1, 2, 0).squeeze(-1).numpy()
+
+
+def decode_matplotlib(path: str) -> np.ndarray:
+    """Decode with `matplotlib.pyplot.imread`, kept as the reference path"""
+    import matplotlib.pyplot as plt
+
+    im = plt.imread(str(path))
+    if im.dtype != np.uint8:
+        im = (im * 255).round().astype(np.uint8)
+    return im
+
+
+DECODER_REGISTRY._do_register("pil", decode_pil)
+DECODER_REGISTRY._do_register("cv2", decode_cv2)
+DECODER_REGISTRY._do_register("torchvision", decode_torchvision)
+DECODER_REGISTRY._do_register("matplotlib", decode_matplotlib)
+
+
+def benchmark_decoders(
+    paths: List[str], decoders: Optional[List[str]] = None, repeat: int = 3
+) -> Dict[str, float]:
+    """Measure the mean decode time per image of each backend
+
+    Args:
+        paths (List[str]): image paths
+        decoders (Optional[List[str]], optional): backend names. Defaults to all registered.
+        repeat (int, optional): passes over `paths`, the best one is kept. Defaults to 3.
+
+    Returns:
+        Dict[str, float]: seconds per image for each backend
+    """
+    decoders = decoders or [name for name, _ in DECODER_REGISTRY]
+    result = {}
+    for name in decoders:
+        decode = DECODER_REGISTRY.get(name)
+        best = np.inf
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for path in paths:
+                decode(path)
+            best = min(best, time.perf_counter() - start)
+        result[name] = best / max(1, len(paths))
+    return result
+
+
+if __name__ == "__main__":
+
+    # python -m nncore.core.datasets.decoders ./data/images --extension png
+    import argparse
+    from pathlib import Path
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("folder", type=Path)
+    parser.add_argument("--extension", default="png")
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--decoders", nargs="+", default=None)
+
+    args = parser.parse_args()
+
+    paths = sorted(args.folder.glob(f"*.{args.extension}"))[: args.limit]
+    for name, seconds in benchmark_decoders(paths, args.decoders).items():
+        print(f"{name:>12}: {seconds * 1000:.3f} ms/image")
@@ -0,0 +1,29 @@
+import torch
+
+__all__ = ["IndexedDataset"]
+
+
+class IndexedDataset(torch.utils.data.Dataset):
+    r"""Adds the sample index to the dict samples of a map-style dataset
+
+    Batches then carry an `index` tensor, which keys per-sample data kept
+    outside the dataset, e.g. the cached teacher logits of `DistillationLearner`.
+
+    Args:
+        dataset (Dataset): dataset returning dicts
+        key (str, optional): name of the index field. Defaults to "index".
+    """
+
+    def __init__(self, dataset, key: str = "index"):
+        super(IndexedDataset, self).__init__()
+        assert not isinstance(dataset, torch.utils.data.IterableDataset), "IndexedDataset needs a map-style dataset"
+        self.dataset = dataset
+        self.key = key
+
+    def __getitem__(self, idx: int):
+        item = self.dataset[idx]
+        item[self.key] = idx
+        return item
+
+    def __len__(self) -> int:
+        return len(self.dataset)
@@ -0,0 +1,235 @@
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+__all__ = ["Manifest"]
+
+
+def scan_folder(folder: Path, extension: str) -> Dict[str, Tuple[int, int]]:
+    """Map file stem -> (size, mtime_ns) for every `*.extension` file in folder"""
+    suffix = f".{extension}"
+    entries = {}
+    with os.scandir(folder) as it:
+        for entry in it:
+            if not entry.name.endswith(suffix):
+                continue
+            stem = entry.name[: -len(suffix)]
+            if entry.is_file():
+                st = entry.stat()
+                entries[stem] = (st.st_size, st.st_mtime_ns)
+    return entries
+
+
+class Manifest:
+    r"""Manifest is a persistent, sorted index of image/mask pairs
+
+    The image and mask folders are scanned once, files are paired by stem and
+    the result is stored as a compact `.npz` table of stems, sizes and mtimes.
+    Datasets are then built from the table instead of globbing the folders on
+    every run, in a deterministic order.
+
+    Args:
+        root (str): data root
+        image_folder_name (str): image folder name
+        mask_folder_name (str): label folder name
+        extension (str): image file type extension
+        stems (np.ndarray): sorted stems of the paired files
+        sizes (np.ndarray): N x 2 file sizes (image, mask)
+        mtimes (np.ndarray): N x 2 file mtimes in ns (image, mask)
+        folder_mtimes (Tuple[int, int]): folder mtimes at scan time (image, mask)
+
+    Examples:
+
+        manifest = Manifest.scan('./data', 'images', 'masks', 'png')
+        manifest.save('./data/manifest.npz')
+
+        manifest = Manifest.load('./data/manifest.npz').refresh()
+        dataset = LyftDataset.from_manifest('./data/manifest.npz')
+    """
+
+    def __init__(
+        self,
+        root: str,
+        image_folder_name: str,
+        mask_folder_name: str,
+        extension: str,
+        stems: np.ndarray,
+        sizes: np.ndarray,
+        mtimes: np.ndarray,
+        folder_mtimes: Tuple[int, int] = (0, 0),
+    ):
+        self.root = Path(root)
+        self.image_folder_name = image_folder_name
+        self.mask_folder_name = mask_folder_name
+        self.extension = extension
+        self.stems = stems
+        self.sizes = sizes
+        self.mtimes = mtimes
+        self.folder_mtimes = tuple(folder_mtimes)
+
+    def __len__(self) -> int:
+        return len(self.stems)
+
+    @property
+    def image_folder(self) -> Path:
+        return self.root / self.image_folder_name
+
+    @property
+    def mask_folder(self) -> Path:
+        return self.root / self.mask_folder_name
+
+    def rgb_paths(self) -> List[str]:
+        return [f"{self.image_folder}/{s}.{self.extension}" for s in self.stems]
+
+    def mask_paths(self) -> List[str]:
+        return [f"{self.mask_folder}/{s}.{self.extension}" for s in self.stems]
+
+    def _folder_mtimes(self) -> Tuple[int, int]:
+        return (
+            os.stat(self.image_folder).st_mtime_ns,
+            os.stat(self.mask_folder).st_mtime_ns,
+        )
+
+    @classmethod
+    def scan(
+        cls,
+        root: str,
+        image_folder_name: str,
+        mask_folder_name: str,
+        extension: str = "png",
+    ) -> "Manifest":
+        """Scan the folders and pair images and masks by stem
+
+        Args:
+            root (str): data root
+            image_folder_name (str): image folder name
+            mask_folder_name (str): label folder name
+            extension (str, optional): image file type extension. Defaults to "png".
+
+        Returns:
+            Manifest: the new manifest
+        """
+        manifest = cls(
+            root,
+            image_folder_name,
+            mask_folder_name,
+            extension,
+            stems=np.array([], dtype=str),
+            sizes=np.zeros((0, 2), dtype=np.int64),
+            mtimes=np.zeros((0, 2), dtype=np.int64),
+        )
+        return manifest.refresh(full=True)
+
+    def refresh(self, full: bool = False) -> "Manifest":
+        """Bring the manifest up to date with the folders
+
+        Nothing is read when neither folder changed since the last scan. Otherwise
+        the folders are listed and every file is stat'ed again: pairs are added
+        and removed, and pairs whose size or mtime changed are reported. A file
+        rewritten in place leaves the folder mtime as it is, `full` finds it.
+
+        Args:
+            full (bool, optional): rescan even when the folder mtimes did not change. Defaults to False.
+
+        Returns:
+            Manifest: self
+        """
+        folder_mtimes = self._folder_mtimes()
+        if not full and folder_mtimes == self.folder_mtimes:
+            return self
+
+        images = scan_folder(self.image_folder, self.extension)
+        masks = scan_folder(self.mask_folder, self.extension)
+        stems = sorted(images.keys() & masks.keys())
+        unpaired = len(images) + len(masks) - 2 * len(stems)
+        if unpaired:
+            print(f"{unpaired} files without a matching image/mask are left out")
+        previous = {
+            stem: (tuple(size), tuple(mtime)) for stem, size, mtime in zip(self.stems, self.sizes, self.mtimes)
+        }
+        changed = [
+            s
+            for s in stems
+            if s in previous and previous[s] != ((images[s][0], masks[s][0]), (images[s][1], masks[s][1]))
+        ]
+        if changed:
+            print(f"{len(changed)} pairs changed since the last scan, e.g. {changed[0]}")
+
+        self.stems = np.array(stems, dtype=str)
+        self.sizes = np.array(
+            [(images[s][0], masks[s][0]) for s in stems], dtype=np.int64
+        ).reshape(-1, 2)
+        self.mtimes = np.array(
+            [(images[s][1], masks[s][1]) for s in stems], dtype=np.int64
+        ).reshape(-1, 2)
+        self.folder_mtimes = folder_mtimes
+        return self
+
+    def save(self, path: str) -> None:
+        meta = {
+            "root": str(self.root),
+            "image_folder_name": self.image_folder_name,
+            "mask_folder_name": self.mask_folder_name,
+            "extension": self.extension,
+            "folder_mtimes": list(self.folder_mtimes),
+        }
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                meta=np.array(json.dumps(meta)),
+                stems=self.stems,
+                sizes=self.sizes,
+                mtimes=self.mtimes,
+            )
+
+    @classmethod
+    def load(cls, path: str, root: Optional[str] = None) -> "Manifest":
+        """Load a saved manifest
+
+        Args:
+            path (str): manifest file
+            root (Optional[str], optional): override the stored data root, e.g. after moving the data. Defaults to None.
+
+        Returns:
+            Manifest: the loaded manifest
+        """
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            return cls(
+                root or meta["root"],
+                meta["image_folder_name"],
+                meta["mask_folder_name"],
+                meta["extension"],
+                stems=data["stems"],
+                sizes=data["sizes"],
+                mtimes=data["mtimes"],
+                folder_mtimes=meta["folder_mtimes"],
+            )
+
+
+if __name__ == "__main__":
+
+    # python -m nncore.core.datasets.manifest ./data images masks ./data/manifest.npz
+    import argparse
+
+    parser = argparse.ArgumentParser("Build or refresh an image/mask manifest")
+    parser.add_argument("root")
+    parser.add_argument("image_folder_name")
+    parser.add_argument("mask_folder_name")
+    parser.add_argument("output")
+    parser.add_argument("--extension", default="png")
+    parser.add_argument("--full", action="store_true", help="rescan every file")
+
+    args = parser.parse_args()
+
+    if Path(args.output).exists() and not args.full:
+        manifest = Manifest.load(args.output).refresh()
+    else:
+        manifest = Manifest.scan(
+            args.root, args.image_folder_name, args.mask_folder_name, args.extension
+        )
+    manifest.save(args.output)
+    print(f"{len(manifest)} pairs written to {args.output}")
@@ -0,0 +1,36 @@
+from typing import Any, Dict, List, Optional, Sequence
+
+__all__ = ["IMAGENET_MEAN", "IMAGENET_STD", "normalization", "input_normalization"]
+
+# A.Normalize defaults
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+
+def normalization(mean: Sequence[float], std: Sequence[float]) -> Dict[str, List[float]]:
+    """Mean and std applied to images scaled to [0, 1], as saved in `config.yaml`"""
+    return {"mean": [float(m) for m in mean], "std": [float(s) for s in std]}
+
+
+def input_normalization(dataset: Any, batch_transform: Any = None) -> Optional[Dict[str, List[float]]]:
+    """Normalization of the inputs a model is trained on
+
+    Datasets and batch transforms describe what they apply in a
+    `normalization` attribute. A normalizing batch transform wins over the
+    dataset, wrappers such as `Subset` or `IndexedDataset` are looked through.
+
+    Args:
+        dataset (Any): dataset, possibly wrapped
+        batch_transform (Any, optional): `BatchCompose` applied after the dataset. Defaults to None.
+
+    Returns:
+        Optional[Dict[str, List[float]]]: mean and std, None when unknown
+    """
+    for t in reversed(list(getattr(batch_transform, "transforms", []))):
+        if getattr(t, "normalization", None) is not None:
+            return t.normalization
+    while dataset is not None:
+        if hasattr(dataset, "normalization"):
+            return dataset.normalization
+        dataset = getattr(dataset, "dataset", None)
+    return None
@@ -0,0 +1,54 @@
+from typing import Any, Dict, Iterator, Sized
+
+import torch
+from torch.utils.data import Sampler
+
+__all__ = ["ResumableSampler"]
+
+
+class ResumableSampler(Sampler):
+    r"""ResumableSampler yields a deterministic, resumable order of indices
+
+    The order of an epoch only depends on `seed` and the epoch number, so a
+    resumed run sees the same order as the interrupted one. `set_epoch` can
+    start the epoch at any position, skipping the indices already consumed
+    without loading them.
+
+    Args:
+        data_source (Sized): dataset to sample from
+        shuffle (bool, optional): random permutation instead of sequential order. Defaults to True.
+        seed (int, optional): base seed of the permutations. Defaults to 0.
+    """
+
+    def __init__(self, data_source: Sized, shuffle: bool = True, seed: int = 0):
+        self.data_source = data_source
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+        self.start_index = 0
+
+    def set_epoch(self, epoch: int, start_index: int = 0) -> None:
+        """Select the epoch order and the position to start the next iteration from"""
+        self.epoch = epoch
+        self.start_index = start_index
+
+    def __iter__(self) -> Iterator[int]:
+        n = len(self.data_source)
+        if self.shuffle:
+            g = torch.Generator()
+            g.manual_seed(self.seed + self.epoch)
+            order = torch.randperm(n, generator=g).tolist()
+        else:
+            order = list(range(n))
+        start, self.start_index = self.start_index, 0
+        return iter(order[start:])
+
+    def __len__(self) -> int:
+        return len(self.data_source) - self.start_index
+
+    def state_dict(self) -> Dict[str, Any]:
+        return {"seed": self.seed, "epoch": self.epoch, "start_index": self.start_index}
+
+    def load_state_dict(self, state: Dict[str, Any]) -> None:
+        self.seed = state["seed"]
+        self.set_epoch(state["epoch"], state["start_index"])
@@ -0,0 +1,2 @@
+from .tiling import SlidingWindowInference, blend_window, tile_starts
+from .tta import FLIPS, TestTimeAugmentation
@@ -0,0 +1,275 @@
+"""Process pool of model replicas for CPU inference
+
+One process with the default torch thread pool stops scaling long before a
+many-core node is busy. `InferencePool` runs `replicas` processes instead,
+each with its own model and `threads` intra-op threads, optionally pinned to
+its own cores. Inputs are sent in chunks through a shared queue, so faster
+replicas take more work, and `map` yields the outputs in input order.
+
+`benchmark_pool` times every replicas x threads split that fits the cores:
+
+    python -m nncore.core.inference.pool runs/<run>/checkpoints --image-size 224 224 --num-inputs 256
+"""
+import argparse
+import importlib
+import multiprocessing as mp
+import os
+import queue
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# a picklable callable building the model in the worker, returning a function
+# from a list of inputs to the list of their outputs
+Factory = Callable[[], Callable[[List[Any]], List[Any]]]
+
+
+def available_cores() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+@contextmanager
+def _environ(**values: str):
+    saved = {k: os.environ.get(k) for k in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+def _worker(
+    rank: int,
+    factory: Factory,
+    threads: int,
+    interop_threads: int,
+    cores: Optional[List[int]],
+    imports: Sequence[str],
+    tasks,
+    results,
+) -> None:
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    import torch
+
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(interop_threads)
+    try:
+        for module in imports:
+            importlib.import_module(module)
+        predict = factory()
+    except Exception as e:
+        results.put(("error", rank, repr(e)))
+        return
+    results.put(("ready", rank, None))
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        index, items = task
+        try:
+            results.put(("done", index, predict(items)))
+        except Exception as e:
+            results.put(("error", index, repr(e)))
+
+
+class InferencePool:
+    r"""Model replicas in worker processes
+
+    Args:
+        factory (Factory): picklable callable run once per worker, returns the batch predict function
+        replicas (int, optional): worker processes. Defaults to 2.
+        threads (Optional[int], optional): intra-op threads per replica, the cores split evenly if None. Defaults to None.
+        interop_threads (int, optional): inter-op threads per replica. Defaults to 1.
+        affinity (bool, optional): pin every replica to its own `threads` cores. Defaults to False.
+        chunk_size (int, optional): inputs per predict call. Defaults to 1.
+        max_pending (Optional[int], optional): chunks in flight, bounds the memory of streamed inputs. Defaults to 4 per replica.
+        imports (Sequence[str], optional): modules imported in the workers first, e.g. ones registering models. Defaults to ().
+    """
+
+    def __init__(
+        self,
+        factory: Factory,
+        replicas: int = 2,
+        threads: Optional[int] = None,
+        interop_threads: int = 1,
+        affinity: bool = False,
+        chunk_size: int = 1,
+        max_pending: Optional[int] = None,
+        imports: Sequence[str] = (),
+    ):
+        cores = available_cores()
+        self.replicas = replicas
+        self.threads = threads or max(len(cores) // replicas, 1)
+        self.chunk_size = chunk_size
+        self.max_pending = max_pending or 4 * replicas
+        ctx = mp.get_context("spawn")
+        self.tasks = ctx.Queue()
+        self.generation = 0
+        self.results = ctx.Queue()
+        self.processes = []
+        for rank in range(replicas):
+            pinned = None
+            if affinity:
+                start = rank * self.threads
+                pinned = [cores[(start + i) % len(cores)] for i in range(self.threads)]
+            process = ctx.Process(
+                target=_worker,
+                args=(rank, factory, self.threads, interop_threads, pinned, tuple(imports), self.tasks, self.results),
+                daemon=True,
+            )
+            # the child inherits them, so OpenMP sizes its pool before torch is imported
+            with _environ(OMP_NUM_THREADS=str(self.threads), MKL_NUM_THREADS=str(self.threads)):
+                process.start()
+            self.processes.append(process)
+        for _ in range(replicas):
+            kind, rank, error = self._get()
+            if kind == "error":
+                self.close()
+                raise RuntimeError(f"Replica {rank} failed to start: {error}")
+
+    def _get(self) -> Tuple[str, int, Any]:
+        while True:
+            try:
+                return self.results.get(timeout=1.0)
+            except queue.Empty:
+                dead = [p.exitcode for p in self.processes if not p.is_alive()]
+                if dead:
+                    raise RuntimeError(f"Inference worker exited with code {dead[0]}")
+
+    def map(self, inputs: Iterable[Any]) -> Iterator[Any]:
+        """Outputs of `inputs` (a list or a stream) in order, one per input"""
+        # tasks are tagged with the call, results left over by an abandoned map() are dropped
+        self.generation += 1
+        generation = self.generation
+        iterator = iter(inputs)
+        done: Dict[int, List[Any]] = {}
+        sent, received, next_index = 0, 0, 0
+        exhausted = False
+        while True:
+            while not exhausted and sent - received < self.max_pending:
+                chunk = [item for _, item in zip(range(self.chunk_size), iterator)]
+                if not chunk:
+                    exhausted = True
+                    break
+                self.tasks.put(((generation, sent), chunk))
+                sent += 1
+            if received == sent:
+                return
+            kind, (task_generation, index), outputs = self._get()
+            if task_generation != generation:
+                continue
+            if kind == "error":
+                raise RuntimeError(f"Inference failed on chunk {index}: {outputs}")
+            received += 1
+            done[index] = outputs
+            while next_index in done:
+                yield from done.pop(next_index)
+                next_index += 1
+
+    def close(self) -> None:
+        for process in self.processes:
+            if process.is_alive():
+                self.tasks.put(None)
+        for process in self.processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def splits(cores: int) -> List[Tuple[int, int]]:
+    """(replicas, threads) pairs fitting in `cores`, threads a power of two or all cores"""
+    out = []
+    threads = 1
+    while threads <= cores:
+        out.append((cores // threads, threads))
+        threads *= 2
+    if out[-1][1] != cores:
+        out.append((1, cores))
+    return out
+
+
+def benchmark_pool(
+    factory: Factory,
+    inputs: Sequence[Any],
+    configs: Optional[Sequence[Tuple[int, int]]] = None,
+    affinity: bool = False,
+    chunk_size: int = 1,
+    imports: Sequence[str] = (),
+) -> List[Dict[str, Any]]:
+    r"""Throughput of every replicas x threads split on `inputs`
+
+    Args:
+        factory (Factory): see `InferencePool`
+        inputs (Sequence[Any]): benchmark inputs, one warm-up pass is run first
+        configs (Optional[Sequence[Tuple[int, int]]], optional): (replicas, threads) to try, `splits` of the cores if None. Defaults to None.
+        affinity (bool, optional): pin replicas to cores. Defaults to False.
+        chunk_size (int, optional): inputs per predict call. Defaults to 1.
+        imports (Sequence[str], optional): modules imported in the workers. Defaults to ().
+
+    Returns:
+        List[Dict[str, Any]]: one row per split, fastest first
+    """
+    rows = []
+    for replicas, threads in configs or splits(len(available_cores())):
+        with InferencePool(
+            factory, replicas, threads, affinity=affinity, chunk_size=chunk_size, imports=imports
+        ) as pool:
+            # warm-up, every replica sees some inputs
+            for _ in pool.map(inputs[: max(replicas * chunk_size * 2, 1)]):
+                pass
+            start = time.perf_counter()
+            for _ in pool.map(inputs):
+                pass
+            seconds = time.perf_counter() - start
+        row = {
+            "replicas": replicas,
+            "threads": threads,
+            "items_per_sec": len(inputs) / seconds,
+            "seconds": seconds,
+        }
+        rows.append(row)
+        print(f"{replicas:>3} x {threads:<3} {row['items_per_sec']:10.2f} items/s")
+    return sorted(rows, key=lambda r: -r["items_per_sec"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find the fastest replicas x threads split of a segmentation checkpoint")
+    parser.add_argument("checkpoint_dir", help="folder with config.yaml and the checkpoints")
+    parser.add_argument("--checkpoint", default="best_loss.pth")
+    parser.add_argument("--image-size", type=int, nargs=2, default=[224, 224], help="H W of the random inputs")
+    parser.add_argument("--num-inputs", type=int, default=128)
+    parser.add_argument("--chunk-size", type=int, default=1, help="inputs per forward call")
+    parser.add_argument("--configs", nargs="*", default=[], help="replicas x threads to try, e.g. 1x8 2x4 8x1")
+    parser.add_argument("--affinity", action="store_true", help="pin replicas to cores")
+    parser.add_argument("--imports", nargs="*", default=[], help="modules registering custom models")
+    args = parser.parse_args()
+
+    from functools import partial
+
+    import numpy as np
+    from nncore.segmentation.inference import SegmentationPredictor
+
+    rng = np.random.default_rng(0)
+    images = [
+        rng.integers(0, 256, (*args.image_size, 3), dtype=np.uint8) for _ in range(args.num_inputs)
+    ]
+    factory = partial(SegmentationPredictor.from_checkpoint, args.checkpoint_dir, args.checkpoint)
+    configs = [tuple(int(v) for v in c.lower().split("x")) for c in args.configs] or None
+    print(f"{len(available_cores())} cores, {args.num_inputs} inputs of {args.image_size[0]}x{args.image_size[1]}")
+    rows = benchmark_pool(factory, images, configs, args.affinity, args.chunk_size, args.imports)
+    best = rows[0]
+    print(f"best: {best['replicas']} replicas x {best['threads']} threads, {best['items_per_sec']:.2f} items/s")
@@ -0,0 +1,251 @@
+"""Streaming inference on videos and ordered frame directories
+
+Frames are decoded by a background thread into a bounded queue, so decoding
+overlaps with the model, and consecutive frames are predicted in batches.
+
+With a keyframe threshold, a frame that barely differs from the last
+predicted frame (mean absolute difference of a subsampled copy, in [0, 1])
+reuses its prediction instead of running the model. It is compared with the
+last keyframe rather than the previous frame, so slow drifts still trigger a
+new prediction, and `max_reuse` bounds how long a prediction is kept:
+
+    python -m nncore.core.inference.stream runs/<run>/checkpoints drive.mp4 --image-size 224 224 --keyframe-threshold 0.02
+"""
+import argparse
+import queue
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+VIDEO_SUFFIXES = (".mp4", ".avi", ".mov", ".mkv", ".webm", ".m4v")
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+
+def _natural_key(path: Path):
+    return [int(t) if t.isdigit() else t for t in re.split(r"(\d+)", path.name)]
+
+
+def _rgb(image: np.ndarray) -> np.ndarray:
+    if image.ndim == 2:
+        return np.repeat(image[..., None], 3, axis=2)
+    return image[..., :3]
+
+
+def read_frames(source, decoder: str = "pil") -> Iterator[np.ndarray]:
+    """uint8 H x W x 3 RGB frames of a video file or of the images of a directory in natural order
+
+    Args:
+        source: video file or frame directory
+        decoder (str, optional): `DECODER_REGISTRY` backend for frame directories. Defaults to "pil".
+    """
+    source = Path(source)
+    if source.is_dir():
+        from nncore.core.datasets import DECODER_REGISTRY
+
+        decode = DECODER_REGISTRY.get(decoder)
+        paths = sorted(
+            (p for p in source.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES), key=_natural_key
+        )
+        for path in paths:
+            yield _rgb(decode(path))
+        return
+    if source.suffix.lower() not in VIDEO_SUFFIXES:
+        raise ValueError(f"{source} is neither a directory nor a video ({', '.join(VIDEO_SUFFIXES)})")
+    import cv2
+
+    capture = cv2.VideoCapture(str(source))
+    if not capture.isOpened():
+        raise FileNotFoundError(f"{source} could not be opened")
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    finally:
+        capture.release()
+
+
+def prefetch(iterable: Iterable[Any], depth: int = 8) -> Iterator[Any]:
+    """Items of `iterable` produced by a background thread, at most `depth` ahead"""
+    items: "queue.Queue[Tuple[str, Any]]" = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(message: Tuple[str, Any]) -> bool:
+        # gives up once the consumer is gone, a blocking put would hang on a full queue
+        while not stop.is_set():
+            try:
+                items.put(message, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(("item", item)):
+                    return
+            put(("end", None))
+        except Exception as e:
+            put(("error", e))
+
+    thread = threading.Thread(target=produce, name="prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            kind, item = items.get()
+            if kind == "end":
+                return
+            if kind == "error":
+                raise item
+            yield item
+    finally:
+        # the consumer may stop early, release a producer blocked on a full queue
+        stop.set()
+
+
+def frame_difference(a: np.ndarray, b: np.ndarray, stride: int = 4) -> float:
+    """Mean absolute difference of two uint8 frames in [0, 1], every `stride` pixel"""
+    if a.shape != b.shape:
+        return 1.0
+    a = a[::stride, ::stride].astype(np.int16)
+    b = b[::stride, ::stride].astype(np.int16)
+    return float(np.abs(a - b).mean()) / 255
+
+
+class StreamPredictor:
+    r"""Predicts a frame stream in batches of consecutive frames
+
+    Args:
+        predict_batch (Callable[[List[np.ndarray]], List[Any]]): one output per frame, e.g. `SegmentationPredictor`
+        batch_size (int, optional): consecutive frames per predict call, only their keyframes are predicted. Defaults to 4.
+        keyframe_threshold (Optional[float], optional): reuse the last prediction while the frame differs less from its keyframe, every frame is predicted if None. Defaults to None.
+        max_reuse (int, optional): consecutive frames reusing one prediction. Defaults to 30.
+        prefetch_depth (int, optional): frames decoded ahead, 0 decodes in the calling thread. Defaults to 8.
+        stride (int, optional): pixel stride of `frame_difference`. Defaults to 4.
+    """
+
+    def __init__(
+        self,
+        predict_batch: Callable[[List[np.ndarray]], List[Any]],
+        batch_size: int = 4,
+        keyframe_threshold: Optional[float] = None,
+        max_reuse: int = 30,
+        prefetch_depth: int = 8,
+        stride: int = 4,
+    ):
+        assert batch_size >= 1
+        self.predict_batch = predict_batch
+        self.batch_size = batch_size
+        self.keyframe_threshold = keyframe_threshold
+        self.max_reuse = max_reuse
+        self.prefetch_depth = prefetch_depth
+        self.stride = stride
+        self.counts = {"frames": 0, "keyframes": 0, "batches": 0}
+        self.predict_time, self.total_time = 0.0, 0.0
+
+    def __call__(self, frames: Iterable[np.ndarray]) -> Iterator[Tuple[int, np.ndarray, Any, bool]]:
+        """(frame index, frame, output, whether the model ran on the frame) in stream order"""
+        start = time.perf_counter()
+        if self.prefetch_depth > 0:
+            frames = prefetch(frames, self.prefetch_depth)
+        # (index, frame, position of its keyframe in `keyframes`, -1 for the previous batch)
+        pending: List[Tuple[int, np.ndarray, int]] = []
+        keyframes: List[np.ndarray] = []
+        last_key, last_output, reused = None, None, 0
+
+        def flush():
+            nonlocal last_output
+            outputs = []
+            if keyframes:
+                t = time.perf_counter()
+                outputs = self.predict_batch(keyframes)
+                self.predict_time += time.perf_counter() - t
+                self.counts["batches"] += 1
+            for index, frame, slot in pending:
+                is_key = slot >= 0 and keyframes[slot] is frame
+                yield index, frame, outputs[slot] if slot >= 0 else last_output, is_key
+            if outputs:
+                last_output = outputs[-1]
+            pending.clear()
+            keyframes.clear()
+
+        for index, frame in enumerate(frames):
+            self.counts["frames"] += 1
+            if (
+                self.keyframe_threshold is not None
+                and last_key is not None
+                and reused < self.max_reuse
+                and frame_difference(frame, last_key, self.stride) < self.keyframe_threshold
+            ):
+                reused += 1
+            else:
+                keyframes.append(frame)
+                last_key, reused = frame, 0
+                self.counts["keyframes"] += 1
+            pending.append((index, frame, len(keyframes) - 1))
+            if len(pending) == self.batch_size:
+                yield from flush()
+        yield from flush()
+        self.total_time += time.perf_counter() - start
+
+    def stats(self) -> Dict[str, float]:
+        frames = self.counts["frames"]
+        return {
+            **self.counts,
+            "reused": frames - self.counts["keyframes"],
+            "fps": frames / self.total_time if self.total_time else 0.0,
+            "predict_s": self.predict_time,
+            "total_s": self.total_time,
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Predict the frames of a video or a frame directory")
+    parser.add_argument("checkpoint_dir", help="folder with config.yaml and the checkpoints")
+    parser.add_argument("source", help="video file or frame directory")
+    parser.add_argument("--checkpoint", default="best_loss.pth")
+    parser.add_argument("--output-dir", help="save colored masks here")
+    parser.add_argument("--image-size", type=int, nargs=2, help="H W the frames are resized to, native resolution if not set")
+    parser.add_argument("--batch-size", type=int, default=4, help="consecutive frames per forward call")
+    parser.add_argument("--keyframe-threshold", type=float, help="reuse the last prediction below this frame difference, e.g. 0.02")
+    parser.add_argument("--max-reuse", type=int, default=30, help="frames one prediction is reused for at most")
+    parser.add_argument("--decoder", default="pil", help="decoder of frame directories")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--imports", nargs="*", default=[], help="modules registering custom models")
+    args = parser.parse_args()
+
+    import importlib
+
+    for module in args.imports:
+        importlib.import_module(module)
+    from nncore.segmentation.inference import SegmentationPredictor
+    from nncore.segmentation.utils import color_map
+    from PIL import Image
+
+    predictor = SegmentationPredictor.from_checkpoint(
+        args.checkpoint_dir, args.checkpoint, device=args.device, image_size=args.image_size
+    )
+    stream = StreamPredictor(
+        predictor,
+        batch_size=args.batch_size,
+        keyframe_threshold=args.keyframe_threshold,
+        max_reuse=args.max_reuse,
+    )
+    output_dir = Path(args.output_dir) if args.output_dir else None
+    if output_dir is not None:
+        output_dir.mkdir(parents=True, exist_ok=True)
+    cmap = color_map()
+    for index, frame, mask, _ in stream(read_frames(args.source, args.decoder)):
+        if output_dir is not None:
+            Image.fromarray(cmap[mask].astype(np.uint8)).save(output_dir / f"{index:06d}.png")
+    stats = stream.stats()
+    print(
+        f"{stats['frames']} frames, {stats['keyframes']} predicted, {stats['reused']} reused, "
+        f"{stats['fps']:.1f} fps ({stats['predict_s']:.2f}s in the model, {stats['total_s']:.2f}s total)"
+    )
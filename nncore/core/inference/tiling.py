@@ -0,0 +1,143 @@
+"""Sliding-window inference for frames larger than the training resolution
+
+The frame is covered by overlapping tiles, the tiles of a whole batch of
+frames are run through the model `batch_size` at a time, and the logits are
+blended back with a window that down-weights tile borders. Tile size, overlap
+and batch size trade memory for throughput; `output_device="cpu"` keeps the
+full resolution logits off the accelerator.
+"""
+from typing import Iterator, List, Optional, Tuple, Union
+
+import torch
+import torch.nn.functional as F
+from torch import Tensor, nn
+
+__all__ = ["SlidingWindowInference", "blend_window", "tile_starts"]
+
+
+def tile_starts(size: int, tile: int, stride: int) -> List[int]:
+    """Start offsets covering `size`, the last tile is aligned to the end"""
+    if size <= tile:
+        return [0]
+    starts = list(range(0, size - tile, stride))
+    return starts + [size - tile]
+
+
+def blend_window(
+    height: int, width: int, kind: str = "gaussian", device=None
+) -> Tensor:
+    r"""Weights of a tile when blending overlapping predictions
+
+    Args:
+        height (int): tile height
+        width (int): tile width
+        kind (str, optional): "gaussian", "triangle" or "uniform". Defaults to "gaussian".
+        device (optional): device of the window. Defaults to None.
+
+    Returns:
+        Tensor: H x W weights, strictly positive
+    """
+
+    def profile(n: int) -> Tensor:
+        x = torch.linspace(-1, 1, n, device=device)
+        if kind == "gaussian":
+            # sigma of 1/4 of the tile, like nnU-Net
+            return torch.exp(-0.5 * (x / 0.5) ** 2)
+        if kind == "triangle":
+            return 1 - x.abs()
+        if kind == "uniform":
+            return torch.ones(n, device=device)
+        raise ValueError(f"Unknown blend window {kind}")
+
+    window = profile(height)[:, None] * profile(width)[None, :]
+    return window.clamp_min(1e-3)
+
+
+class SlidingWindowInference:
+    r"""Tiled inference wrapper of a segmentation model
+
+    Args:
+        model (nn.Module): model taking B x C x h x w inputs, returning logits or a dict with them
+        tile_size (Union[int, Tuple[int, int]], optional): tile height and width. Defaults to 512.
+        overlap (float, optional): fraction of a tile shared with its neighbour. Defaults to 0.25.
+        batch_size (int, optional): tiles per forward call. Defaults to 8.
+        window (str, optional): blend window, see `blend_window`. Defaults to "gaussian".
+        output_key (str, optional): logits key of dict outputs. Defaults to "out".
+        output_device (optional): device of the blended logits, the input device if None. Defaults to None.
+
+    Example:
+
+        tiled = SlidingWindowInference(model, tile_size=512, overlap=0.25, batch_size=8)
+        logits = tiled(images)  # B x K x H x W at the input resolution
+    """
+
+    def __init__(
+        self,
+        model: nn.Module,
+        tile_size: Union[int, Tuple[int, int]] = 512,
+        overlap: float = 0.25,
+        batch_size: int = 8,
+        window: str = "gaussian",
+        output_key: str = "out",
+        output_device=None,
+    ):
+        assert 0 <= overlap < 1, "overlap should be in [0, 1)"
+        self.model = model
+        self.tile_size = (tile_size, tile_size) if isinstance(tile_size, int) else tuple(tile_size)
+        self.overlap = overlap
+        self.batch_size = batch_size
+        self.window = window
+        self.output_key = output_key
+        self.output_device = output_device
+
+    def tiles(self, height: int, width: int) -> Iterator[Tuple[int, int]]:
+        th, tw = self.tile_size
+        sh = max(1, int(th * (1 - self.overlap)))
+        sw = max(1, int(tw * (1 - self.overlap)))
+        for y in tile_starts(height, th, sh):
+            for x in tile_starts(width, tw, sw):
+                yield y, x
+
+    def forward_tiles(self, tiles: Tensor) -> Tensor:
+        out = self.model(tiles)
+        if isinstance(out, dict):
+            out = out[self.output_key]
+        if out.shape[-2:] != tiles.shape[-2:]:
+            out = F.interpolate(out, size=tiles.shape[-2:], mode="bilinear", align_corners=False)
+        return out
+
+    @torch.no_grad()
+    def __call__(self, images: Tensor) -> Tensor:
+        """B x C x H x W images to B x K x H x W logits"""
+        b, _, height, width = images.shape
+        th, tw = self.tile_size
+        # frames smaller than a tile are padded, the padding is cropped from the output
+        pad_h, pad_w = max(0, th - height), max(0, tw - width)
+        if pad_h or pad_w:
+            mode = "reflect" if pad_h < height and pad_w < width else "constant"
+            images = F.pad(images, (0, pad_w, 0, pad_h), mode=mode)
+        ph, pw = images.shape[-2:]
+
+        device = self.output_device or images.device
+        window = blend_window(th, tw, self.window, device=device)
+        positions = [(i, y, x) for i in range(b) for y, x in self.tiles(ph, pw)]
+        logits: Optional[Tensor] = None
+        weights = torch.zeros(1, 1, ph, pw, device=device)
+        for i, y, x in positions[: len(positions) // b]:
+            weights[..., y : y + th, x : x + tw] += window
+
+        for start in range(0, len(positions), self.batch_size):
+            chunk = positions[start : start + self.batch_size]
+            tiles = torch.stack([images[i, :, y : y + th, x : x + tw] for i, y, x in chunk])
+            out = self.forward_tiles(tiles).to(device=device, dtype=torch.float32)
+            if logits is None:
+                logits = torch.zeros(b, out.shape[1], ph, pw, device=device)
+            for (i, y, x), o in zip(chunk, out):
+                logits[i, :, y : y + th, x : x + tw] += o * window
+
+        logits /= weights
+        return logits[..., :height, :width]
+
+    def num_tiles(self, height: int, width: int) -> int:
+        """Tiles per frame, `math.ceil(num_tiles / batch_size)` forward calls per frame"""
+        return sum(1 for _ in self.tiles(max(height, self.tile_size[0]), max(width, self.tile_size[1])))
@@ -0,0 +1,90 @@
+"""Test-time augmentation
+
+Flipped views of a batch are stacked into one larger batch, so every scale
+costs a single forward call, and the logits are mapped back and merged on
+the device. Views of different scales have different sizes and get one call
+per scale.
+
+Declared in the pipeline YAML:
+
+    tta:
+      flips: [none, hflip] # none, hflip, vflip, hvflip
+      scales: [1.0, 1.25]
+      merge: mean # mean or max of the logits
+"""
+from typing import Dict, Sequence
+
+import torch
+import torch.nn.functional as F
+from torch import Tensor, nn
+
+__all__ = ["TestTimeAugmentation", "FLIPS"]
+
+# spatial dims flipped by every view
+FLIPS: Dict[str, Sequence[int]] = {
+    "none": (),
+    "hflip": (-1,),
+    "vflip": (-2,),
+    "hvflip": (-2, -1),
+}
+
+
+class TestTimeAugmentation(nn.Module):
+    r"""Wraps a segmentation model to predict the merged logits of augmented views
+
+    Args:
+        model (nn.Module): model returning logits or a dict with them
+        flips (Sequence[str], optional): views per scale, keys of `FLIPS`. Defaults to ("none", "hflip").
+        scales (Sequence[float], optional): input scales. Defaults to (1.0,).
+        merge (str, optional): "mean" or "max" of the view logits. Defaults to "mean".
+        output_key (str, optional): logits key of dict outputs. Defaults to "out".
+    """
+
+    def __init__(
+        self,
+        model: nn.Module,
+        flips: Sequence[str] = ("none", "hflip"),
+        scales: Sequence[float] = (1.0,),
+        merge: str = "mean",
+        output_key: str = "out",
+    ):
+        super().__init__()
+        for flip in flips:
+            assert flip in FLIPS, f"Unknown flip {flip}, use one of {list(FLIPS)}"
+        assert merge in ("mean", "max"), f"Unknown merge {merge}"
+        self.model = model
+        self.flips = list(flips)
+        self.scales = list(scales)
+        self.merge = merge
+        self.output_key = output_key
+
+    @property
+    def num_views(self) -> int:
+        return len(self.flips) * len(self.scales)
+
+    def forward(self, x: Tensor) -> Dict[str, Tensor]:
+        b = x.shape[0]
+        size = x.shape[-2:]
+        merged = None
+        for scale in self.scales:
+            xs = x if scale == 1.0 else F.interpolate(
+                x, scale_factor=scale, mode="bilinear", align_corners=False
+            )
+            # all flips of a scale in one forward call
+            views = torch.cat([xs.flip(FLIPS[f]) if FLIPS[f] else xs for f in self.flips])
+            out = self.model(views)
+            out = out[self.output_key] if isinstance(out, dict) else out
+            if out.shape[-2:] != size:
+                out = F.interpolate(out, size=size, mode="bilinear", align_corners=False)
+            for k, f in enumerate(self.flips):
+                view = out[k * b : (k + 1) * b]
+                view = view.flip(FLIPS[f]) if FLIPS[f] else view
+                if merged is None:
+                    merged = view.float().clone()
+                elif self.merge == "mean":
+                    merged += view
+                else:
+                    merged = torch.maximum(merged, view)
+        if self.merge == "mean":
+            merged /= self.num_views
+        return {self.output_key: merged}
@@ -1,5 +1,15 @@
-from nncore.core.registry import Registry
+from nncore.core.registry import Registry, lazy_import
 LEARNER_REGISTRY = Registry('LEARNER')
 
-from .baselearner import BaseLearner
-from .supervisedlearner import SupervisedLearner
+# learners pull in tensorboard, they are imported on first use
+LEARNER_REGISTRY.register_lazy("SupervisedLearner", "nncore.core.learner.supervisedlearner")
+
+__getattr__ = lazy_import(
+    __name__,
+    {
+        "EarlyStopping": ".stopping",
+        "TrainingBudget": ".stopping",
+        "BaseLearner": ".baselearner",
+        "SupervisedLearner": ".supervisedlearner",
+    },
+)
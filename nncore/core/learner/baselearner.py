@@ -1,17 +1,24 @@
+import logging
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, Optional
 
 import numpy as np
 import torch
+from nncore.core.datasets import ResumableSampler
 from nncore.core.logger import TensorboardLogger
 from nncore.core.metrics import Metric
-from nncore.utils.device import detach, move_to
-from nncore.utils.meter import AverageValueMeter
+from nncore.core.models import ModelEMA
+from nncore.core.models.wrapper import ModelWithLoss
+from nncore.core.schedulers import LRScheduler
+from nncore.utils.device import DevicePrefetcher, detach
+from nncore.utils.utils import get_rng_state, save_model, set_rng_state
 from torch.cuda.amp import GradScaler, autocast
 from torch.nn import Module
 from torch.utils.data import DataLoader
 from tqdm.auto import tqdm as tqdm
 
+from .stopping import EarlyStopping, TrainingBudget
+
 
 class BaseLearner:
     r"""BaseLearner class 
@@ -25,11 +32,12 @@ class BaseLearner:
         val_data (DataLoader): validation dataloader
         device (torch.device): training device
         model (Module): model to optimize
-        scheduler (lr_scheduler): learning rate scheduler  
+        scheduler (LRScheduler): learning rate scheduler, a plain torch scheduler is wrapped to step every epoch
         optimizer (torch.optim.Optimizer): optimizer 
         metrics (Dict[str, Metric]): evaluate metrics
         criterion (Optional[Module], optional): Loss function. Defaults to None.
         verbose (bool, optional): if verbose is False, model does not log anything during training process. Defaults to True.
+        batch_transform (Optional[Dict[str, Callable]], optional): on-device batch transforms applied after loading, keyed by stage ("train", "val"). Defaults to None.
     """
 
     def __init__(
@@ -45,11 +53,14 @@ class BaseLearner:
         metrics: Dict[str, Metric],
         criterion: Optional[Module] = None,
         verbose: bool = True,
+        batch_transform: Optional[Dict[str, Callable]] = None,
     ):
         self.train_data, self.val_data = train_data, val_data
         self.model, self.criterion, self.optimizer = model, criterion, optimizer
         self.save_dir = Path(save_dir)
-        self.tsboard = TensorboardLogger(path=self.save_dir)
+        self.tsboard = TensorboardLogger(
+            path=self.save_dir, backends=getattr(cfg, "log_backend", None) or "tensorboard,sqlite"
+        )
         self.device = device
         self.scaler = GradScaler(enabled=False)
         self.max_grad_norm = 1.0
@@ -57,14 +68,58 @@ class BaseLearner:
         self.metric = metrics
         self.best_metric = {k: 0.0 for k in self.metric.keys()}
         self.best_loss = np.inf
-        self.scheduler = scheduler
+        self.scheduler = (
+            scheduler
+            if scheduler is None or isinstance(scheduler, LRScheduler)
+            else LRScheduler(scheduler, optimizer)
+        )
         self.cfg = cfg
+        self.batch_transform = batch_transform or {}
+        # position to continue from, set by load_training_state
+        self.start_epoch, self.start_step = 0, 0
+        self.checkpoint_step = getattr(cfg, "checkpoint_step", None) or 0
+        self.seed = getattr(cfg, "seed", None) or 0
+        # optional EMA of the weights, used for evaluation and best checkpoints if ema_eval
+        ema_decay = getattr(cfg, "ema_decay", None)
+        self.ema = (
+            ModelEMA(
+                getattr(model, "model", model),
+                decay=ema_decay,
+                update_every=getattr(cfg, "ema_step", None) or 1,
+            )
+            if ema_decay
+            else None
+        )
+        ema_eval = getattr(cfg, "ema_eval", None)
+        self.ema_eval = self.ema is not None and (ema_eval is None or bool(ema_eval))
+        # optional early stopping and wall-clock/iteration budget, checked by fit
+        early_stop = getattr(cfg, "early_stop", None)
+        self.early_stopping = (
+            EarlyStopping(
+                monitor=early_stop,
+                patience=getattr(cfg, "early_stop_patience", None) or 5,
+                min_delta=getattr(cfg, "early_stop_min_delta", None) or 0.0,
+            )
+            if early_stop
+            else None
+        )
+        assert early_stop in (None, False, "loss") or early_stop in self.metric, (
+            f"early_stop should be loss or one of the metrics {list(self.metric)}"
+        )
+        self.budget = TrainingBudget(
+            time_budget=getattr(cfg, "time_budget", None),
+            step_budget=getattr(cfg, "step_budget", None),
+        )
         (self.save_dir / "checkpoints").mkdir(parents=True, exist_ok=True)
         (self.save_dir / "samples").mkdir(parents=True, exist_ok=True)
 
     def fit():
         raise NotImplementedError
 
+    def forward_train(self, batch: Dict[str, Any]) -> Dict[str, Any]:
+        """Outputs and loss of a training batch, learners adding loss terms override it"""
+        return self.model(batch)
+
     def train_epoch(self, epoch: int, dataloader: DataLoader) -> float:
         """Training epoch
 
@@ -75,23 +130,44 @@ class BaseLearner:
         Returns:
             float: [description]
         """
-        running_loss = AverageValueMeter()
-        total_loss = AverageValueMeter()
+        # losses are summed on the device, the logger reads them back in its own thread
+        running_loss, running_n = 0.0, 0
+        total_loss, total_n = 0.0, 0
         for m in self.metric.values():
             m.reset()
         self.model.train()
         print("Training........")
-        progress_bar = tqdm(dataloader) if self.verbose else dataloader
-        for i, batch in enumerate(progress_bar):
-            # 1: Load img_inputs and labels
-            batch = move_to(batch, self.device)
+        # 0: Fast-forward the sampler when resuming in the middle of the epoch
+        start_step, self.start_step = self.start_step, 0
+        if getattr(dataloader, "generator", None) is not None:
+            # worker seeds only depend on the epoch, a run resumed at this epoch draws the same ones
+            dataloader.generator.manual_seed(self.seed + epoch)
+        # iterable datasets cannot be fast-forwarded, the consumed batches are read again and dropped
+        skip = 0
+        if isinstance(dataloader.sampler, ResumableSampler):
+            dataloader.sampler.set_epoch(epoch, start_step * dataloader.batch_size)
+        else:
+            skip = start_step
+            if hasattr(dataloader.dataset, "set_epoch"):
+                # iterable datasets shuffle themselves, persistent workers need the epoch passed in
+                dataloader.dataset.set_epoch(epoch)
+        # 1: Load img_inputs and labels, prefetched to device one batch ahead
+        batches = DevicePrefetcher(dataloader, self.device)
+        progress_bar = tqdm(batches) if self.verbose else batches
+        transform = self.batch_transform.get("train")
+        outs = None
+        for i, batch in enumerate(progress_bar, start=start_step - skip):
+            if i < start_step:
+                continue
+            if transform is not None:
+                batch = transform(batch)
 
             # 2: Clear gradients from previous iteration
             self.optimizer.zero_grad()
             with autocast(enabled=self.cfg.fp16):
                 # 3: Get network outputs
                 # 4: Calculate the loss
-                out_dict = self.model(batch)
+                out_dict = self.forward_train(batch)
             # 5: Calculate gradients
             self.scaler.scale(out_dict['loss']).backward()
             self.scaler.unscale_(self.optimizer)
@@ -99,30 +175,119 @@ class BaseLearner:
                 self.model.parameters(), self.max_grad_norm)
             self.scaler.step(self.optimizer)
             self.scaler.update()
+            if self.scheduler is not None:
+                self.scheduler.step_iteration()
+            if self.ema is not None:
+                self.ema.update(getattr(self.model, "model", self.model))
+            # 5.1: Periodic step-level checkpoint, the end of the epoch is saved by fit
+            if (
+                self.checkpoint_step
+                and not self.cfg.debug
+                and (i + 1) % self.checkpoint_step == 0
+                and (i + 1) < len(dataloader)
+            ):
+                self.save_training_state(epoch, i + 1)
             # 6: Performing backpropagation
             with torch.no_grad():
                 # 7: Update loss
-                running_loss.add(out_dict['loss'].item())
-                total_loss.add(out_dict['loss'].item())
+                loss = out_dict['loss'].detach().double()
+                running_loss, running_n = running_loss + loss, running_n + 1
+                total_loss, total_n = total_loss + loss, total_n + 1
 
                 if (i + 1) % self.cfg.log_step == 0 or (i + 1) == len(dataloader):
                     self.tsboard.update_loss(
-                        "train", running_loss.value(
-                        )[0], epoch * len(dataloader) + i
+                        "train", running_loss / running_n, epoch * len(dataloader) + i
                     )
-                    running_loss.reset()
+                    running_loss, running_n = 0.0, 0
 
                 # 8: Update metric
                 outs = detach(out_dict)
                 batch = detach(batch)
                 for m in self.metric.values():
                     m.update(outs['out'], batch)
-        self.save_result(outs, batch, stage="train")
-        avg_loss = total_loss.value()[0]
+        if outs is not None:
+            self.save_result(outs, batch, stage="train")
+        avg_loss = float(total_loss) / total_n if total_n else float("nan")
         return avg_loss
 
     def save_checkpoints():
         raise NotImplementedError
 
+    @property
+    def eval_model(self) -> Module:
+        """Model used for evaluation, the EMA weights when `ema_eval` is set"""
+        if not self.ema_eval:
+            return self.model
+        return ModelWithLoss(self.ema.module, self.model.criterion)
+
+    def training_state(self, epoch: int, step: int) -> Dict[str, Any]:
+        r"""Everything needed to continue training at `step` batches into `epoch`
+
+        Args:
+            epoch (int): epoch to continue
+            step (int): batches of that epoch already trained
+
+        Returns:
+            Dict[str, Any]: model, optimizer, scheduler, scaler, EMA, early stopping and RNG states with the position
+        """
+        return {
+            "epoch": epoch,
+            "step": step,
+            "model_state_dict": self.model.state_dict(),
+            "optimizer_state_dict": self.optimizer.state_dict(),
+            "scheduler_state_dict": self.scheduler.state_dict()
+            if self.scheduler is not None
+            else None,
+            "scaler_state_dict": self.scaler.state_dict(),
+            "ema_state_dict": self.ema.state_dict() if self.ema is not None else None,
+            "early_stopping_state": self.early_stopping.state_dict()
+            if self.early_stopping is not None
+            else None,
+            "rng_state": get_rng_state(),
+            "best_loss": float(self.best_loss),
+            "best_metric": {k: float(v) for k, v in self.best_metric.items()},
+        }
+
+    def load_training_state(self, state: Dict[str, Any]) -> None:
+        r"""Restore a state saved by `save_training_state`, `fit` then continues from its position"""
+        model = getattr(self.model, "model", self.model)
+        model.load_state_dict(state["model_state_dict"])
+        self.optimizer.load_state_dict(state["optimizer_state_dict"])
+        if self.scheduler is not None and state.get("scheduler_state_dict"):
+            self.scheduler.load_state_dict(state["scheduler_state_dict"])
+        self.scaler.load_state_dict(state["scaler_state_dict"])
+        if self.ema is not None and state.get("ema_state_dict"):
+            self.ema.load_state_dict(state["ema_state_dict"])
+        if self.early_stopping is not None and state.get("early_stopping_state"):
+            self.early_stopping.load_state_dict(state["early_stopping_state"])
+        set_rng_state(state["rng_state"])
+        self._check_resume(state["step"])
+        self.best_loss = state["best_loss"]
+        self.best_metric.update(state["best_metric"])
+        self.start_epoch, self.start_step = state["epoch"], state["step"]
+
+    def _check_resume(self, step: int) -> None:
+        """Warn when the resumed run cannot replay the batches of the interrupted one"""
+        loader = self.train_data
+        if step and not isinstance(loader.sampler, ResumableSampler):
+            logging.warning(
+                f"The train dataset cannot be fast-forwarded, the first {step} batches of the epoch "
+                "are read again and dropped. They only match the trained ones when the dataset "
+                "order is seeded by the epoch (e.g. ShardDataset) and num_workers is unchanged"
+            )
+        if loader.num_workers > 0 and (step or loader.persistent_workers):
+            # workers are seeded once per iterator, by the epoch through the loader generator
+            logging.warning(
+                "Random transforms in dataloader workers differ from the interrupted run, "
+                "they are only replayed when resuming at an epoch boundary without persistent_workers"
+            )
+
+    def save_training_state(self, epoch: int, step: int) -> None:
+        save_model(
+            self.training_state(epoch, step),
+            self.save_dir / "checkpoints" / "last.pth",
+            verbose=False,
+        )
+
     def save_result(self, pred, batch, stage: str, **kwargs):
         NotImplemented
@@ -0,0 +1,106 @@
+import time
+from typing import Any, Dict, Optional
+
+__all__ = ["EarlyStopping", "TrainingBudget"]
+
+
+class EarlyStopping:
+    r"""Stop when the monitored validation value stops improving
+
+    The validation loss is minimized, metrics are maximized like the best metric
+    checkpoints. A value only counts as an improvement when it beats the best one
+    by more than `min_delta`.
+
+    Args:
+        monitor (str, optional): "loss" or the name of a metric. Defaults to "loss".
+        patience (int, optional): number of validations without improvement before stopping. Defaults to 5.
+        min_delta (float, optional): minimum change counted as an improvement. Defaults to 0.0.
+    """
+
+    def __init__(self, monitor: str = "loss", patience: int = 5, min_delta: float = 0.0):
+        self.monitor = monitor
+        self.patience = patience
+        self.min_delta = abs(min_delta)
+        self.sign = 1.0 if monitor == "loss" else -1.0
+        self.best: Optional[float] = None
+        self.num_bad = 0
+
+    def step(self, value: float) -> bool:
+        """Record a validation value
+
+        Args:
+            value (float): validation loss or metric value
+
+        Returns:
+            bool: True when training should stop
+        """
+        value = float(value)
+        if self.best is None or self.sign * (self.best - value) > self.min_delta:
+            self.best, self.num_bad = value, 0
+        else:
+            self.num_bad += 1
+        return self.num_bad >= self.patience
+
+    def summary(self) -> str:
+        return (
+            f"{self.monitor} has not improved from {self.best:.6f} "
+            f"for {self.num_bad} validations"
+        )
+
+    def state_dict(self) -> Dict[str, Any]:
+        return {"best": self.best, "num_bad": self.num_bad}
+
+    def load_state_dict(self, state: Dict[str, Any]) -> None:
+        self.best, self.num_bad = state["best"], state["num_bad"]
+
+
+class TrainingBudget:
+    r"""Wall-clock and iteration budget of one training run
+
+    Checked at the end of every epoch: training stops when the next epoch is not
+    expected to fit in what is left, so the run ends on an epoch boundary with its
+    checkpoints saved. The time of the next epoch is estimated by the longest epoch
+    so far. Both budgets count from `start`, resumed runs get a fresh budget.
+
+    Args:
+        time_budget (Optional[float], optional): wall-clock budget in minutes. Defaults to None.
+        step_budget (Optional[int], optional): budget in training iterations. Defaults to None.
+    """
+
+    def __init__(self, time_budget: Optional[float] = None, step_budget: Optional[int] = None):
+        self.time_budget = time_budget * 60 if time_budget else None
+        self.step_budget = step_budget or None
+        self.start()
+
+    def start(self) -> None:
+        self.start_time = self.epoch_start = time.perf_counter()
+        self.longest_epoch = 0.0
+        self.steps = 0
+
+    def step_epoch(self, steps: int, next_steps: int) -> bool:
+        """Record a finished epoch
+
+        Args:
+            steps (int): iterations trained in the finished epoch
+            next_steps (int): iterations of the next epoch
+
+        Returns:
+            bool: True when the next epoch does not fit in the budget
+        """
+        now = time.perf_counter()
+        self.longest_epoch = max(self.longest_epoch, now - self.epoch_start)
+        self.epoch_start = now
+        self.steps += steps
+        if self.time_budget is not None:
+            if now - self.start_time + self.longest_epoch > self.time_budget:
+                return True
+        if self.step_budget is not None:
+            if self.steps + next_steps > self.step_budget:
+                return True
+        return False
+
+    def summary(self) -> str:
+        return (
+            f"Training budget reached after {(time.perf_counter() - self.start_time) / 60:.1f} min "
+            f"and {self.steps} iterations"
+        )
@@ -1,8 +1,10 @@
 import logging
+import time
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Optional
 
 import torch
+from nncore.core.datasets import find_cache
 from nncore.utils.device import get_device
 from nncore.utils.utils import load_checkpoint, save_model
 from torch import device
@@ -33,6 +35,7 @@ class SupervisedLearner(BaseLearner):
         scheduler (lr_scheduler): learning rate scheduler  
         optimizer (torch.optim.Optimizer): optimizer 
         metrics (Dict[str, Metric]): evaluate metrics
+        batch_transform (Optional[Dict[str, Callable]], optional): on-device batch transforms keyed by stage. Defaults to None.
     """
 
     def __init__(
@@ -45,6 +48,7 @@ class SupervisedLearner(BaseLearner):
         scheduler,
         optimizer: Optimizer,
         device: device = get_device(),
+        batch_transform: Optional[Dict[str, Callable]] = None,
     ):
         super().__init__(
             save_dir=cfg.save_dir,
@@ -57,18 +61,29 @@ class SupervisedLearner(BaseLearner):
             optimizer=optimizer,
             criterion=None,
             cfg=cfg,
+            batch_transform=batch_transform,
         )
-        if cfg.pretrained is not None:
-            cp = load_checkpoint(cfg.pretrained)
-            self.model.model.load_state_dict(cp["model_state_dict"])
-            if cfg.resume:
-                self.optimizer.load_state_dict(["optimizer_state_dict"])
         self.verbose = cfg.verbose
         self.scaler = GradScaler(enabled=cfg.fp16)
         self.cfg = cfg
+        if cfg.pretrained is not None:
+            cp = load_checkpoint(cfg.pretrained)
+            if cfg.resume and "rng_state" in cp:
+                # full training state saved by save_training_state (last.pth)
+                self.load_training_state(cp)
+                logging.info(
+                    f"Resuming from epoch {self.start_epoch}, step {self.start_step}"
+                )
+            else:
+                self.model.model.load_state_dict(cp["model_state_dict"])
+                if self.ema is not None:
+                    self.ema.set(self.model.model)
+                if cfg.resume:
+                    self.optimizer.load_state_dict(cp["optimizer_state_dict"])
 
     def fit(self):
-        for epoch in range(self.cfg.nepochs):
+        self.budget.start()
+        for epoch in range(self.start_epoch, self.cfg.nepochs):
 
             # Note learning rate
             for i, group in enumerate(self.optimizer.param_groups):
@@ -80,8 +95,14 @@ class SupervisedLearner(BaseLearner):
 
             # 1: Training phase
             # 1.1 train
+            steps = len(self.train_data) - self.start_step
+            if torch.device(self.device).type == "cuda":
+                torch.cuda.reset_peak_memory_stats(self.device)
+            start = time.perf_counter()
             avg_loss = self.train_epoch(
                 epoch=epoch, dataloader=self.train_data)
+            self.log_performance(epoch, steps, time.perf_counter() - start)
+            out_of_budget = self.budget.step_epoch(steps, len(self.train_data))
 
             # 1.2 log result
             logging.info("+ Training result")
@@ -90,10 +111,12 @@ class SupervisedLearner(BaseLearner):
                 m.summary()
 
             # 2: Evalutation phase
-            if (epoch + 1) % self.cfg.val_step == 0:
+            # the last epoch of the budget is always validated
+            val_loss, early_stop = None, False
+            if (epoch + 1) % self.cfg.val_step == 0 or out_of_budget:
                 with autocast(enabled=self.cfg.fp16):
                     # 2: Evaluating model
-                    avg_loss = self.evaluate(epoch, dataloader=self.val_data)
+                    avg_loss = val_loss = self.evaluate(epoch, dataloader=self.val_data)
 
                     logging.info("+ Evaluation result")
                     logging.info(f"Loss: {avg_loss}")
@@ -101,25 +124,72 @@ class SupervisedLearner(BaseLearner):
                     for m in self.metric.values():
                         m.summary()
 
-                    # 3: Learning rate scheduling
-                    self.scheduler.step(avg_loss)
-
-                    # 4: Saving checkpoints
+                    # 3: Saving checkpoints
                     if not self.cfg.debug:
                         # Get latest val loss here
                         val_metric = {k: m.value()
                                       for k, m in self.metric.items()}
                         self.save_checkpoint(epoch, avg_loss, val_metric)
+
+                    # 3.1: Early stopping on the validation loss or a metric
+                    if self.early_stopping is not None:
+                        monitor = self.early_stopping.monitor
+                        early_stop = self.early_stopping.step(
+                            avg_loss if monitor == "loss" else self.metric[monitor].value()
+                        )
+
+            # 4: Learning rate scheduling, metric-based schedulers only step after a validation
+            if self.scheduler is not None:
+                self.scheduler.step_epoch(val_loss)
+
+            # 5: Resumable training state of the next epoch
+            if not self.cfg.debug:
+                self.save_training_state(epoch + 1, 0)
+
+            # 6: Shared dataset cache statistics
+            cache = find_cache(self.train_data.dataset)
+            if cache is not None:
+                cache.summary()
+                self.tsboard.update_scalar(
+                    "data/cache_hit_rate", cache.stats()["hit_rate"], epoch
+                )
+                cache.reset_stats()
             logging.info("-----------------------------------")
 
+            # 7: Stop early, the training state above already points to the next epoch
+            if early_stop:
+                logging.info(f"Early stopping: {self.early_stopping.summary()}")
+                break
+            if out_of_budget and epoch + 1 < self.cfg.nepochs:
+                logging.info(self.budget.summary())
+                break
+        self.tsboard.flush()
+        self.tsboard.summary()
+
+    def log_performance(self, epoch: int, steps: int, seconds: float) -> None:
+        """Log the training throughput and the peak memory of the epoch"""
+        samples = steps * (self.train_data.batch_size or 1)
+        if torch.device(self.device).type == "cuda":
+            peak_mb = torch.cuda.max_memory_allocated(self.device) / 2 ** 20
+        else:
+            import resource
+
+            # peak resident set size of the process, in KiB on Linux
+            peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+        logging.info(f"Throughput: {samples / seconds:.1f} samples/s, peak memory {peak_mb:.0f} MiB")
+        self.tsboard.update_scalar("perf/epoch_time_s", seconds, epoch)
+        self.tsboard.update_scalar("perf/samples_per_sec", samples / seconds, epoch)
+        self.tsboard.update_scalar("perf/peak_memory_mb", peak_mb, epoch)
+
     def save_checkpoint(
         self, epoch: int, val_loss: float, val_metric: Dict[str, float]
     ) -> None:
         r"""Save checkpoint method
 
         Saving 
-        -   model state dict
+        -   model state dict, the EMA weights when they are used for evaluation
         -   optimizer state dict
+        -   raw or EMA weights, whichever was not saved as model state dict
         Args:
             epoch (int): current epoch
             val_loss (float): validation loss
@@ -130,6 +200,11 @@ class SupervisedLearner(BaseLearner):
             "model_state_dict": self.model.model.state_dict(),
             "optimizer_state_dict": self.optimizer.state_dict(),
         }
+        if self.ema_eval:
+            data["raw_model_state_dict"] = data["model_state_dict"]
+            data["model_state_dict"] = self.ema.module.state_dict()
+        elif self.ema is not None:
+            data["ema_state_dict"] = self.ema.module.state_dict()
 
         if val_loss < self.best_loss:
             logging.info(
@@ -159,12 +234,13 @@ class SupervisedLearner(BaseLearner):
     @torch.no_grad()
     def evaluate(self, epoch, dataloader):
         last_batch_pred, avg_loss, metric = evaluate(
-            model=self.model,
+            model=self.eval_model,
             dataloader=dataloader,
             metric=self.metric,
             device=self.device,
             verbose=self.verbose,
             return_last_batch=True,
+            batch_transform=self.batch_transform.get("val"),
         )
         self.metric = metric
 
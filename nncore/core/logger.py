@@ -1,15 +1,219 @@
-import torchvision
-from torch.utils.tensorboard import SummaryWriter
-from PIL import Image
+"""Training loggers
 
+`TensorboardLogger` only enqueues records, a background thread converts
+tensors, renders figures and hands the records in batches to the backends:
 
-class TensorboardLogger:
+-   tensorboard: `SummaryWriter` event files
+-   jsonl: one `{"tag", "value", "step", "time"}` object per line in scalars.jsonl
+-   csv: the same columns in scalars.csv
+-   sqlite: the run metrics store metrics.sqlite, see `nncore.core.runstore`
+
+Tensors are kept as they are until the thread converts them, so logging a
+loss does not synchronize with the device. The queue is bounded, records are
+dropped rather than blocking training when it is full, and `stats()` reports
+the time spent on the training side.
+"""
+import atexit
+import csv
+import json
+import logging
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Sequence, Tuple, Union
+
+import torch
+
+# (kind, tag, value, step, wall time)
+Record = Tuple[str, str, Any, int, float]
+
+
+class TensorboardBackend:
     def __init__(self, path):
-        assert path != None, "path is None"
+        # tensorboard is slow to import, only load it when a logger is created
+        from torch.utils.tensorboard import SummaryWriter
+
         self.writer = SummaryWriter(log_dir=path)
 
+    def write(self, records: List[Record]) -> None:
+        for kind, tag, value, step, walltime in records:
+            if kind == "scalar":
+                self.writer.add_scalar(tag, value, step, walltime=walltime)
+            elif kind == "image":
+                self.writer.add_image(tag, value, step, walltime=walltime)
+            elif kind == "figure":
+                self.writer.add_figure(tag, value, step, walltime=walltime)
+
+    def flush(self) -> None:
+        self.writer.flush()
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class JsonlBackend:
+    """Scalars as JSON lines, images and figures are skipped"""
+
+    def __init__(self, path):
+        self.file = open(Path(path) / "scalars.jsonl", "a")
+
+    def write(self, records: List[Record]) -> None:
+        for kind, tag, value, step, walltime in records:
+            if kind == "scalar":
+                self.file.write(
+                    json.dumps({"tag": tag, "value": value, "step": step, "time": walltime})
+                    + "\n"
+                )
+
+    def flush(self) -> None:
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class CsvBackend(JsonlBackend):
+    """Scalars as CSV rows, images and figures are skipped"""
+
+    def __init__(self, path):
+        path = Path(path) / "scalars.csv"
+        new_file = not path.exists()
+        self.file = open(path, "a", newline="")
+        self.writer = csv.writer(self.file)
+        if new_file:
+            self.writer.writerow(["time", "step", "tag", "value"])
+
+    def write(self, records: List[Record]) -> None:
+        self.writer.writerows(
+            [walltime, step, tag, value]
+            for kind, tag, value, step, walltime in records
+            if kind == "scalar"
+        )
+
+
+class SqliteBackend:
+    """Scalars and run information in the run metrics store"""
+
+    def __init__(self, path):
+        from nncore.core.runstore import RunStore
+
+        self.store = RunStore(path)
+
+    def write(self, records: List[Record]) -> None:
+        self.store.add_scalars(
+            (walltime, step, tag, value)
+            for kind, tag, value, step, walltime in records
+            if kind == "scalar"
+        )
+        for kind, _, value, _, _ in records:
+            if kind == "info":
+                self.store.set_info(value)
+
+    def flush(self) -> None:
+        self.store.flush()
+
+    def close(self) -> None:
+        self.store.close()
+
+
+LOGGER_BACKENDS = {
+    "tensorboard": TensorboardBackend,
+    "jsonl": JsonlBackend,
+    "csv": CsvBackend,
+    "sqlite": SqliteBackend,
+}
+
+
+def _convert(kind: str, value: Any) -> Any:
+    if kind == "scalar":
+        return float(value)
+    if kind == "image":
+        return value.detach().float().cpu()
+    return value
+
+
+class TensorboardLogger:
+    r"""Non-blocking logger writing to one or more backends
+
+    Args:
+        path: log directory
+        backends (Union[str, Sequence[str]], optional): names in `LOGGER_BACKENDS`, comma separated or a list. Defaults to "tensorboard".
+        max_queue (int, optional): records buffered before new ones are dropped. Defaults to 10000.
+        flush_secs (float, optional): seconds between backend flushes. Defaults to 10.
+    """
+
+    def __init__(
+        self,
+        path,
+        backends: Union[str, Sequence[str]] = "tensorboard",
+        max_queue: int = 10000,
+        flush_secs: float = 10.0,
+    ):
+        assert path != None, "path is None"
+        if isinstance(backends, str):
+            backends = [b.strip() for b in backends.split(",") if b.strip()]
+        for name in backends:
+            assert name in LOGGER_BACKENDS, f"Unknown log backend {name}, use one of {list(LOGGER_BACKENDS)}"
+        Path(path).mkdir(parents=True, exist_ok=True)
+        self.backends = [LOGGER_BACKENDS[name](path) for name in backends]
+        self.flush_secs = flush_secs
+        self.queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_queue)
+        self.num_records, self.num_dropped = 0, 0
+        self.enqueue_time, self.write_time = 0.0, 0.0
+        self.thread = threading.Thread(target=self._run, name="logger", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def _put(self, kind: str, tag: str, value: Any, step: int) -> None:
+        start = time.perf_counter()
+        if torch.is_tensor(value):
+            # the thread reads it back, keep autograd and later in-place updates out
+            value = value.detach().clone() if kind == "scalar" else value.detach()
+        try:
+            self.queue.put_nowait((kind, tag, value, step, time.time()))
+            self.num_records += 1
+        except queue.Full:
+            self.num_dropped += 1
+        self.enqueue_time += time.perf_counter() - start
+
+    def _run(self) -> None:
+        last_flush = time.perf_counter()
+        while True:
+            try:
+                items = [self.queue.get(timeout=self.flush_secs)]
+            except queue.Empty:
+                items = []
+            while True:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            done = [item for item in items if not isinstance(item, tuple)]
+            records = [item for item in items if isinstance(item, tuple)]
+            start = time.perf_counter()
+            try:
+                if records:
+                    records = [
+                        (kind, tag, _convert(kind, value), step, walltime)
+                        for kind, tag, value, step, walltime in records
+                    ]
+                    for backend in self.backends:
+                        backend.write(records)
+                if done or time.perf_counter() - last_flush > self.flush_secs:
+                    for backend in self.backends:
+                        backend.flush()
+                    last_flush = time.perf_counter()
+            except Exception:
+                logging.exception("Logger backend failed")
+            self.write_time += time.perf_counter() - start
+            for event in done:
+                event.set()
+            for _ in items:
+                self.queue.task_done()
+
     def update_scalar(self, tag, value, step):
-        self.writer.add_scalar(tag, value, step)
+        self._put("scalar", tag, value, step)
 
     def update_loss(self, phase, value, step):
         self.update_scalar(f"{phase}/loss", value, step)
@@ -20,5 +224,48 @@ class TensorboardLogger:
     def update_lr(self, gid, value, step):
         self.update_scalar(f"lr/group_{gid}", value, step)
 
+    def update_image(self, tag, image, step):
+        """Log a C x H x W image tensor, converted in the logger thread"""
+        self._put("image", tag, image, step)
+
     def update_figure(self, tag, image, step):
-        self.writer.add_figure(tag, image, step)
+        """Log a matplotlib figure or a list of them, rendered in the logger thread"""
+        self._put("figure", tag, image, step)
+
+    def update_info(self, info: Dict[str, Any]):
+        """Run information (config, status, ...), kept by the sqlite backend"""
+        self._put("info", "", dict(info), 0)
+
+    def flush(self) -> None:
+        """Block until every record enqueued so far is written and flushed"""
+        if not self.thread.is_alive():
+            return
+        event = threading.Event()
+        self.queue.put(event)
+        event.wait()
+
+    def close(self) -> None:
+        if not self.backends:
+            return
+        self.flush()
+        for backend in self.backends:
+            backend.close()
+        self.backends = []
+        atexit.unregister(self.close)
+
+    def stats(self) -> Dict[str, float]:
+        """Records logged and dropped, mean enqueue cost on the training side in microseconds"""
+        return {
+            "records": self.num_records,
+            "dropped": self.num_dropped,
+            "enqueue_us": 1e6 * self.enqueue_time / max(self.num_records + self.num_dropped, 1),
+            "write_s": self.write_time,
+        }
+
+    def summary(self) -> None:
+        stats = self.stats()
+        logging.info(
+            f"Logger: {stats['records']} records, {stats['dropped']} dropped, "
+            f"{stats['enqueue_us']:.1f} us per record in the training loop, "
+            f"{stats['write_s']:.2f} s writing in the background"
+        )
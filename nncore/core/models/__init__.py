@@ -1,2 +1,4 @@
 from nncore.core.registry import Registry
 MODEL_REGISTRY = Registry('MODEL')
+
+from .ema import ModelEMA
@@ -0,0 +1,83 @@
+import copy
+from typing import Any, Dict
+
+import torch
+from torch import nn
+
+__all__ = ["ModelEMA"]
+
+
+class ModelEMA:
+    r"""Exponential moving average of model weights
+
+    Keeps a shadow copy of the model on the same device and blends the live
+    weights into it every `update_every` optimizer steps with fused
+    `torch._foreach` ops. Floating point parameters and buffers are averaged,
+    integer buffers (e.g. BatchNorm `num_batches_tracked`) are copied.
+
+    The decay is ramped up as `min(decay, (1 + n) / (10 + n))` over the first
+    updates, so the average is not dominated by the initial weights.
+
+    Args:
+        model (nn.Module): model to average
+        decay (float, optional): EMA decay. Defaults to 0.9999.
+        update_every (int, optional): optimizer steps between updates. Defaults to 1.
+
+    Examples:
+
+        ema = ModelEMA(model, decay=0.999)
+        for batch in dataloader:
+            ...
+            optimizer.step()
+            ema.update(model)
+        evaluate(ema.module)
+    """
+
+    def __init__(self, model: nn.Module, decay: float = 0.9999, update_every: int = 1):
+        self.module = copy.deepcopy(model).eval()
+        for p in self.module.parameters():
+            p.requires_grad_(False)
+        self.decay = decay
+        self.update_every = update_every
+        self.steps = 0
+        self.num_updates = 0
+
+    @torch.no_grad()
+    def update(self, model: nn.Module) -> None:
+        """Count an optimizer step, blend `model` in every `update_every` steps"""
+        self.steps += 1
+        if self.steps % self.update_every != 0:
+            return
+        decay = min(self.decay, (1 + self.num_updates) / (10 + self.num_updates))
+        self.num_updates += 1
+
+        ema_floats, model_floats = [], []
+        model_state = model.state_dict()
+        for k, ema_v in self.module.state_dict().items():
+            v = model_state[k].detach()
+            if ema_v.dtype.is_floating_point:
+                ema_floats.append(ema_v)
+                model_floats.append(v)
+            else:
+                ema_v.copy_(v)
+        if ema_floats:
+            torch._foreach_mul_(ema_floats, decay)
+            torch._foreach_add_(ema_floats, model_floats, alpha=1 - decay)
+
+    @torch.no_grad()
+    def set(self, model: nn.Module) -> None:
+        """Restart the average from the current weights of `model`"""
+        self.module.load_state_dict(model.state_dict())
+        self.steps = self.num_updates = 0
+
+    def state_dict(self) -> Dict[str, Any]:
+        return {
+            "module": self.module.state_dict(),
+            "steps": self.steps,
+            "num_updates": self.num_updates,
+        }
+
+    def load_state_dict(self, state: Dict[str, Any]) -> None:
+        self.module.load_state_dict(state["module"])
+        self.steps = state["steps"]
+        self.num_updates = state["num_updates"]
@@ -32,7 +32,7 @@ class ModelWithLoss(nn.Module):
         outputs = self.model(batch["input"])
         loss, loss_dict = self.criterion(outputs, batch)
         return {
-            'out': outputs['out'],
+            'out': outputs['out'] if isinstance(outputs, dict) else outputs,
             'loss': loss,
             'loss_dict': loss_dict
         }
@@ -57,11 +57,35 @@ class opts(object):
         self.parser.add_argument(
             "--num-workers", type=int, help="dataloader threads. 0 for single-thread.",
         )
+        self.parser.add_argument(
+            "--prefetch-factor", type=int, help="batches loaded in advance by each worker.",
+        )
+        self.parser.add_argument(
+            "--autotune-workers",
+            type=int,
+            help="time the first batches across worker counts and keep the fastest.",
+        )
         self.parser.add_argument("--seed", type=int, help="random seed")
+        self.parser.add_argument(
+            "--ema-decay", type=float, help="decay of the weights EMA, disabled if unset.",
+        )
+        self.parser.add_argument(
+            "--ema-step", type=int, help="number of iterations between EMA updates.",
+        )
+        self.parser.add_argument(
+            "--ema-eval",
+            type=int,
+            help="evaluate and save best checkpoints with the EMA weights.",
+        )
         # log
         self.parser.add_argument(
             "--verbose", type=int, help="disable progress bar and print to screen.",
         )
+        self.parser.add_argument(
+            "--log-backend",
+            type=str,
+            help="comma separated log backends: tensorboard, jsonl, csv.",
+        )
         self.parser.add_argument("--config-path", type=str)
 
         # train
@@ -77,6 +101,36 @@ class opts(object):
         self.parser.add_argument(
             "--log-step", type=int, help="number of epochs to logging.",
         )
+        self.parser.add_argument(
+            "--checkpoint-step",
+            type=int,
+            help="number of iterations between resumable checkpoints (last.pth). 0 to save once per epoch.",
+        )
+        self.parser.add_argument(
+            "--early-stop",
+            type=str,
+            help="stop when the validation loss or this metric stops improving.",
+        )
+        self.parser.add_argument(
+            "--early-stop-patience",
+            type=int,
+            help="number of validations without improvement before early stopping.",
+        )
+        self.parser.add_argument(
+            "--early-stop-min-delta",
+            type=float,
+            help="minimum change counted as an improvement.",
+        )
+        self.parser.add_argument(
+            "--time-budget",
+            type=float,
+            help="wall-clock budget in minutes, training stops at the last epoch that fits.",
+        )
+        self.parser.add_argument(
+            "--step-budget",
+            type=int,
+            help="budget in iterations, training stops at the last epoch that fits.",
+        )
         self.parser.add_argument(
             "--save-dir", type=str, help="saving path",
         )
@@ -0,0 +1,338 @@
+"""Per-layer model profiler
+
+Runs a model on an example input with forward hooks on every module and
+reports, for every leaf layer, its FLOPs (2 x multiply-accumulates of the
+convolutions and linear layers), parameters, newly allocated activation memory and
+median CPU latency. Torch functions called directly in a `forward`, such as
+the `torch.cat` of skip connections, get their own rows named after the
+module calling them (`invres1` is a module, `cat:0` the first concatenation
+of the root module). With `depth`, rows are summed into the modules at that
+depth of the module tree.
+
+Profile any model of `MODEL_REGISTRY` from a pipeline YAML or a checkpoint
+`config.yaml`, sorted by latency:
+
+    python -m nncore.core.profiler pipeline.yml --input-shape 1 3 224 224 --depth 1 --sort latency --json profile.json
+"""
+import argparse
+import json
+import logging
+import statistics
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import torch
+from torch import Tensor, nn
+from torch.overrides import TorchFunctionMode
+
+SORT_KEYS = ("order", "latency", "flops", "params", "memory")
+
+
+def layer_flops(module: nn.Module, inputs: tuple, output: Any) -> int:
+    """FLOPs of one call of a convolution or linear layer, 0 for other modules"""
+    if isinstance(output, dict):
+        output = next(iter(output.values()))
+    if isinstance(module, nn.Conv2d):
+        macs = output.numel() * module.in_channels // module.groups * module.kernel_size[0] * module.kernel_size[1]
+    elif isinstance(module, nn.ConvTranspose2d):
+        macs = inputs[0].numel() * module.out_channels // module.groups * module.kernel_size[0] * module.kernel_size[1]
+    elif isinstance(module, nn.Linear):
+        macs = output.numel() * module.in_features
+    else:
+        return 0
+    return 2 * macs
+
+
+def count_params(model: nn.Module) -> int:
+    return sum(p.numel() for p in model.parameters())
+
+
+def count_flops(model: nn.Module, example: Tensor) -> int:
+    """FLOPs (2 x multiply-accumulates) of the convolutions and linear layers for one forward of `example`"""
+    total = [0]
+
+    def hook(module, inputs, output):
+        total[0] += layer_flops(module, inputs, output)
+
+    handles = [
+        m.register_forward_hook(hook)
+        for m in model.modules()
+        if isinstance(m, (nn.Conv2d, nn.ConvTranspose2d, nn.Linear))
+    ]
+    try:
+        with torch.no_grad():
+            model(example)
+    finally:
+        for handle in handles:
+            handle.remove()
+    return total[0]
+
+
+def measure_latency(model: nn.Module, example: Tensor, warmup: int = 3, repeat: int = 20) -> float:
+    """Median forward time in milliseconds"""
+    times = []
+    with torch.inference_mode():
+        for i in range(warmup + repeat):
+            start = time.perf_counter()
+            model(example)
+            if example.is_cuda:
+                torch.cuda.synchronize()
+            if i >= warmup:
+                times.append(1000 * (time.perf_counter() - start))
+    return sorted(times)[len(times) // 2]
+
+
+def _tensors(output: Any) -> List[Tensor]:
+    if isinstance(output, Tensor):
+        return [output]
+    if isinstance(output, dict):
+        output = list(output.values())
+    if isinstance(output, (list, tuple)):
+        return [t for item in output for t in _tensors(item)]
+    return []
+
+
+class _Recorder(TorchFunctionMode):
+    """Module stack kept by the hooks, and the torch functions called outside leaf modules"""
+
+    def __init__(self, names: Dict[nn.Module, str], leaves: set):
+        super().__init__()
+        self.names, self.leaves = names, leaves
+        self.stack: List[Tuple[nn.Module, float]] = []
+        self.rows: Dict[str, Dict[str, Any]] = {}
+        self.times: Dict[str, float] = {}
+        self.function_calls: Dict[str, int] = {}
+        self.module_calls: Dict[str, int] = {}
+        # storages counted in this forward, kept alive so that their addresses are not reused
+        self.storages: Dict[int, Any] = {}
+
+    def reset(self) -> None:
+        self.rows, self.times, self.storages = {}, {}, {}
+        self.function_calls, self.module_calls = {}, {}
+
+    def new_bytes(self, tensors: List[Tensor]) -> int:
+        """Bytes of the storages not seen before in this forward, in-place outputs and views add nothing"""
+        total = 0
+        for t in tensors:
+            storage = t.untyped_storage()
+            if storage.data_ptr() not in self.storages:
+                self.storages[storage.data_ptr()] = storage
+                total += storage.nbytes()
+        return total
+
+    def record(self, name: str, kind: str, output: Any, elapsed: float, flops: int = 0, params: int = 0) -> None:
+        tensors = _tensors(output)
+        row = self.rows.setdefault(name, {"name": name, "type": kind, "calls": 0, "shape": None})
+        row.update(
+            calls=row["calls"] + 1,
+            shape=list(tensors[0].shape) if tensors else row["shape"],
+            params=params,
+            flops=row.get("flops", 0) + flops,
+            memory=row.get("memory", 0) + self.new_bytes(tensors),
+        )
+        self.times[name] = self.times.get(name, 0.0) + elapsed
+
+    def pre_hook(self, module, inputs):
+        self.stack.append((module, time.perf_counter()))
+
+    def hook(self, module, inputs, output):
+        _, start = self.stack.pop()
+        elapsed = time.perf_counter() - start
+        name = self.names[module]
+        self.module_calls[name] = self.module_calls.get(name, 0) + 1
+        if module in self.leaves:
+            params = sum(p.numel() for p in module.parameters())
+            self.record(
+                name, type(module).__name__, output, elapsed, layer_flops(module, inputs, output), params
+            )
+
+    def __torch_function__(self, func, types, args=(), kwargs=None):
+        kwargs = kwargs or {}
+        owner = self.stack[-1][0] if self.stack else None
+        fname = getattr(func, "__name__", "")
+        if owner is None or owner in self.leaves or fname == "__get__":
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        output = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        if _tensors(output):
+            fname = fname.strip("_")
+            prefix = self.names[owner]
+            key = f"{prefix}.{fname}" if prefix else fname
+            index = self.function_calls.get(key, 0)
+            self.function_calls[key] = index + 1
+            self.record(f"{key}:{index}", fname, output, elapsed)
+        return output
+
+
+def profile_model(
+    model: nn.Module, example: Tensor, depth: Optional[int] = None, warmup: int = 2, repeat: int = 10
+) -> Dict[str, Any]:
+    r"""Per-layer FLOPs, parameters, activation memory and latency of a model
+
+    Latencies are the median over `repeat` forwards of every layer's time,
+    measured on the current device and torch threads. Memory is the size of
+    the new tensors a layer allocates in one forward: in-place layers and
+    views of their input count nothing.
+
+    Args:
+        model (nn.Module): model to profile, in eval mode during the profile
+        example (Tensor): input of one forward
+        depth (Optional[int], optional): sum the rows into the modules at this depth, leaf layers if None. Defaults to None.
+        warmup (int, optional): forwards before timing. Defaults to 2.
+        repeat (int, optional): timed forwards. Defaults to 10.
+
+    Returns:
+        Dict[str, Any]: `layers` rows in execution order and `totals`
+    """
+    names = {module: name for name, module in model.named_modules(remove_duplicate=False)}
+    leaves = {m for m in names if next(m.children(), None) is None}
+    recorder = _Recorder(names, leaves)
+    handles = []
+    for module in names:
+        handles.append(module.register_forward_pre_hook(recorder.pre_hook))
+        handles.append(module.register_forward_hook(recorder.hook))
+
+    was_training = model.training
+    model.eval()
+    times: Dict[str, List[float]] = {}
+    try:
+        with torch.inference_mode():
+            for i in range(warmup + repeat):
+                recorder.reset()
+                recorder.new_bytes([example])
+                with recorder:
+                    model(example)
+                if i >= warmup:
+                    for name, elapsed in recorder.times.items():
+                        times.setdefault(name, []).append(1000 * elapsed)
+    finally:
+        for handle in handles:
+            handle.remove()
+        model.train(was_training)
+
+    rows = list(recorder.rows.values())
+    for row in rows:
+        row["latency_ms"] = statistics.median(times[row["name"]])
+    if depth is not None:
+        rows = _group(rows, depth, dict(model.named_modules()), recorder.module_calls)
+
+    total_latency = measure_latency(model.eval(), example, warmup=warmup, repeat=repeat)
+    model.train(was_training)
+    totals = {
+        "params": count_params(model),
+        "flops": sum(row["flops"] for row in rows),
+        "memory": sum(row["memory"] for row in rows),
+        "latency_ms": sum(row["latency_ms"] for row in rows),
+        "forward_ms": total_latency,
+    }
+    return {"input_shape": list(example.shape), "layers": rows, "totals": totals}
+
+
+def _group(
+    rows: List[Dict[str, Any]], depth: int, modules: Dict[str, nn.Module], calls: Dict[str, int]
+) -> List[Dict[str, Any]]:
+    groups: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        parts = row["name"].split(".")
+        key = ".".join(parts[:depth])
+        group = groups.get(key)
+        if group is None:
+            module = modules.get(key)
+            groups[key] = dict(row, name=key)
+            if module is not None:
+                groups[key].update(type=type(module).__name__, calls=calls.get(key, row["calls"]))
+            continue
+        for field in ("params", "flops", "memory", "latency_ms"):
+            group[field] += row[field]
+        # the output of a group is the output of its last layer
+        group["shape"] = row["shape"]
+    return list(groups.values())
+
+
+def sort_layers(layers: List[Dict[str, Any]], sort: str = "order") -> List[Dict[str, Any]]:
+    if sort == "order":
+        return list(layers)
+    field = {"latency": "latency_ms"}.get(sort, sort)
+    return sorted(layers, key=lambda row: row[field], reverse=True)
+
+
+def print_profile(profile: Dict[str, Any], sort: str = "order", top: Optional[int] = None) -> None:
+    totals = profile["totals"]
+    layers = sort_layers(profile["layers"], sort)[:top]
+    width = max([len("layer")] + [len(row["name"]) for row in layers])
+    header = (
+        f"{'layer':<{width}}  {'type':<18}{'calls':>6}  {'output':<20}{'params':>10}"
+        f"{'MFLOPs':>10}{'%':>6}{'act MB':>9}{'ms':>9}{'%':>6}"
+    )
+    logging.info(header)
+    logging.info("-" * len(header))
+    for row in layers:
+        flops_share = 100 * row["flops"] / totals["flops"] if totals["flops"] else 0.0
+        latency_share = 100 * row["latency_ms"] / totals["latency_ms"] if totals["latency_ms"] else 0.0
+        shape = "x".join(map(str, row["shape"] or []))
+        logging.info(
+            f"{row['name']:<{width}}  {row['type'][:17]:<18}{row['calls']:>6}  {shape:<20}{row['params']:>10}"
+            f"{row['flops'] / 1e6:>10.1f}{flops_share:>6.1f}{row['memory'] / 2 ** 20:>9.2f}"
+            f"{row['latency_ms']:>9.3f}{latency_share:>6.1f}"
+        )
+    logging.info("-" * len(header))
+    logging.info(
+        f"params {totals['params']:,}, {totals['flops'] / 1e9:.3f} GFLOPs, "
+        f"{totals['memory'] / 2 ** 20:.1f} MB of activations, "
+        f"{totals['latency_ms']:.2f} ms in the layers, {totals['forward_ms']:.2f} ms per forward without hooks"
+    )
+
+
+def build_model(cfg: Dict[str, Any]) -> nn.Module:
+    """Model of a pipeline config, or of a checkpoint `config.yaml` resized to its `pruned_shapes`"""
+    from nncore.core.models import MODEL_REGISTRY
+    from nncore.core.pruning import apply_shapes
+    from nncore.utils.getter import get_instance
+
+    model_cfg = cfg["model"] if "model" in cfg else cfg["pipeline"]["model"]
+    model = get_instance(dict(model_cfg), registry=MODEL_REGISTRY)
+    if cfg.get("pruned_shapes"):
+        apply_shapes(model, cfg["pruned_shapes"])
+    return model
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-layer FLOPs, parameters, activation memory and latency of a model")
+    parser.add_argument("cfg", help="pipeline YAML or checkpoint config.yaml")
+    parser.add_argument("--input-shape", type=int, nargs=4, default=[1, 3, 224, 224])
+    parser.add_argument("--checkpoint", default=None, help="weights to load, random weights if not given")
+    parser.add_argument("--depth", type=int, default=None, help="sum the layers into the modules at this depth")
+    parser.add_argument("--sort", choices=SORT_KEYS, default="order")
+    parser.add_argument("--top", type=int, default=None, help="print the first rows only")
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=None, help="torch threads, torch default if not given")
+    parser.add_argument("--json", default=None, help="write the profile to this file")
+    parser.add_argument("--imports", nargs="*", default=[], help="modules registering custom models")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    import importlib
+
+    import nncore.segmentation.models  # noqa: F401, registers the segmentation models
+    from nncore.utils.loading import load_yaml
+    from nncore.utils.utils import load_model
+
+    for module in args.imports:
+        importlib.import_module(module)
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    model = build_model(load_yaml(args.cfg))
+    if args.checkpoint is not None:
+        load_model(model, args.checkpoint, verbose=False)
+    profile = profile_model(model, torch.rand(*args.input_shape), args.depth, args.warmup, args.repeat)
+    profile["model"] = type(model).__name__
+    profile["threads"] = torch.get_num_threads()
+    logging.info(f"{profile['model']} on {args.input_shape}, {profile['threads']} threads")
+    print_profile(profile, args.sort, args.top)
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump({**profile, "layers": sort_layers(profile["layers"], args.sort)}, f, indent=2)
+        logging.info(f"Saved to {args.json}")
@@ -0,0 +1,364 @@
+"""Structured channel pruning
+
+Output channels of convolutions are removed physically, so the pruned model
+is smaller and faster without sparse kernels. The model is traced with
+`torch.fx` to find, for every convolution, the layers reading its channels:
+
+-   BatchNorm, activations, pooling, resizing and depthwise convolutions keep
+    the channels, they are pruned along and followed further
+-   `torch.cat` on the channel dim shifts the channels by the width of the
+    tensors before them, so skip connections are handled
+-   a convolution or transposed convolution reading them loses the matching
+    input channels
+-   anything else (residual adds, linear layers, the model outputs) makes the
+    convolution unprunable
+
+Channels are ranked by the L1 or L2 norm of their filters. The new widths are
+returned as a shape spec; `apply_shapes` resizes a freshly built model to it
+before loading pruned weights, and `load_checkpoint_model` does so when the
+spec is in the saved config (`pruned_shapes`).
+
+Fine-tune through a pipeline with a `pruning:` section, or prune a trained
+checkpoint folder directly:
+
+    python -m nncore.core.pruning runs/<run>/checkpoints --amount 0.3 --output-dir pruned/checkpoints
+"""
+import argparse
+import fnmatch
+import logging
+from typing import Any, Dict, Optional, Sequence, Set, Tuple
+
+import torch
+from nncore.core.profiler import count_flops, count_params, measure_latency
+from torch import Tensor, nn
+
+# layers keeping every channel in place
+PASSTHROUGH_MODULES = (
+    nn.ReLU, nn.ReLU6, nn.LeakyReLU, nn.PReLU, nn.ELU, nn.GELU, nn.SiLU, nn.Hardswish,
+    nn.Hardsigmoid, nn.Sigmoid, nn.Tanh, nn.Identity, nn.Dropout, nn.Dropout2d,
+    nn.Upsample, nn.UpsamplingBilinear2d, nn.UpsamplingNearest2d, nn.MaxPool2d,
+    nn.AvgPool2d, nn.AdaptiveAvgPool2d, nn.AdaptiveMaxPool2d,
+)
+PASSTHROUGH_FUNCTIONS = {
+    "relu", "relu_", "relu6", "leaky_relu", "gelu", "silu", "hardswish", "sigmoid", "tanh",
+    "dropout", "interpolate", "upsample", "max_pool2d", "avg_pool2d", "adaptive_avg_pool2d",
+    "adaptive_max_pool2d", "contiguous", "clone",
+}
+CONVS = (nn.Conv2d, nn.ConvTranspose2d)
+
+
+def _is_depthwise(module: nn.Module) -> bool:
+    return (
+        isinstance(module, nn.Conv2d)
+        and module.groups > 1
+        and module.groups == module.in_channels == module.out_channels
+    )
+
+
+def _is_producer(module: nn.Module) -> bool:
+    return isinstance(module, CONVS) and module.groups == 1
+
+
+def _callable_name(target) -> str:
+    return target if isinstance(target, str) else getattr(target, "__name__", "")
+
+
+def channel_dependencies(model: nn.Module, example: Tensor) -> Dict[str, Optional[Dict[str, Any]]]:
+    r"""Layers depending on the output channels of every convolution
+
+    Args:
+        model (nn.Module): model traceable by `torch.fx`
+        example (Tensor): example input, used for the channel widths of concatenated tensors
+
+    Returns:
+        Dict[str, Optional[Dict[str, Any]]]: for every prunable convolution name,
+        {"channels": [(module name, offset)], "inputs": [(module name, offset)]}
+        of the channel-wise layers and of the consumers, None when it can not be pruned
+    """
+    from torch.fx import symbolic_trace
+    from torch.fx.passes.shape_prop import ShapeProp
+
+    gm = symbolic_trace(model)
+    was_training = model.training
+    model.eval()
+    with torch.no_grad():
+        ShapeProp(gm).propagate(example)
+    model.train(was_training)
+    modules = dict(model.named_modules())
+    calls: Dict[str, int] = {}
+    for node in gm.graph.nodes:
+        if node.op == "call_module":
+            calls[node.target] = calls.get(node.target, 0) + 1
+
+    def channels(node) -> int:
+        return node.meta["tensor_meta"].shape[1]
+
+    def follow(node, offset: int, deps: Dict[str, list]) -> bool:
+        for user in node.users:
+            if user.op == "call_module":
+                module = modules[user.target]
+                # reused stateless layers are fine, reused weights would need the same pruning everywhere
+                if calls[user.target] > 1 and not isinstance(module, PASSTHROUGH_MODULES):
+                    return False
+                if _is_producer(module):
+                    deps["inputs"].append((user.target, offset))
+                    continue
+                if isinstance(module, nn.BatchNorm2d) or _is_depthwise(module):
+                    deps["channels"].append((user.target, offset))
+                elif not isinstance(module, PASSTHROUGH_MODULES):
+                    return False
+                if not follow(user, offset, deps):
+                    return False
+            elif user.op in ("call_function", "call_method"):
+                name = _callable_name(user.target)
+                if name == "cat":
+                    tensors = user.args[0]
+                    dim = user.args[1] if len(user.args) > 1 else user.kwargs.get("dim", 0)
+                    if dim not in (1, -3) or list(tensors).count(node) != 1:
+                        return False
+                    shift = sum(channels(t) for t in tensors[: list(tensors).index(node)])
+                    if not follow(user, offset + shift, deps):
+                        return False
+                elif name in PASSTHROUGH_FUNCTIONS and user.args and user.args[0] is node:
+                    if not follow(user, offset, deps):
+                        return False
+                else:
+                    return False
+            else:
+                # model output
+                return False
+        return True
+
+    out: Dict[str, Optional[Dict[str, Any]]] = {}
+    for node in gm.graph.nodes:
+        if node.op != "call_module" or not _is_producer(modules[node.target]):
+            continue
+        deps: Dict[str, list] = {"channels": [], "inputs": []}
+        prunable = calls[node.target] == 1 and follow(node, 0, deps)
+        out[node.target] = deps if prunable else None
+    return out
+
+
+def channel_importance(conv: nn.Module, criterion: str = "l1") -> Tensor:
+    """Norm of the filter of every output channel"""
+    weight = conv.weight.detach()
+    # ConvTranspose2d weights are in x out x kh x kw
+    dims = (1, 2, 3) if isinstance(conv, nn.Conv2d) else (0, 2, 3)
+    if criterion == "l1":
+        return weight.abs().sum(dims)
+    if criterion == "l2":
+        return weight.pow(2).sum(dims).sqrt()
+    raise ValueError(f"Unknown pruning criterion {criterion}, use l1 or l2")
+
+
+def _select(param: Optional[Tensor], dim: int, keep: Tensor) -> Optional[nn.Parameter]:
+    if param is None:
+        return None
+    data = param.data.index_select(dim, keep.to(param.device)).clone()
+    return nn.Parameter(data, requires_grad=param.requires_grad)
+
+
+def _prune_module(module: nn.Module, keep_in: Optional[Tensor] = None, keep_out: Optional[Tensor] = None) -> None:
+    if isinstance(module, nn.BatchNorm2d):
+        keep = keep_out if keep_out is not None else keep_in
+        module.weight = _select(module.weight, 0, keep)
+        module.bias = _select(module.bias, 0, keep)
+        module.running_mean = module.running_mean.index_select(0, keep.to(module.running_mean.device))
+        module.running_var = module.running_var.index_select(0, keep.to(module.running_var.device))
+        module.num_features = len(keep)
+        return
+    if _is_depthwise(module):
+        keep = keep_out if keep_out is not None else keep_in
+        module.weight = _select(module.weight, 0, keep)
+        module.bias = _select(module.bias, 0, keep)
+        module.in_channels = module.out_channels = module.groups = len(keep)
+        return
+    out_dim, in_dim = (0, 1) if isinstance(module, nn.Conv2d) else (1, 0)
+    if keep_out is not None:
+        module.weight = _select(module.weight, out_dim, keep_out)
+        module.bias = _select(module.bias, 0, keep_out)
+        module.out_channels = len(keep_out)
+    if keep_in is not None:
+        module.weight = _select(module.weight, in_dim, keep_in)
+        module.in_channels = len(keep_in)
+
+
+def module_shapes(model: nn.Module, names: Sequence[str]) -> Dict[str, Dict[str, int]]:
+    modules = dict(model.named_modules())
+    shapes = {}
+    for name in names:
+        module = modules[name]
+        if isinstance(module, nn.BatchNorm2d):
+            shapes[name] = {"num_features": module.num_features}
+        else:
+            shapes[name] = {"in_channels": module.in_channels, "out_channels": module.out_channels}
+    return shapes
+
+
+def prune_channels(
+    model: nn.Module,
+    example: Tensor,
+    amount: float = 0.3,
+    criterion: str = "l1",
+    round_to: int = 1,
+    min_channels: int = 4,
+    exclude: Sequence[str] = (),
+) -> Dict[str, Dict[str, int]]:
+    r"""Remove the least important output channels of every prunable convolution in place
+
+    Args:
+        model (nn.Module): model traceable by `torch.fx`
+        example (Tensor): example input on the model device
+        amount (float, optional): fraction of the channels removed from every convolution. Defaults to 0.3.
+        criterion (str, optional): "l1" or "l2" norm of the filters. Defaults to "l1".
+        round_to (int, optional): kept channels rounded up to a multiple of it, e.g. 8 for SIMD friendly widths. Defaults to 1.
+        min_channels (int, optional): channels kept at least. Defaults to 4.
+        exclude (Sequence[str], optional): module name patterns never pruned, e.g. "down1.*". Defaults to ().
+
+    Returns:
+        Dict[str, Dict[str, int]]: new widths of the changed modules, see `apply_shapes`
+    """
+    assert 0.0 <= amount < 1.0, "amount must be in [0, 1)"
+    modules = dict(model.named_modules())
+    dependencies = channel_dependencies(model, example)
+    # removed input / output channels of every module, several convolutions may feed one module
+    removed_in: Dict[str, Set[int]] = {}
+    removed_out: Dict[str, Set[int]] = {}
+    for name, deps in dependencies.items():
+        if deps is None or any(fnmatch.fnmatch(name, p) for p in exclude):
+            continue
+        conv = modules[name]
+        width = conv.out_channels
+        keep = max(min_channels, int(round(width * (1 - amount))))
+        keep = min(width, -(-keep // round_to) * round_to)
+        if keep == width:
+            continue
+        order = channel_importance(conv, criterion).argsort(descending=True)
+        dropped = set(order[keep:].tolist())
+        removed_out.setdefault(name, set()).update(dropped)
+        for target, offset in deps["channels"]:
+            removed_out.setdefault(target, set()).update(offset + c for c in dropped)
+        for target, offset in deps["inputs"]:
+            removed_in.setdefault(target, set()).update(offset + c for c in dropped)
+
+    def keep_index(width: int, removed: Set[int]) -> Tensor:
+        return torch.tensor([c for c in range(width) if c not in removed], dtype=torch.long)
+
+    changed = list(dict.fromkeys([*removed_out, *removed_in]))
+    for name in changed:
+        module = modules[name]
+        if isinstance(module, nn.BatchNorm2d):
+            _prune_module(module, keep_out=keep_index(module.num_features, removed_out[name]))
+            continue
+        _prune_module(
+            module,
+            keep_in=keep_index(module.in_channels, removed_in[name]) if name in removed_in else None,
+            keep_out=keep_index(module.out_channels, removed_out[name]) if name in removed_out else None,
+        )
+    return module_shapes(model, changed)
+
+
+def apply_shapes(model: nn.Module, shapes: Dict[str, Dict[str, int]]) -> nn.Module:
+    """Resize the modules of a freshly built model to a pruned shape spec, before loading its weights"""
+    modules = dict(model.named_modules())
+    for name, shape in shapes.items():
+        module = modules[name]
+        if isinstance(module, nn.BatchNorm2d):
+            _prune_module(module, keep_out=torch.arange(shape["num_features"]))
+        elif _is_depthwise(module):
+            _prune_module(module, keep_out=torch.arange(shape["out_channels"]))
+        else:
+            _prune_module(
+                module,
+                keep_in=torch.arange(shape["in_channels"]),
+                keep_out=torch.arange(shape["out_channels"]),
+            )
+    return model
+
+
+def model_report(model: nn.Module, example: Tensor, repeat: int = 20) -> Dict[str, float]:
+    was_training = model.training
+    model.eval()
+    report = {
+        "params": count_params(model),
+        "gflops": count_flops(model, example) / 1e9,
+        "latency_ms": measure_latency(model, example, repeat=repeat),
+    }
+    model.train(was_training)
+    return report
+
+
+def print_report(before: Dict[str, float], after: Dict[str, float]) -> None:
+    logging.info(f"{'':<12}{'before':>14}{'after':>14}{'ratio':>10}")
+    for key in before:
+        ratio = after[key] / before[key] if before[key] else float("nan")
+        logging.info(f"{key:<12}{before[key]:>14.4g}{after[key]:>14.4g}{ratio:>10.3f}")
+
+
+def prune_from_cfg(
+    model: nn.Module, cfg: Dict[str, Any], device="cpu"
+) -> Tuple[Dict[str, Dict[str, int]], Dict[str, Dict[str, float]]]:
+    r"""Prune a model from the `pruning` section of a pipeline config
+
+    Keys: `checkpoint` (dense weights loaded first, optional), `input_shape`
+    (example input, defaults to [1, 3, 224, 224]) and the `prune_channels`
+    args `amount`, `criterion`, `round_to`, `min_channels` and `exclude`.
+
+    Returns:
+        Tuple[Dict[str, Dict[str, int]], Dict[str, Dict[str, float]]]: shape spec, before / after report
+    """
+    from nncore.utils.utils import load_model
+
+    cfg = dict(cfg)
+    checkpoint = cfg.pop("checkpoint", None)
+    if checkpoint is not None:
+        load_model(model, checkpoint, verbose=False)
+    example = torch.rand(*cfg.pop("input_shape", [1, 3, 224, 224]), device=device)
+    before = model_report(model, example)
+    shapes = prune_channels(model, example, **cfg)
+    after = model_report(model, example)
+    print_report(before, after)
+    return shapes, {"before": before, "after": after}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prune the channels of a trained checkpoint folder")
+    parser.add_argument("checkpoint_dir", help="folder with config.yaml and the checkpoints")
+    parser.add_argument("--checkpoint", default="best_loss.pth")
+    parser.add_argument("--output-dir", required=True, help="folder of the pruned checkpoint")
+    parser.add_argument("--amount", type=float, default=0.3, help="fraction of the channels removed")
+    parser.add_argument("--criterion", choices=["l1", "l2"], default="l1")
+    parser.add_argument("--round-to", type=int, default=1, help="round kept channels up to a multiple")
+    parser.add_argument("--min-channels", type=int, default=4)
+    parser.add_argument("--exclude", nargs="*", default=[], help="module name patterns to keep")
+    parser.add_argument("--input-shape", type=int, nargs=4, default=[1, 3, 224, 224])
+    parser.add_argument("--imports", nargs="*", default=[], help="modules registering custom models")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    import importlib
+    from pathlib import Path
+
+    import yaml
+
+    for module in args.imports:
+        importlib.import_module(module)
+    from nncore.segmentation.inference import load_checkpoint_model
+
+    model, cfg = load_checkpoint_model(args.checkpoint_dir, args.checkpoint)
+    example = torch.rand(*args.input_shape)
+    before = model_report(model, example)
+    shapes = prune_channels(
+        model, example, args.amount, args.criterion, args.round_to, args.min_channels, args.exclude
+    )
+    after = model_report(model, example)
+    print_report(before, after)
+    logging.info(f"{len(shapes)} modules resized")
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    cfg["pruned_shapes"] = {**(cfg.get("pruned_shapes") or {}), **shapes}
+    with open(output_dir / "config.yaml", "w") as f:
+        yaml.dump(cfg, f, default_flow_style=False)
+    torch.save({"model_state_dict": model.state_dict()}, output_dir / args.checkpoint)
+    logging.info(f"Saved to {output_dir / args.checkpoint}")
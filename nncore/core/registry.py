@@ -1,8 +1,7 @@
 # Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
 # pyre-ignore-all-errors[2,3]
-from typing import Any, Dict, Iterable, Iterator, Tuple
-
-from tabulate import tabulate
+import importlib
+from typing import Any, Callable, Dict, Iterable, Iterator, Tuple, Union
 
 class Registry(Iterable[Tuple[str, Any]]):
     """
@@ -19,6 +18,11 @@ class Registry(Iterable[Tuple[str, Any]]):
     Or:
     .. code-block:: python
         BACKBONE_REGISTRY.register(MyBackbone)
+    To register a name without importing its module yet:
+    .. code-block:: python
+        BACKBONE_REGISTRY.register_lazy('MyBackbone', 'mypackage.backbone')
+    The module is imported by the first `get('MyBackbone')` and registers the
+    object itself. Use 'module:attr' for objects their module does not register.
     """
 
     def __init__(self, name: str) -> None:
@@ -28,6 +32,7 @@ class Registry(Iterable[Tuple[str, Any]]):
         """
         self._name: str = name
         self._obj_map: Dict[str, Any] = {}
+        self._lazy_map: Dict[str, str] = {}
 
     def _do_register(self, name: str, obj: Any) -> None:
         assert (
@@ -36,6 +41,25 @@ class Registry(Iterable[Tuple[str, Any]]):
             name, self._name
         )
         self._obj_map[name] = obj
+        self._lazy_map.pop(name, None)
+
+    def register_lazy(self, names: Union[str, Iterable[str]], module: str) -> None:
+        """
+        Register names resolved by importing `module` on their first `get`.
+        `module` is a module path, or 'module:attr' to register `attr` of it.
+        """
+        for name in [names] if isinstance(names, str) else names:
+            if name not in self._obj_map:
+                self._lazy_map[name] = module
+
+    def _load(self, name: str) -> None:
+        module, _, attr = self._lazy_map[name].partition(":")
+        mod = importlib.import_module(module)
+        if name not in self._obj_map and attr:
+            self._do_register(name, getattr(mod, attr))
+        assert name in self._obj_map, "Importing '{}' did not register '{}' in '{}' registry!".format(
+            module, name, self._name
+        )
 
     def register(self, obj: Any = None) -> Any:
         """
@@ -56,6 +80,8 @@ class Registry(Iterable[Tuple[str, Any]]):
         self._do_register(name, obj)
 
     def get(self, name: str) -> Any:
+        if name not in self._obj_map and name in self._lazy_map:
+            self._load(name)
         ret = self._obj_map.get(name)
         if ret is None:
             raise KeyError(
@@ -64,17 +90,44 @@ class Registry(Iterable[Tuple[str, Any]]):
         return ret
 
     def __contains__(self, name: str) -> bool:
-        return name in self._obj_map
+        return name in self._obj_map or name in self._lazy_map
 
     def __repr__(self) -> str:
+        from tabulate import tabulate
+
         table_headers = ["Names", "Objects"]
-        table = tabulate(
-            self._obj_map.items(), headers=table_headers, tablefmt="fancy_grid"
-        )
+        rows = list(self._obj_map.items()) + [
+            (name, "<lazy: {}>".format(module)) for name, module in self._lazy_map.items()
+        ]
+        table = tabulate(rows, headers=table_headers, tablefmt="fancy_grid")
         return "Registry of {}:\n".format(self._name) + table
 
     def __iter__(self) -> Iterator[Tuple[str, Any]]:
+        # iterating resolves every lazy name
+        for name in list(self._lazy_map):
+            if name in self._lazy_map:
+                self._load(name)
         return iter(self._obj_map.items())
 
     # pyre-fixme[4]: Attribute must be annotated.
     __str__ = __repr__
+
+
+def lazy_import(package: str, attrs: Dict[str, str]) -> Callable[[str], Any]:
+    """
+    Module `__getattr__` (PEP 562) importing the attributes of a package on
+    first access, so `from package import Name` keeps working without the
+    package importing every submodule up front.
+    .. code-block:: python
+        __getattr__ = lazy_import(__name__, {'MyBackbone': '.backbone'})
+    Args:
+        package (str): `__name__` of the package
+        attrs (Dict[str, str]): attribute name -> module, relative to the package
+    """
+
+    def __getattr__(name: str) -> Any:
+        if name not in attrs:
+            raise AttributeError("module '{}' has no attribute '{}'".format(package, name))
+        return getattr(importlib.import_module(attrs[name], package), name)
+
+    return __getattr__
@@ -0,0 +1,221 @@
+"""Per-run metrics store
+
+Every run keeps its scalars in `<save_dir>/metrics.sqlite`, written by the
+`sqlite` log backend:
+
+-   metrics(time, step, tag, value): append-only, every logged scalar
+-   info(key, value): run information as JSON values, e.g. config, config_hash, status
+
+The CLI ranks the runs of a directory from these files, without TensorBoard:
+
+    python -m nncore.core.runstore runs --metric val/loss --mode min --top 10
+    python -m nncore.core.runstore runs --metric val/PixelAccuracy --mode max --group-by config_hash
+"""
+import argparse
+import csv
+import hashlib
+import json
+import math
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+STORE_NAME = "metrics.sqlite"
+
+# opts that name or place a run without changing what it trains
+RUN_KEYS = (
+    "id", "save_dir", "seed", "pretrained", "resume", "gpus", "gpus_str",
+    "verbose", "log_backend", "cfg_pipeline", "config_path", "debug",
+)
+
+
+def config_hash(opt: Dict[str, Any], pipeline: Dict[str, Any]) -> str:
+    """Hash of the opts and pipeline config, runs that only differ by seed or name share it"""
+    opt = {k: v for k, v in opt.items() if k not in RUN_KEYS}
+    data = json.dumps({"opt": opt, "pipeline": pipeline}, sort_keys=True, default=str)
+    return hashlib.sha1(data.encode()).hexdigest()[:12]
+
+
+class RunStore:
+    r"""SQLite metrics file of one run
+
+    Args:
+        path: run directory or the sqlite file
+        readonly (bool, optional): open an existing store for queries. Defaults to False.
+    """
+
+    def __init__(self, path, readonly: bool = False):
+        path = Path(path)
+        self.path = path / STORE_NAME if path.suffix != ".sqlite" else path
+        if readonly:
+            self.conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            return
+        # written from the logger thread
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS metrics (time REAL, step INTEGER, tag TEXT, value REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS metrics_tag ON metrics (tag, step)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+
+    def add_scalars(self, records: Iterable[Tuple[float, int, str, float]]) -> None:
+        """Append (time, step, tag, value) rows"""
+        self.conn.executemany("INSERT INTO metrics VALUES (?, ?, ?, ?)", records)
+
+    def set_info(self, info: Dict[str, Any]) -> None:
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO info VALUES (?, ?)",
+            [(k, json.dumps(v, default=str)) for k, v in info.items()],
+        )
+
+    def info(self) -> Dict[str, Any]:
+        return {k: json.loads(v) for k, v in self.conn.execute("SELECT key, value FROM info")}
+
+    def tags(self) -> List[str]:
+        return [t for t, in self.conn.execute("SELECT DISTINCT tag FROM metrics")]
+
+    def series(self, tag: str) -> List[Tuple[int, float]]:
+        """(step, value) of a tag in logging order"""
+        return list(
+            self.conn.execute("SELECT step, value FROM metrics WHERE tag = ? ORDER BY rowid", (tag,))
+        )
+
+    def summary(self, tag: str) -> Dict[str, Optional[float]]:
+        """min, max, last value and count of a tag"""
+        low, high, count = self.conn.execute(
+            "SELECT MIN(value), MAX(value), COUNT(*) FROM metrics WHERE tag = ?", (tag,)
+        ).fetchone()
+        last = self.conn.execute(
+            "SELECT value FROM metrics WHERE tag = ? ORDER BY rowid DESC LIMIT 1", (tag,)
+        ).fetchone()
+        return {"min": low, "max": high, "last": last[0] if last else None, "count": count}
+
+    def flush(self) -> None:
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.commit()
+        self.conn.close()
+
+
+def get_key(cfg: Dict[str, Any], key: str) -> Any:
+    """Dotted key of a nested config, None when missing"""
+    for k in key.split("."):
+        if not isinstance(cfg, dict) or k not in cfg:
+            return None
+        cfg = cfg[k]
+    return cfg
+
+
+def load_runs(
+    root, metric: str, mode: str = "min", show: Sequence[str] = ()
+) -> List[Dict[str, Any]]:
+    r"""One row per run under `root` with the best value of `metric`
+
+    Args:
+        root: directory searched recursively for metrics stores
+        metric (str): tag to rank by, e.g. val/loss
+        mode (str, optional): "min" or "max". Defaults to "min".
+        show (Sequence[str], optional): dotted config keys added as columns, e.g. pipeline.optimizer.args.lr. Defaults to ().
+
+    Returns:
+        List[Dict[str, Any]]: runs sorted best first, runs without the metric last
+    """
+    rows = []
+    for path in sorted(Path(root).rglob(STORE_NAME)):
+        store = RunStore(path, readonly=True)
+        try:
+            info = store.info()
+            summary = store.summary(metric)
+            speed = store.summary("perf/samples_per_sec")
+            memory = store.summary("perf/peak_memory_mb")
+            epochs = store.summary("perf/epoch_time_s")
+        finally:
+            store.conn.close()
+        row = {
+            "run": str(path.parent.relative_to(root)),
+            "status": info.get("status"),
+            "config_hash": info.get("config_hash"),
+            "best": summary[mode],
+            "last": summary["last"],
+            "epochs": epochs["count"],
+            "samples_per_sec": speed["last"],
+            "peak_memory_mb": memory["max"],
+        }
+        for key in show:
+            row[key] = get_key(info.get("config") or {}, key)
+        rows.append(row)
+    return rank_rows(rows, "best", mode)
+
+
+def group_runs(rows: List[Dict[str, Any]], key: str, mode: str = "min") -> List[Dict[str, Any]]:
+    """Mean and std of the best value over runs sharing `key`, e.g. seeds of a config"""
+    groups: Dict[Any, List[Dict[str, Any]]] = {}
+    for row in rows:
+        groups.setdefault(row.get(key), []).append(row)
+    out = []
+    for value, members in groups.items():
+        best = [r["best"] for r in members if r["best"] is not None]
+        mean = sum(best) / len(best) if best else None
+        std = math.sqrt(sum((b - mean) ** 2 for b in best) / len(best)) if best else None
+        out.append({key: value, "runs": len(members), "mean": mean, "std": std, "example": members[0]["run"]})
+    return rank_rows(out, "mean", mode)
+
+
+def rank_rows(rows: List[Dict[str, Any]], key: str, mode: str = "min") -> List[Dict[str, Any]]:
+    """Rows sorted best first by `key`, rows without a value last"""
+    sign = 1.0 if mode == "min" else -1.0
+    return sorted(rows, key=lambda r: (r.get(key) is None, sign * (r.get(key) or 0.0)))
+
+
+def _fields(rows: List[Dict[str, Any]]) -> List[str]:
+    return list(dict.fromkeys(k for r in rows for k in r))
+
+
+def write_csv(rows: List[Dict[str, Any]], path) -> None:
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=_fields(rows))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def print_table(rows: List[Dict[str, Any]], exclude: Sequence[str] = ()) -> None:
+    """Print rows as an aligned table, floats with 6 significant digits"""
+    if not rows:
+        print("No runs found")
+        return
+    fields = [k for k in _fields(rows) if k not in exclude]
+    table = [
+        [f"{r[k]:.6g}" if isinstance(r.get(k), float) else str(r.get(k, "")) for k in fields]
+        for r in rows
+    ]
+    widths = [max(len(k), *(len(row[i]) for row in table)) for i, k in enumerate(fields)]
+    print(" | ".join(k.ljust(w) for k, w in zip(fields, widths)))
+    print("-+-".join("-" * w for w in widths))
+    for row in table:
+        print(" | ".join(v.ljust(w) for v, w in zip(row, widths)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aggregate and rank runs from their metrics stores")
+    parser.add_argument("root", help="runs directory")
+    parser.add_argument("--metric", default="val/loss", help="tag to rank by")
+    parser.add_argument("--mode", choices=["min", "max"], default="min")
+    parser.add_argument("--top", type=int, help="only show the best runs")
+    parser.add_argument("--show", nargs="*", default=[], help="dotted config keys to show, e.g. pipeline.optimizer.args.lr")
+    parser.add_argument("--group-by", help="aggregate runs sharing this column, e.g. config_hash")
+    parser.add_argument("--csv", help="also write the table to this file")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    rows = load_runs(args.root, args.metric, args.mode, args.show)
+    if args.group_by:
+        rows = group_runs(rows, args.group_by, args.mode)
+    rows = rows[: args.top] if args.top else rows
+    print_table(rows)
+    if args.csv and rows:
+        write_csv(rows, args.csv)
+    print(f"\n{len(rows)} rows in {time.perf_counter() - start:.2f}s")
@@ -1 +1,3 @@
 from torch.optim.lr_scheduler import ReduceLROnPlateau, StepLR
+
+from .scheduler import LRScheduler
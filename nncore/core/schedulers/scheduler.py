@@ -0,0 +1,128 @@
+from typing import Any, Dict, List, Optional
+
+from torch.optim.lr_scheduler import ReduceLROnPlateau
+
+__all__ = ["LRScheduler"]
+
+# schedules that are defined over iterations rather than epochs
+ITERATION_SCHEDULERS = ("OneCycleLR", "CyclicLR")
+
+
+class LRScheduler:
+    r"""LRScheduler wraps a torch lr scheduler with its stepping policy
+
+    Declares whether the wrapped scheduler steps every iteration or every
+    epoch and whether it needs a metric (e.g. `ReduceLROnPlateau`), and adds
+    an optional linear warmup over the first iterations. The learner calls
+    `step_iteration` after every optimizer step and `step_epoch` at the end of
+    every epoch; each call is a no-op when it does not match the policy.
+
+    During warmup the lr of each group is `target_lr * factor`, with the
+    factor growing linearly from `warmup_start` to 1. The wrapped scheduler
+    still sees and updates the unscaled target lr. An iteration scheduler
+    only starts stepping after the warmup; `get_scheduler` shortens the
+    cycle of `OneCycleLR` by `warmup_steps` accordingly.
+
+    Args:
+        scheduler: torch lr scheduler, or None for a constant lr
+        optimizer (Optimizer): optimizer of the scheduler
+        interval (Optional[str], optional): "iteration" or "epoch". Defaults to "iteration" for OneCycleLR/CyclicLR, else "epoch".
+        warmup_steps (int, optional): number of warmup iterations. Defaults to 0.
+        warmup_start (float, optional): lr factor of the first iteration. Defaults to 0.001.
+    """
+
+    def __init__(
+        self,
+        scheduler,
+        optimizer,
+        interval: Optional[str] = None,
+        warmup_steps: int = 0,
+        warmup_start: float = 0.001,
+    ):
+        self.scheduler = scheduler
+        self.optimizer = optimizer
+        if interval is None:
+            interval = (
+                "iteration"
+                if type(scheduler).__name__ in ITERATION_SCHEDULERS
+                else "epoch"
+            )
+        assert interval in (
+            "iteration",
+            "epoch",
+        ), f"Unknown scheduler interval {interval}"
+        self.interval = interval
+        self.needs_metric = isinstance(scheduler, ReduceLROnPlateau)
+        self.warmup_steps = warmup_steps
+        self.warmup_start = warmup_start
+        self.num_iterations = 0
+        self.target_lrs: List[float] = [g["lr"] for g in optimizer.param_groups]
+        if self.warming_up:
+            self._apply_warmup()
+
+    @property
+    def warming_up(self) -> bool:
+        return self.num_iterations < self.warmup_steps
+
+    def _apply_warmup(self) -> None:
+        progress = self.num_iterations / self.warmup_steps
+        factor = self.warmup_start + (1 - self.warmup_start) * progress
+        for group, lr in zip(self.optimizer.param_groups, self.target_lrs):
+            group["lr"] = lr * factor
+
+    def _step(self, *args) -> None:
+        if self.scheduler is None:
+            return
+        if not self.warming_up:
+            self.scheduler.step(*args)
+            return
+        # let the wrapped scheduler update the unscaled lr
+        for group, lr in zip(self.optimizer.param_groups, self.target_lrs):
+            group["lr"] = lr
+        self.scheduler.step(*args)
+        self.target_lrs = [g["lr"] for g in self.optimizer.param_groups]
+        self._apply_warmup()
+
+    def step_iteration(self) -> None:
+        """Call after every optimizer step"""
+        if self.warming_up:
+            self.num_iterations += 1
+            if self.warming_up:
+                self._apply_warmup()
+            else:
+                for group, lr in zip(self.optimizer.param_groups, self.target_lrs):
+                    group["lr"] = lr
+            return
+        self.num_iterations += 1
+        if self.interval == "iteration":
+            self._step()
+
+    def step_epoch(self, metric: Optional[float] = None) -> None:
+        """Call at the end of every epoch, with the validation metric if there was a validation"""
+        if self.interval != "epoch":
+            return
+        if self.needs_metric:
+            if metric is not None:
+                self._step(metric)
+        else:
+            self._step()
+
+    def state_dict(self) -> Dict[str, Any]:
+        return {
+            "scheduler": self.scheduler.state_dict() if self.scheduler is not None else None,
+            "num_iterations": self.num_iterations,
+            "target_lrs": self.target_lrs,
+        }
+
+    def load_state_dict(self, state: Dict[str, Any]) -> None:
+        if "num_iterations" not in state:
+            # state of a bare torch scheduler
+            state = {
+                "scheduler": state,
+                "num_iterations": self.num_iterations,
+                "target_lrs": self.target_lrs,
+            }
+        if self.scheduler is not None and state.get("scheduler") is not None:
+            self.scheduler.load_state_dict(state["scheduler"])
+        self.num_iterations = state["num_iterations"]
+        self.target_lrs = state["target_lrs"]
@@ -1,11 +1,16 @@
+import time
+from typing import Any, Callable, Dict, Optional
+
 import torch
 from torch.nn import Module
 from torch.utils.data.dataloader import DataLoader
 from tqdm.auto import tqdm
 
+from .inference import TestTimeAugmentation
 from .metrics.metric_template import Metric
+from .models.wrapper import ModelWithLoss
 from nncore.utils.meter import AverageValueMeter
-from nncore.utils.device import detach, move_to
+from nncore.utils.device import DevicePrefetcher, detach
 
 
 @torch.no_grad()
@@ -16,15 +21,22 @@ def evaluate(
     device: torch.device,
     verbose: bool = True,
     return_last_batch: bool = False,
+    batch_transform: Optional[Callable] = None,
+    tta: Optional[Dict[str, Any]] = None,
 ):
+    if tta:
+        # augmented views are batched through the inner model, the loss is taken on the merged logits
+        model = ModelWithLoss(TestTimeAugmentation(model.model, **tta), model.criterion)
     running_loss = AverageValueMeter()
     for m in metric.values():
         m.reset()
     model.eval()
-    progress_bar = tqdm(dataloader) if verbose else dataloader
+    # 1: Load inputs and labels, prefetched to device one batch ahead
+    batches = DevicePrefetcher(dataloader, device)
+    progress_bar = tqdm(batches) if verbose else batches
     for i, batch in enumerate(progress_bar):
-        # 1: Load inputs and labels
-        batch = move_to(batch, device)
+        if batch_transform is not None:
+            batch = batch_transform(batch)
 
         # 2: Calculate the loss
         out_dict = model(batch)
@@ -41,3 +53,59 @@ def evaluate(
         last_batch_pred = outs, batch
         return last_batch_pred, avg_loss, metric
     return avg_loss, metric
+
+
+def compare_tta(
+    model: Module,
+    dataloader: DataLoader,
+    metric: Metric,
+    device: torch.device,
+    tta: Dict[str, Any],
+    verbose: bool = True,
+    batch_transform: Optional[Callable] = None,
+) -> Dict[str, Any]:
+    r"""Evaluate with and without test-time augmentation
+
+    Prints the loss and metrics of both runs with the gain of TTA next to its
+    latency multiplier.
+
+    Args:
+        model (Module): model with loss
+        dataloader (DataLoader): evaluation dataloader
+        metric (Metric): metrics
+        device (torch.device): device
+        tta (Dict[str, Any]): `TestTimeAugmentation` args
+        verbose (bool, optional): progress bars. Defaults to True.
+        batch_transform (Optional[Callable], optional): on-device batch transform. Defaults to None.
+
+    Returns:
+        Dict[str, Any]: loss and metric values of both runs, and the latency multiplier
+    """
+    results = {}
+    for name, cfg in (("base", None), ("tta", tta)):
+        start = time.perf_counter()
+        avg_loss, metric = evaluate(
+            model=model,
+            dataloader=dataloader,
+            metric=metric,
+            device=device,
+            verbose=verbose,
+            batch_transform=batch_transform,
+            tta=cfg,
+        )
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        results[name] = {
+            "seconds": time.perf_counter() - start,
+            "loss": avg_loss,
+            **{k: m.value() for k, m in metric.items()},
+        }
+    results["latency_multiplier"] = results["tta"]["seconds"] / results["base"]["seconds"]
+
+    views = TestTimeAugmentation(model.model, **tta).num_views
+    print(f"Test-time augmentation, {views} views, x{results['latency_multiplier']:.2f} latency")
+    print(f"{'':<16}{'base':>12}{'tta':>12}{'gain':>12}")
+    for k in ["loss", *metric.keys()]:
+        base, aug = results["base"][k], results["tta"][k]
+        print(f"{k:<16}{base:>12.6f}{aug:>12.6f}{aug - base:>+12.6f}")
+    return results
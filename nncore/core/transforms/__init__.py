@@ -0,0 +1,12 @@
+from nncore.core.registry import Registry
+TRANSFORM_REGISTRY = Registry('TRANSFORM')
+
+from .batch import (
+    BatchCompose,
+    BatchNormalize,
+    BatchRandomCrop,
+    BatchRandomHorizontalFlip,
+    BatchRandomVerticalFlip,
+    BatchResize,
+    BatchToFloat,
+)
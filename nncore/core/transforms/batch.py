@@ -0,0 +1,196 @@
+from typing import Any, Dict, List, Sequence, Tuple
+
+import torch
+from torch import nn
+from torch.nn import functional as F
+
+from nncore.core.datasets.normalization import IMAGENET_MEAN, IMAGENET_STD, normalization
+
+from . import TRANSFORM_REGISTRY
+
+
+@TRANSFORM_REGISTRY.register()
+class BatchCompose(nn.Module):
+    r"""Apply batch transforms in order
+
+    Batch transforms run on whole batches after they are moved to device, so
+    dataloader workers only need to decode and collate uint8 tensors. Every
+    transform takes and returns a batch dict with an "input" tensor
+    (B x C x H x W) and an optional "mask" tensor (B x H x W); geometric
+    transforms apply the same operation to both.
+
+    Args:
+        transforms (List[nn.Module]): batch transforms
+
+    Examples:
+
+        transform = BatchCompose([
+            BatchNormalize(),
+            BatchResize(size=(224, 224)),
+            BatchRandomHorizontalFlip(p=0.5),
+        ])
+        batch = transform(move_to(batch, device))
+    """
+
+    def __init__(self, transforms: List[nn.Module]):
+        super().__init__()
+        self.transforms = nn.ModuleList(transforms)
+
+    @torch.no_grad()
+    def forward(self, batch: Dict[str, Any]) -> Dict[str, Any]:
+        for t in self.transforms:
+            batch = t(batch)
+        return batch
+
+    @classmethod
+    def from_cfg(cls, cfg: List[Dict[str, Any]], getter):
+        return cls([getter(t, registry=TRANSFORM_REGISTRY) for t in cfg])
+
+
+@TRANSFORM_REGISTRY.register()
+class BatchToFloat(nn.Module):
+    r"""Convert uint8 inputs to float in [0, 1]
+
+    Args:
+        max_pixel_value (float, optional): value mapped to 1. Defaults to 255.
+    """
+
+    def __init__(self, max_pixel_value: float = 255.0):
+        super().__init__()
+        self.max_pixel_value = max_pixel_value
+        self.normalization = normalization((0.0, 0.0, 0.0), (max_pixel_value / 255.0,) * 3)
+
+    def forward(self, batch: Dict[str, Any]) -> Dict[str, Any]:
+        batch["input"] = batch["input"].float().div_(self.max_pixel_value)
+        return batch
+
+
+@TRANSFORM_REGISTRY.register()
+class BatchNormalize(nn.Module):
+    r"""Convert inputs to float and normalize them, same formula as `A.Normalize`
+
+    Args:
+        mean (Sequence[float], optional): channel mean. Defaults to ImageNet mean.
+        std (Sequence[float], optional): channel std. Defaults to ImageNet std.
+        max_pixel_value (float, optional): input value range. Defaults to 255.
+    """
+
+    def __init__(
+        self,
+        mean: Sequence[float] = IMAGENET_MEAN,
+        std: Sequence[float] = IMAGENET_STD,
+        max_pixel_value: float = 255.0,
+    ):
+        super().__init__()
+        # the same mean and std for images scaled to [0, 1]
+        scale = max_pixel_value / 255.0
+        self.normalization = normalization([m * scale for m in mean], [s * scale for s in std])
+        mean = torch.tensor(mean).view(1, -1, 1, 1) * max_pixel_value
+        std = torch.tensor(std).view(1, -1, 1, 1) * max_pixel_value
+        self.register_buffer("mean", mean, persistent=False)
+        self.register_buffer("std", std, persistent=False)
+
+    def forward(self, batch: Dict[str, Any]) -> Dict[str, Any]:
+        x = batch["input"].float()
+        batch["input"] = (x - self.mean.to(x.device)) / self.std.to(x.device)
+        return batch
+
+
+@TRANSFORM_REGISTRY.register()
+class BatchResize(nn.Module):
+    r"""Resize inputs bilinearly and masks with nearest neighbour
+
+    Args:
+        size (Tuple[int, int]): output size (height, width)
+    """
+
+    def __init__(self, size: Tuple[int, int]):
+        super().__init__()
+        self.size = tuple(size)
+
+    def forward(self, batch: Dict[str, Any]) -> Dict[str, Any]:
+        x = batch["input"]
+        if tuple(x.shape[-2:]) == self.size:
+            return batch
+        batch["input"] = F.interpolate(
+            x.float(), size=self.size, mode="bilinear", align_corners=False
+        )
+        if "mask" in batch:
+            mask = batch["mask"]
+            batch["mask"] = (
+                F.interpolate(mask[:, None].float(), size=self.size, mode="nearest")
+                .squeeze(1)
+                .to(mask.dtype)
+            )
+        return batch
+
+
+class _BatchRandomFlip(nn.Module):
+    def __init__(self, p: float, dim: int):
+        super().__init__()
+        self.p = p
+        self.dim = dim
+
+    def forward(self, batch: Dict[str, Any]) -> Dict[str, Any]:
+        x = batch["input"]
+        flip = torch.rand(x.size(0), device=x.device) < self.p
+        batch["input"] = torch.where(flip.view(-1, 1, 1, 1), x.flip(self.dim), x)
+        if "mask" in batch:
+            mask = batch["mask"]
+            batch["mask"] = torch.where(flip.view(-1, 1, 1), mask.flip(self.dim), mask)
+        return batch
+
+
+@TRANSFORM_REGISTRY.register()
+class BatchRandomHorizontalFlip(_BatchRandomFlip):
+    r"""Flip each sample of the batch horizontally with probability p
+
+    Args:
+        p (float, optional): flip probability. Defaults to 0.5.
+    """
+
+    def __init__(self, p: float = 0.5):
+        super().__init__(p=p, dim=-1)
+
+
+@TRANSFORM_REGISTRY.register()
+class BatchRandomVerticalFlip(_BatchRandomFlip):
+    r"""Flip each sample of the batch vertically with probability p
+
+    Args:
+        p (float, optional): flip probability. Defaults to 0.5.
+    """
+
+    def __init__(self, p: float = 0.5):
+        super().__init__(p=p, dim=-2)
+
+
+@TRANSFORM_REGISTRY.register()
+class BatchRandomCrop(nn.Module):
+    r"""Crop a random window of each sample, the same window for its mask
+
+    Args:
+        size (Tuple[int, int]): crop size (height, width)
+    """
+
+    def __init__(self, size: Tuple[int, int]):
+        super().__init__()
+        self.size = tuple(size)
+
+    def forward(self, batch: Dict[str, Any]) -> Dict[str, Any]:
+        x = batch["input"]
+        h, w = self.size
+        max_y, max_x = x.size(-2) - h, x.size(-1) - w
+        assert (
+            max_y >= 0 and max_x >= 0
+        ), f"Crop size {self.size} is larger than input {tuple(x.shape[-2:])}"
+        ys = torch.randint(0, max_y + 1, (x.size(0),)).tolist()
+        xs = torch.randint(0, max_x + 1, (x.size(0),)).tolist()
+        batch["input"] = torch.stack(
+            [im[..., y : y + h, x_ : x_ + w] for im, y, x_ in zip(x, ys, xs)]
+        )
+        if "mask" in batch:
+            batch["mask"] = torch.stack(
+                [m[y : y + h, x_ : x_ + w] for m, y, x_ in zip(batch["mask"], ys, xs)]
+            )
+        return batch
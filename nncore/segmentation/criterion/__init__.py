@@ -1,3 +1,9 @@
 from nncore.core.criterion import CRITERION_REGISTRY
-from .celoss import CEwithstat
-from .diceloss import Dicewithstat
+from nncore.core.registry import lazy_import
+
+CRITERION_REGISTRY.register_lazy("CEwithstat", "nncore.segmentation.criterion.celoss")
+CRITERION_REGISTRY.register_lazy(
+    ["BinaryDiceLoss", "DiceLoss", "Dicewithstat"], "nncore.segmentation.criterion.diceloss"
+)
+
+__getattr__ = lazy_import(__name__, {"CEwithstat": ".celoss", "Dicewithstat": ".diceloss"})
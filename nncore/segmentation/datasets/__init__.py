@@ -1,2 +1,14 @@
 from nncore.core.datasets import DATASET_REGISTRY
-from .lyft_dataset import LyftDataset
+from nncore.core.registry import lazy_import
+
+# dataset modules pull in albumentations, they are imported on first use
+DATASET_REGISTRY.register_lazy(
+    ["LyftDataset", "LyftDataset.from_folder", "LyftDataset.from_manifest"],
+    "nncore.segmentation.datasets.lyft_dataset",
+)
+DATASET_REGISTRY.register_lazy("ShardDataset", "nncore.segmentation.datasets.shard_dataset")
+
+__getattr__ = lazy_import(
+    __name__,
+    {"LyftDataset": ".lyft_dataset", "ShardDataset": ".shard_dataset", "pack_shards": ".shard_dataset"},
+)
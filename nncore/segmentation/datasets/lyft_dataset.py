@@ -8,8 +8,7 @@ from glob import glob
 import albumentations as A
 from albumentations.pytorch.transforms import ToTensorV2
 
-import matplotlib.pyplot as plt
-from nncore.core.datasets import DATASET_REGISTRY
+from nncore.core.datasets import DATASET_REGISTRY, DECODER_REGISTRY, IMAGENET_MEAN, IMAGENET_STD, Manifest, normalization
 
 
 @DATASET_REGISTRY.register()
@@ -45,6 +44,8 @@ class LyftDataset(torch.utils.data.Dataset):
         image_size: Tuple[int, int] = (224, 224),
         test: bool = False,
         sample: bool = False,
+        decoder: str = "pil",
+        decode_only: bool = False,
     ):
         super(LyftDataset, self).__init__()
 
@@ -52,6 +53,10 @@ class LyftDataset(torch.utils.data.Dataset):
         self.list_mask = mask_path_ls[:4] if sample else mask_path_ls
         self.train = not (test)
         self.image_size = image_size
+        self.decode = DECODER_REGISTRY.get(decoder)
+        self.decode_only = decode_only
+        # saved with checkpoints so that inference normalizes the same way
+        self.normalization = None if decode_only else normalization(IMAGENET_MEAN, IMAGENET_STD)
         self.transform = A.Compose(
             [
                 A.Resize(height=image_size[0], width=image_size[1]),
@@ -66,14 +71,18 @@ class LyftDataset(torch.utils.data.Dataset):
 
     def __getitem__(self, idx: int) -> Tuple[Tensor, Tensor]:
 
-        im, mask = (
-            plt.imread(self.list_rgb[idx]),
-            plt.imread(self.list_mask[idx])[:, :, 0],
-        )
-        mask = (mask * 255).astype(int)  # convert label to 0 - 1 (W, H)
+        # uint8 (H, W, C) image, float conversion happens in A.Normalize
+        im = self.decode(self.list_rgb[idx])
+        mask = self.decode(self.list_mask[idx])
+        mask = mask[:, :, 0] if mask.ndim == 3 else mask  # class index (H, W)
         # mask = self.label_encoder(mask)  # convert label to one-hot encoding (W, H, 14)
         # mask = mask.T
 
+        if self.decode_only:
+            # resize and normalize are left to an on-device batch transform
+            im = torch.from_numpy(im.copy()).permute(2, 0, 1)
+            return {"input": im, "mask": torch.from_numpy(mask.copy()).long()}
+
         transformed = self.transform(image=im, mask=mask)
         im = transformed["image"]
         mask = transformed["mask"]
@@ -96,7 +105,7 @@ class LyftDataset(torch.utils.data.Dataset):
             List[str]: full path list of items in folder
         """
         folder_path = str(folder_path)
-        return glob(f"{folder_path}/*.{extension}")
+        return sorted(glob(f"{folder_path}/*.{extension}"))
 
     @classmethod
     def from_list(
@@ -108,6 +117,8 @@ class LyftDataset(torch.utils.data.Dataset):
         image_size: Tuple[int, int] = (224, 224),
         test: bool = False,
         sample: bool = False,
+        decoder: str = "pil",
+        decode_only: bool = False,
     ):
         """From list method
 
@@ -118,6 +129,8 @@ class LyftDataset(torch.utils.data.Dataset):
             transform (Optional[List], optional): rgb transform. Defaults to None.
             m_transform (Optional[List], optional): label transform. Defaults to None.
             image_size (Tuple[int, int]): image size (width, height). Defaults to (224, 224)..
+            decoder (str, optional): image decode backend in DECODER_REGISTRY. Defaults to "pil".
+            decode_only (bool, optional): return uint8 tensors without resize/normalize, for on-device batch transforms. Defaults to False.
         Returns:
             LyftDataset: dataset class
         """
@@ -129,6 +142,54 @@ class LyftDataset(torch.utils.data.Dataset):
             m_transform=m_transform,
             image_size=image_size,
             sample=sample,
+            decoder=decoder,
+            decode_only=decode_only,
+        )
+
+    @classmethod
+    def from_manifest(
+        cls,
+        manifest: str,
+        root: Optional[str] = None,
+        refresh: bool = False,
+        test: bool = False,
+        transform: Optional[List] = None,
+        m_transform: Optional[List] = None,
+        image_size: Tuple[int, int] = (224, 224),
+        sample: bool = False,
+        decoder: str = "pil",
+        decode_only: bool = False,
+    ):
+        r"""From manifest method
+
+        Args:
+            manifest (str): manifest file written by `Manifest.save`
+            root (Optional[str], optional): override the data root stored in the manifest. Defaults to None.
+            refresh (bool, optional): pick up files added or removed since the manifest was saved. Defaults to False.
+            test (bool, optional): Option using for inference mode. if True, __get_item__ does not return label. Defaults to False.
+            transform (Optional[List], optional): rgb transform. Defaults to None.
+            m_transform (Optional[List], optional): label transform. Defaults to None.
+            image_size (Tuple[int, int]): image size (width, height). Defaults to (224, 224).
+            decoder (str, optional): image decode backend in DECODER_REGISTRY. Defaults to "pil".
+            decode_only (bool, optional): return uint8 tensors without resize/normalize, for on-device batch transforms. Defaults to False.
+
+        Returns:
+            LyftDataset: dataset class
+        """
+        index = Manifest.load(manifest, root=root)
+        if refresh:
+            index.refresh()
+
+        return cls(
+            index.rgb_paths(),
+            index.mask_paths(),
+            test=test,
+            transform=transform,
+            m_transform=m_transform,
+            image_size=image_size,
+            sample=sample,
+            decoder=decoder,
+            decode_only=decode_only,
         )
 
     @classmethod
@@ -143,6 +204,8 @@ class LyftDataset(torch.utils.data.Dataset):
         m_transform: Optional[List] = None,
         image_size: Tuple[int, int] = (224, 224),
         sample: bool = False,
+        decoder: str = "pil",
+        decode_only: bool = False,
     ):
         r"""From folder method
 
@@ -155,6 +218,8 @@ class LyftDataset(torch.utils.data.Dataset):
             transform (Optional[List], optional): rgb transform. Defaults to None.
             m_transform (Optional[List], optional): label transform. Defaults to None.
             image_size (Tuple[int, int]): image size (width, height). Defaults to (224, 224).
+            decoder (str, optional): image decode backend in DECODER_REGISTRY. Defaults to "pil".
+            decode_only (bool, optional): return uint8 tensors without resize/normalize, for on-device batch transforms. Defaults to False.
 
         Returns:
             LyftDataset: dataset class
@@ -175,6 +240,9 @@ class LyftDataset(torch.utils.data.Dataset):
             m_transform=m_transform,
             image_size=image_size,
             sample=sample,
+            decoder=decoder,
+            decode_only=decode_only,
         )
 
 DATASET_REGISTRY._do_register('LyftDataset.from_folder', LyftDataset.from_folder)
+DATASET_REGISTRY._do_register('LyftDataset.from_manifest', LyftDataset.from_manifest)
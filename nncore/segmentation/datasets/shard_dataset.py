@@ -0,0 +1,227 @@
+import io
+import json
+import multiprocessing as mp
+import random
+import tarfile
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+import albumentations as A
+import numpy as np
+import torch
+from albumentations.pytorch.transforms import ToTensorV2
+from PIL import Image
+
+from nncore.core.datasets import DATASET_REGISTRY, IMAGENET_MEAN, IMAGENET_STD, normalization
+
+INDEX_NAME = "index.json"
+
+
+def pack_shards(
+    rgb_path_ls: List[str],
+    mask_path_ls: List[str],
+    out_dir: str,
+    samples_per_shard: int = 1000,
+    prefix: str = "shard",
+) -> Path:
+    """Pack (input, mask) file pairs into sequential tar shards
+
+    Files are stored as-is (no re-encoding) under `{key}.input.{ext}` and
+    `{key}.mask.{ext}`, so a shard is read with one sequential pass. An
+    `index.json` listing the shards and their sample counts is written next to them.
+
+    Args:
+        rgb_path_ls (List[str]): input file paths
+        mask_path_ls (List[str]): mask file paths, paired by position with `rgb_path_ls`
+        out_dir (str): output folder
+        samples_per_shard (int, optional): records per tar file. Defaults to 1000.
+        prefix (str, optional): shard file name prefix. Defaults to "shard".
+
+    Returns:
+        Path: path of the written index
+    """
+    assert len(rgb_path_ls) == len(
+        mask_path_ls
+    ), f"Image list and mask list should be the same number of images, but are {len(rgb_path_ls)} and {len(mask_path_ls)}"
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    pairs = list(zip(rgb_path_ls, mask_path_ls))
+    shards = []
+    for start in range(0, len(pairs), samples_per_shard):
+        name = f"{prefix}-{len(shards):06d}.tar"
+        shard_pairs = pairs[start : start + samples_per_shard]
+        with tarfile.open(out_dir / name, "w") as tar:
+            for i, (rgb_path, mask_path) in enumerate(shard_pairs, start=start):
+                for field, path in (("input", rgb_path), ("mask", mask_path)):
+                    path = Path(path)
+                    tar.add(str(path), arcname=f"{i:09d}.{field}{path.suffix}")
+        shards.append({"name": name, "num_samples": len(shard_pairs)})
+
+    index_path = out_dir / INDEX_NAME
+    with open(index_path, "w") as f:
+        json.dump({"shards": shards}, f, indent=2)
+    return index_path
+
+
+def decode_field(name: str, data: bytes) -> np.ndarray:
+    """Decode a shard member by its extension"""
+    suffix = Path(name).suffix.lower()
+    if suffix == ".npy":
+        return np.load(io.BytesIO(data))
+    with Image.open(io.BytesIO(data)) as im:
+        return np.asarray(im)
+
+
+@DATASET_REGISTRY.register()
+class ShardDataset(torch.utils.data.IterableDataset):
+    r"""ShardDataset streams (input, mask) records from tar shards
+
+    Written by `pack_shards`. Every epoch the shard order is shuffled, each
+    DataLoader worker reads its own subset of shards sequentially, and samples
+    are mixed through a streaming shuffle buffer.
+
+    Args:
+        root (str): folder holding the shards and `index.json`
+        image_size (Tuple[int, int]): image size (height, width). Defaults to (224, 224).
+        shuffle (bool, optional): shuffle shards and samples. Defaults to True.
+        shuffle_buffer (int, optional): streaming shuffle buffer size. Defaults to 1000.
+        seed (int, optional): base seed of the shard order. Defaults to 0.
+        decode_only (bool, optional): return uint8 tensors without resize/normalize, for on-device batch transforms. Defaults to False.
+
+    Examples:
+
+        pack_shards(rgb_paths, mask_paths, './shards/train')
+        dataset = ShardDataset(root='./shards/train')
+        dataloader = DataLoader(dataset, batch_size=16, num_workers=4)
+
+    Shuffling is done by the dataset itself, so the loader must not set
+    `shuffle`, and it has to be configured with separate train/val entries
+    rather than a trainval split. With DataLoader workers, call
+    `set_epoch(epoch)` before every epoch (the learners do): persistent
+    workers would repeat the same order otherwise.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        image_size: Tuple[int, int] = (224, 224),
+        shuffle: bool = True,
+        shuffle_buffer: int = 1000,
+        seed: int = 0,
+        decode_only: bool = False,
+    ):
+        super(ShardDataset, self).__init__()
+        self.root = Path(root)
+        with open(self.root / INDEX_NAME) as f:
+            self.shards = json.load(f)["shards"]
+        self.image_size = image_size
+        self.shuffle = shuffle
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+        self.decode_only = decode_only
+        self.normalization = None if decode_only else normalization(IMAGENET_MEAN, IMAGENET_STD)
+        # shared with the workers, which may outlive an epoch with persistent_workers
+        self._epoch = mp.Value("q", 0, lock=False)
+        self.transform = A.Compose(
+            [
+                A.Resize(height=image_size[0], width=image_size[1]),
+                A.Normalize(),
+                ToTensorV2(p=1.0),
+            ]
+        )
+
+    def set_epoch(self, epoch: int) -> None:
+        """Select the shard order and shuffle of the next iteration"""
+        self._epoch.value = epoch
+
+    @property
+    def epoch(self) -> int:
+        return self._epoch.value
+
+    def __len__(self) -> int:
+        return sum(shard["num_samples"] for shard in self.shards)
+
+    def __iter__(self) -> Iterator[Dict[str, torch.Tensor]]:
+        worker_info = torch.utils.data.get_worker_info()
+        worker_id = 0 if worker_info is None else worker_info.id
+        # all workers agree on the shard order of the epoch
+        epoch_seed = self.seed + self.epoch
+        if worker_info is None:
+            # without workers the next iteration is the next epoch, unless set_epoch says otherwise
+            self._epoch.value += 1
+
+        shards = [shard["name"] for shard in self.shards]
+        if self.shuffle:
+            random.Random(epoch_seed).shuffle(shards)
+        if worker_info is not None:
+            shards = shards[worker_info.id :: worker_info.num_workers]
+
+        records = self._iter_records(shards)
+        if self.shuffle:
+            records = self._shuffle_buffer(records, random.Random(epoch_seed * 1024 + worker_id))
+        for record in records:
+            yield self._to_item(record)
+
+    def _iter_records(self, shards: List[str]) -> Iterator[Dict[str, np.ndarray]]:
+        for name in shards:
+            record, key = {}, None
+            with tarfile.open(self.root / name, "r|") as tar:
+                for member in tar:
+                    if not member.isfile():
+                        continue
+                    member_key, field = member.name.split(".")[:2]
+                    if key is not None and member_key != key:
+                        yield record
+                        record = {}
+                    key = member_key
+                    record[field] = decode_field(
+                        member.name, tar.extractfile(member).read()
+                    )
+            if record:
+                yield record
+
+    def _shuffle_buffer(self, records: Iterator, rng: random.Random) -> Iterator:
+        buffer = []
+        for record in records:
+            if len(buffer) < self.shuffle_buffer:
+                buffer.append(record)
+                continue
+            idx = rng.randrange(len(buffer))
+            yield buffer[idx]
+            buffer[idx] = record
+        rng.shuffle(buffer)
+        yield from buffer
+
+    def _to_item(self, record: Dict[str, np.ndarray]) -> Dict[str, torch.Tensor]:
+        im, mask = record["input"], record["mask"]
+        mask = mask[:, :, 0] if mask.ndim == 3 else mask  # class index (H, W)
+        if self.decode_only:
+            im = torch.from_numpy(im.copy()).permute(2, 0, 1)
+            return {"input": im, "mask": torch.from_numpy(mask.copy()).long()}
+
+        transformed = self.transform(image=im, mask=mask)
+        return {"input": transformed["image"], "mask": transformed["mask"].long()}
+
+
+if __name__ == "__main__":
+
+    # python -m nncore.segmentation.datasets.shard_dataset ./data CameraRGB CameraSeg ./shards
+    import argparse
+
+    parser = argparse.ArgumentParser("Pack an image/mask folder pair into tar shards")
+    parser.add_argument("root", type=Path)
+    parser.add_argument("image_folder_name")
+    parser.add_argument("mask_folder_name")
+    parser.add_argument("out_dir", type=Path)
+    parser.add_argument("--extension", default="png")
+    parser.add_argument("--samples-per-shard", type=int, default=1000)
+
+    args = parser.parse_args()
+
+    rgb_path_ls = sorted((args.root / args.image_folder_name).glob(f"*.{args.extension}"))
+    mask_path_ls = sorted((args.root / args.mask_folder_name).glob(f"*.{args.extension}"))
+    index_path = pack_shards(
+        rgb_path_ls, mask_path_ls, args.out_dir, args.samples_per_shard
+    )
+    print(f"Packed {len(rgb_path_ls)} samples, index written to {index_path}")
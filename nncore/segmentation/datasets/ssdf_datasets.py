@@ -3,8 +3,9 @@ from pathlib import Path
 from typing import List, Optional, Tuple
 
 import torch
-from PIL import Image
+from nncore.core.datasets import DECODER_REGISTRY, Manifest, normalization
 from torchvision import transforms as tf
+from torchvision.transforms import functional as TF
 
 __all__ = ["SDataset"]
 
@@ -54,6 +55,8 @@ class SDataset(torch.utils.data.Dataset):
         image_size: Tuple[int, int] = (224, 224),
         test: bool = False,
         sample: bool = False,
+        decoder: str = "pil",
+        decode_only: bool = False,
     ):
         super(SDataset, self).__init__()
 
@@ -61,15 +64,27 @@ class SDataset(torch.utils.data.Dataset):
         self.list_mask = mask_path_ls[:50] if sample else mask_path_ls
         self.train = not (test)
         self.image_size = image_size
+        self.decode = DECODER_REGISTRY.get(decoder)
+        self.decode_only = decode_only
+        # the default transforms run on uint8 C x H x W tensors, the image is
+        # only converted to float at the end. Custom transform lists get PIL
+        # images, as they always did, so e.g. ToTensor() keeps working
+        self.pil_image, self.pil_mask = transform is not None, m_transform is not None
+        # inputs in [0, 1] without mean / std, unknown with a custom transform list
+        self.normalization = (
+            None if decode_only or transform is not None else normalization((0.0, 0.0, 0.0), (1.0, 1.0, 1.0))
+        )
         self.img_transform = (
             tf.Compose([tf.Resize(self.image_size)] + transform)
             if transform is not None
-            else tf.Compose([tf.Resize(self.image_size), tf.ToTensor(),])
+            else tf.Compose(
+                [tf.Resize(self.image_size), tf.ConvertImageDtype(torch.float),]
+            )
         )
         self.msk_transform = (
             tf.Compose([tf.Resize(self.image_size)] + m_transform)
             if m_transform is not None
-            else tf.Compose([tf.Resize(self.image_size), tf.ToTensor(),])
+            else tf.Compose([tf.Resize(self.image_size)])
         )
 
         assert len(self.list_rgb) == len(
@@ -79,14 +94,17 @@ class SDataset(torch.utils.data.Dataset):
 
     def __getitem__(self, idx: int) -> Tuple[torch.Tensor, torch.Tensor]:
 
-        im, mask = Image.open(self.list_rgb[idx]), Image.open(self.list_mask[idx])
+        im = self._to_tensor(self.decode(self.list_rgb[idx]))
+        mask = self._to_tensor(self.decode(self.list_mask[idx]))
 
         assert (
-            im.size == mask.size
-        ), f"Image and mask {idx} should be the same size, but are {im.size} and {mask.size}"
+            im.shape[1:] == mask.shape[1:]
+        ), f"Image and mask {idx} should be the same size, but are {tuple(im.shape[1:])} and {tuple(mask.shape[1:])}"
 
-        im = self.img_transform(im)
-        mask = self.msk_transform(mask)
+        if not self.decode_only:
+            # otherwise resize and normalize are left to an on-device batch transform
+            im = self.img_transform(TF.to_pil_image(im) if self.pil_image else im)
+            mask = self.msk_transform(TF.to_pil_image(mask) if self.pil_mask else mask)
         mask = mask[0, :]
         mask[mask > 0] = 1
         item = {"input": im, "mask": mask.long()}
@@ -95,6 +113,12 @@ class SDataset(torch.utils.data.Dataset):
     def __len__(self) -> int:
         return len(self.list_rgb)
 
+    @staticmethod
+    def _to_tensor(image) -> torch.Tensor:
+        """Convert a decoded uint8 H x W (x C) array to a C x H x W tensor"""
+        image = torch.from_numpy(image.copy())
+        return image.unsqueeze(0) if image.dim() == 2 else image.permute(2, 0, 1)
+
     @staticmethod
     def get_images_list(folder_path: Path, extension: str) -> List[str]:
         """Return file list with specify type from folder
@@ -107,7 +131,7 @@ class SDataset(torch.utils.data.Dataset):
             List[str]: full path list of items in folder
         """
         folder_path = str(folder_path)
-        return glob(f"{folder_path}/*.{extension}")
+        return sorted(glob(f"{folder_path}/*.{extension}"))
 
     @classmethod
     def from_list(
@@ -119,6 +143,8 @@ class SDataset(torch.utils.data.Dataset):
         image_size: Tuple[int, int] = (224, 224),
         test: bool = False,
         sample: bool = False,
+        decoder: str = "pil",
+        decode_only: bool = False,
     ):
         """From list method
 
@@ -129,6 +155,8 @@ class SDataset(torch.utils.data.Dataset):
             transform (Optional[List], optional): rgb transform. Defaults to None.
             m_transform (Optional[List], optional): label transform. Defaults to None.
             image_size (Tuple[int, int]): image size (width, height). Defaults to (224, 224)..
+            decoder (str, optional): image decode backend in DECODER_REGISTRY. Defaults to "pil".
+            decode_only (bool, optional): return uint8 tensors without resize/normalize, for on-device batch transforms. Defaults to False.
         Returns:
             SDataset: dataset class
         """
@@ -140,6 +168,54 @@ class SDataset(torch.utils.data.Dataset):
             m_transform=m_transform,
             image_size=image_size,
             sample=sample,
+            decoder=decoder,
+            decode_only=decode_only,
+        )
+
+    @classmethod
+    def from_manifest(
+        cls,
+        manifest: str,
+        root: Optional[str] = None,
+        refresh: bool = False,
+        test: bool = False,
+        transform: Optional[List] = None,
+        m_transform: Optional[List] = None,
+        image_size: Tuple[int, int] = (224, 224),
+        sample: bool = False,
+        decoder: str = "pil",
+        decode_only: bool = False,
+    ):
+        r"""From manifest method
+
+        Args:
+            manifest (str): manifest file written by `Manifest.save`
+            root (Optional[str], optional): override the data root stored in the manifest. Defaults to None.
+            refresh (bool, optional): pick up files added or removed since the manifest was saved. Defaults to False.
+            test (bool, optional): Option using for inference mode. if True, __get_item__ does not return label. Defaults to False.
+            transform (Optional[List], optional): rgb transform. Defaults to None.
+            m_transform (Optional[List], optional): label transform. Defaults to None.
+            image_size (Tuple[int, int]): image size (width, height). Defaults to (224, 224).
+            decoder (str, optional): image decode backend in DECODER_REGISTRY. Defaults to "pil".
+            decode_only (bool, optional): return uint8 tensors without resize/normalize, for on-device batch transforms. Defaults to False.
+
+        Returns:
+            SDataset: dataset class
+        """
+        index = Manifest.load(manifest, root=root)
+        if refresh:
+            index.refresh()
+
+        return cls(
+            index.rgb_paths(),
+            index.mask_paths(),
+            test=test,
+            transform=transform,
+            m_transform=m_transform,
+            image_size=image_size,
+            sample=sample,
+            decoder=decoder,
+            decode_only=decode_only,
         )
 
     @classmethod
@@ -154,6 +230,8 @@ class SDataset(torch.utils.data.Dataset):
         m_transform: Optional[List] = None,
         image_size: Tuple[int, int] = (224, 224),
         sample: bool = False,
+        decoder: str = "pil",
+        decode_only: bool = False,
     ):
         r"""From folder method
 
@@ -166,6 +244,8 @@ class SDataset(torch.utils.data.Dataset):
             transform (Optional[List], optional): rgb transform. Defaults to None.
             m_transform (Optional[List], optional): label transform. Defaults to None.
             image_size (Tuple[int, int]): image size (width, height). Defaults to (224, 224).
+            decoder (str, optional): image decode backend in DECODER_REGISTRY. Defaults to "pil".
+            decode_only (bool, optional): return uint8 tensors without resize/normalize, for on-device batch transforms. Defaults to False.
 
         Returns:
             SDataset: dataset class
@@ -186,5 +266,7 @@ class SDataset(torch.utils.data.Dataset):
             m_transform=m_transform,
             image_size=image_size,
             sample=sample,
+            decoder=decoder,
+            decode_only=decode_only,
         )
 
@@ -0,0 +1,160 @@
+"""Inference helpers for trained segmentation checkpoints
+
+Loads the model of a checkpoint folder from its `config.yaml` and
+`MODEL_REGISTRY`, and predicts class masks for batches of uint8 images with
+the input normalization saved in the config.
+
+Example:
+
+    predictor = SegmentationPredictor.from_checkpoint("runs/<run>/checkpoints", image_size=(224, 224))
+    masks = predictor.predict_batch([image])  # H x W class indices of every image
+"""
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from nncore.core.datasets import IMAGENET_MEAN, IMAGENET_STD
+from nncore.core.inference import SlidingWindowInference, TestTimeAugmentation
+from nncore.core.pruning import apply_shapes
+from nncore.segmentation.models import MODEL_REGISTRY
+from nncore.utils.getter import get_instance
+from nncore.utils.loading import load_yaml
+from nncore.utils.utils import load_model
+from torch import Tensor, nn
+
+__all__ = ["load_checkpoint_model", "to_input", "SegmentationPredictor"]
+
+def load_checkpoint_model(
+    checkpoint_dir: str, checkpoint: str = "best_loss.pth"
+) -> Tuple[nn.Module, Dict[str, Any]]:
+    """Build the model of a checkpoint folder and load its weights, resized first when it was pruned
+
+    Args:
+        checkpoint_dir (str): folder with config.yaml and the checkpoints
+        checkpoint (str, optional): weights file in the folder. Defaults to "best_loss.pth".
+
+    Returns:
+        Tuple[nn.Module, Dict[str, Any]]: model in eval mode on the CPU, saved config
+    """
+    checkpoint_dir = Path(checkpoint_dir)
+    cfg = load_yaml(checkpoint_dir / "config.yaml")
+    model = get_instance(cfg["pipeline"]["model"], registry=MODEL_REGISTRY)
+    if cfg.get("pruned_shapes"):
+        apply_shapes(model, cfg["pruned_shapes"])
+    load_model(model, checkpoint_dir / checkpoint, verbose=False)
+    return model.eval(), cfg
+
+
+def to_input(
+    images: Sequence[np.ndarray],
+    device=None,
+    mean: Sequence[float] = IMAGENET_MEAN,
+    std: Sequence[float] = IMAGENET_STD,
+) -> Tensor:
+    """uint8 H x W x C images of one size to a B x 3 x H x W batch, scaled to [0, 1] then normalized"""
+    batch = torch.from_numpy(np.stack([im[..., :3] for im in images])).to(device)
+    batch = batch.permute(0, 3, 1, 2).float().div_(255)
+    mean = torch.tensor(mean, device=batch.device).view(1, 3, 1, 1)
+    std = torch.tensor(std, device=batch.device).view(1, 3, 1, 1)
+    return (batch - mean) / std
+
+
+class SegmentationPredictor:
+    r"""Predicts class masks of uint8 images
+
+    Args:
+        model (nn.Module): segmentation model returning logits or {"out": logits}
+        device (optional): inference device. Defaults to "cpu".
+        image_size (Optional[Tuple[int, int]], optional): resize inputs to this H W, native resolution if None. Defaults to None.
+        tiled (Optional[Dict[str, Any]], optional): `SlidingWindowInference` args for native resolution inputs. Defaults to None.
+        tta (Optional[Dict[str, Any]], optional): `TestTimeAugmentation` args. Defaults to None.
+        mean (Sequence[float], optional): channel mean of the inputs scaled to [0, 1]. Defaults to the ImageNet mean.
+        std (Sequence[float], optional): channel std of the inputs scaled to [0, 1]. Defaults to the ImageNet std.
+        output_key (str, optional): logits key of dict outputs. Defaults to "out".
+    """
+
+    def __init__(
+        self,
+        model: nn.Module,
+        device="cpu",
+        image_size: Optional[Tuple[int, int]] = None,
+        tiled: Optional[Dict[str, Any]] = None,
+        tta: Optional[Dict[str, Any]] = None,
+        mean: Sequence[float] = IMAGENET_MEAN,
+        std: Sequence[float] = IMAGENET_STD,
+        output_key: str = "out",
+    ):
+        self.device = torch.device(device)
+        self.mean, self.std = tuple(mean), tuple(std)
+        self.model = model.to(self.device).eval()
+        self.output_key = output_key
+        self.net = TestTimeAugmentation(self.model, output_key=output_key, **tta) if tta is not None else self.model
+        self.tiled = (
+            SlidingWindowInference(self.net, output_key=output_key, **tiled) if tiled is not None else None
+        )
+        self.image_size = tuple(image_size) if image_size else None
+
+    @classmethod
+    def from_checkpoint(cls, checkpoint_dir: str, checkpoint: str = "best_loss.pth", **kwargs):
+        """Predictor of a checkpoint folder, normalizing inputs like its training run did"""
+        model, cfg = load_checkpoint_model(checkpoint_dir, checkpoint)
+        if cfg.get("normalization"):
+            kwargs.setdefault("mean", cfg["normalization"]["mean"])
+            kwargs.setdefault("std", cfg["normalization"]["std"])
+        elif "mean" not in kwargs:
+            logging.warning(f"{checkpoint_dir}/config.yaml has no input normalization, using the ImageNet mean and std")
+        return cls(model, **kwargs)
+
+    def forward(self, x: Tensor) -> Tensor:
+        """B x K x h x w logits of a normalized batch, the model may return logits or a dict of them"""
+        if self.tiled is not None:
+            return self.tiled(x)
+        out = self.net(x)
+        return out[self.output_key] if isinstance(out, dict) else out
+
+    @torch.inference_mode()
+    def predict_logits(self, images: Sequence[np.ndarray]) -> List[Tensor]:
+        """K x H x W logits of every image, at the image resolution"""
+        outputs: List[Optional[Tensor]] = [None] * len(images)
+        if self.image_size is not None:
+            groups = {None: list(range(len(images)))}
+        else:
+            # only images of the same size can share a batch
+            groups: Dict[Any, List[int]] = {}
+            for i, im in enumerate(images):
+                groups.setdefault(im.shape[:2], []).append(i)
+        for idx in groups.values():
+            x = to_input(
+                [
+                    images[i] if self.image_size is None else _resize(images[i], self.image_size)
+                    for i in idx
+                ],
+                device=self.device,
+                mean=self.mean,
+                std=self.std,
+            )
+            logits = self.forward(x)
+            for k, i in enumerate(idx):
+                out = logits[k : k + 1]
+                if out.shape[-2:] != images[i].shape[:2]:
+                    out = F.interpolate(out, size=images[i].shape[:2], mode="bilinear", align_corners=False)
+                outputs[i] = out[0]
+        return outputs
+
+    def predict_batch(self, images: Sequence[np.ndarray]) -> List[np.ndarray]:
+        """H x W uint8 class index masks of every image"""
+        return [o.argmax(0).to(torch.uint8).cpu().numpy() for o in self.predict_logits(images)]
+
+    # the predict function of `InferencePool` factories
+    __call__ = predict_batch
+
+
+def _resize(image: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    if image.shape[:2] == tuple(size):
+        return image
+    from PIL import Image
+
+    return np.asarray(Image.fromarray(image[..., :3]).resize((size[1], size[0]), Image.BILINEAR))
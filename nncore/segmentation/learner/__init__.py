@@ -1,2 +1,9 @@
 from nncore.core.learner import LEARNER_REGISTRY
-from .semantic import SemanticLearner
\ No newline at end of file
+from nncore.core.registry import lazy_import
+
+LEARNER_REGISTRY.register_lazy("SemanticLearner", "nncore.segmentation.learner.semantic")
+LEARNER_REGISTRY.register_lazy("DistillationLearner", "nncore.segmentation.learner.distillation")
+
+__getattr__ = lazy_import(
+    __name__, {"SemanticLearner": ".semantic", "DistillationLearner": ".distillation"}
+)
@@ -0,0 +1,242 @@
+import json
+import logging
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from nncore.core.datasets import IndexedDataset
+from nncore.core.metrics.metric_template import Metric
+from nncore.utils.device import get_device
+from torch import Tensor, device
+from torch.cuda.amp import autocast
+from torch.nn import Module
+from torch.optim import Optimizer
+from torch.utils.data import DataLoader
+
+from . import LEARNER_REGISTRY
+from .semantic import SemanticLearner
+
+
+def pixelwise_kd_loss(student: Tensor, teacher: Tensor, temperature: float = 1.0) -> Tensor:
+    """KL divergence between the softened class distributions of every pixel, scaled by T^2"""
+    log_p = F.log_softmax(student.float() / temperature, dim=1)
+    q = F.softmax(teacher.float() / temperature, dim=1)
+    return F.kl_div(log_p, q, reduction="none").sum(1).mean() * temperature ** 2
+
+
+class TeacherCache:
+    r"""Teacher logits of every training sample in memory-mapped .npy files
+
+    `logits.npy` holds N x K x H x W logits in low precision and `filled.npy`
+    which samples have been written. Both are read through the page cache, so
+    the cache can be larger than memory. A cache written for another teacher,
+    shape or precision is reset.
+
+    Args:
+        path: cache directory
+        num_samples (int): size of the indexed dataset
+        shape (tuple): K x H x W of one sample
+        dtype (str, optional): "float16" or "float32". Defaults to "float16".
+        key (str, optional): identifies the teacher. Defaults to "".
+    """
+
+    def __init__(self, path, num_samples: int, shape: tuple, dtype: str = "float16", key: str = ""):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        meta = {"num_samples": num_samples, "shape": list(shape), "dtype": dtype, "key": key}
+        meta_path = self.path / "meta.json"
+        fresh = not meta_path.exists() or json.loads(meta_path.read_text()) != meta
+        mode = "w+" if fresh else "r+"
+        self.logits = np.lib.format.open_memmap(
+            self.path / "logits.npy", mode=mode, dtype=np.dtype(dtype), shape=(num_samples, *shape)
+        )
+        self.filled = np.lib.format.open_memmap(
+            self.path / "filled.npy", mode=mode, dtype=np.bool_, shape=(num_samples,)
+        )
+        if fresh:
+            self.filled[:] = False
+            self.flush()
+            meta_path.write_text(json.dumps(meta))
+        self.hits, self.misses = 0, 0
+
+    def get(self, indices: np.ndarray) -> Optional[np.ndarray]:
+        """Logits of the samples when all of them are cached, None otherwise"""
+        if not self.filled[indices].all():
+            self.misses += len(indices)
+            return None
+        self.hits += len(indices)
+        return self.logits[indices]
+
+    def put(self, indices: np.ndarray, logits: np.ndarray) -> None:
+        self.logits[indices] = logits
+        self.filled[indices] = True
+
+    def flush(self) -> None:
+        # logits first, a sample is only marked as filled once its logits are on disk
+        self.logits.flush()
+        self.filled.flush()
+
+    def summary(self) -> str:
+        total = self.hits + self.misses
+        return (
+            f"Teacher cache: {int(self.filled.sum())}/{len(self.filled)} samples, "
+            f"{self.hits / total if total else 0.0:.1%} hits this epoch"
+        )
+
+
+@LEARNER_REGISTRY.register()
+class DistillationLearner(SemanticLearner):
+    r"""Segmentation learner distilling a frozen teacher into the model
+
+    The training loss is `(1 - alpha) * task loss + alpha * KD loss`, the KD
+    loss being the pixel-wise KL divergence of the temperature-softened
+    student and teacher distributions. The teacher is loaded from its
+    checkpoint folder (config.yaml and weights) and runs in eval mode without
+    gradients. Validation and checkpoints only concern the student.
+
+    With `cache_dir`, teacher logits are written to a memory-mapped cache on
+    their first epoch and read back afterwards instead of running the teacher.
+    The cache is keyed by sample index, so the train dataset needs
+    `return_index: True`, and the train inputs have to be the same every
+    epoch: random augmentations would not match the cached logits.
+
+    Args:
+        cfg (Any): [description]
+        train_data (DataLoader): train dataloader
+        val_data (DataLoader): validation dataloader
+        metrics (Dict[str, Metric]): evaluate metrics
+        model (Module): student model to optimize
+        scheduler (lr_scheduler): learning rate scheduler
+        optimizer (torch.optim.Optimizer): optimizer
+        device (torch.device): training device
+        batch_transform (Optional[Dict[str, Callable]], optional): on-device batch transforms keyed by stage. Defaults to None.
+        teacher (str): teacher checkpoint folder, e.g. runs/<run>/checkpoints
+        teacher_checkpoint (str, optional): teacher weights file in the folder. Defaults to "best_loss.pth".
+        alpha (float, optional): weight of the KD loss. Defaults to 0.5.
+        temperature (float, optional): softmax temperature. Defaults to 2.0.
+        cache_dir (Optional[str], optional): teacher logits cache, the teacher runs every iteration if None. Defaults to None.
+        cache_dtype (str, optional): "float16" or "float32". Defaults to "float16".
+        cache_scale (float, optional): resolution of the cached logits relative to the inputs. Defaults to 1.0.
+    """
+
+    def __init__(
+        self,
+        cfg: Any,
+        train_data: DataLoader,
+        val_data: DataLoader,
+        metrics: Dict[str, Metric],
+        model: Module,
+        scheduler,
+        optimizer: Optimizer,
+        device: device = get_device(),
+        batch_transform: Optional[Dict[str, Callable]] = None,
+        teacher: Optional[str] = None,
+        teacher_checkpoint: str = "best_loss.pth",
+        alpha: float = 0.5,
+        temperature: float = 2.0,
+        cache_dir: Optional[str] = None,
+        cache_dtype: str = "float16",
+        cache_scale: float = 1.0,
+    ):
+        super().__init__(
+            cfg=cfg,
+            train_data=train_data,
+            val_data=val_data,
+            metrics=metrics,
+            model=model,
+            scheduler=scheduler,
+            optimizer=optimizer,
+            device=device,
+            batch_transform=batch_transform,
+        )
+        from nncore.segmentation.inference import load_checkpoint_model
+
+        assert teacher is not None, "DistillationLearner needs a teacher checkpoint folder"
+        assert 0.0 <= alpha <= 1.0, "alpha must be in [0, 1]"
+        self.teacher, _ = load_checkpoint_model(teacher, teacher_checkpoint)
+        self.teacher = self.teacher.to(self.device).eval()
+        for param in self.teacher.parameters():
+            param.requires_grad_(False)
+        self.alpha, self.temperature = alpha, temperature
+
+        self.cache: Optional[TeacherCache] = None
+        self.cache_dir, self.cache_dtype, self.cache_scale = cache_dir, cache_dtype, cache_scale
+        if cache_dir is not None:
+            assert not self.batch_transform.get("train"), (
+                "cached teacher logits need the same train inputs every epoch, remove the train batch_transform"
+            )
+            dataset = train_data.dataset
+            while not isinstance(dataset, IndexedDataset) and hasattr(dataset, "dataset"):
+                dataset = dataset.dataset
+            assert isinstance(dataset, IndexedDataset), (
+                "the teacher cache needs sample indices, set return_index: True in the train dataset config"
+            )
+            self.num_samples = len(dataset)
+            weights = Path(teacher) / teacher_checkpoint
+            stat = weights.stat()
+            self.cache_key = f"{weights.resolve()}:{stat.st_size}:{stat.st_mtime_ns}:{cache_scale}"
+            meta_path = Path(cache_dir) / "meta.json"
+            meta = json.loads(meta_path.read_text()) if meta_path.exists() else {}
+            if meta.get("key") == self.cache_key and meta.get("num_samples") == self.num_samples:
+                # reuse the logits cached by an earlier run
+                self.cache = TeacherCache(
+                    cache_dir, self.num_samples, tuple(meta["shape"]), cache_dtype, self.cache_key
+                )
+        self.kd_sum, self.task_sum, self.num_batches = 0.0, 0.0, 0
+
+    @torch.no_grad()
+    def teacher_logits(self, batch: Dict[str, Any]) -> Tensor:
+        """Teacher logits of a batch, from the cache when every sample is in it"""
+        indices = None
+        if self.cache_dir is not None:
+            indices = batch["index"].cpu().numpy()
+            if self.cache is not None:
+                cached = self.cache.get(indices)
+                if cached is not None:
+                    return torch.from_numpy(cached).to(self.device, non_blocking=True).float()
+        with autocast(enabled=self.cfg.fp16):
+            logits = self.teacher(batch["input"])
+        logits = logits["out"] if isinstance(logits, Dict) else logits
+        if indices is None:
+            return logits.float()
+        if self.cache_scale != 1.0:
+            logits = F.interpolate(
+                logits.float(), scale_factor=self.cache_scale, mode="bilinear", align_corners=False
+            )
+        stored = logits.to(getattr(torch, self.cache_dtype)).cpu().numpy()
+        if self.cache is None:
+            self.cache = TeacherCache(
+                self.cache_dir, self.num_samples, stored.shape[1:], self.cache_dtype, self.cache_key
+            )
+        self.cache.put(indices, stored)
+        # the same low-precision logits as later epochs read from the cache
+        return torch.from_numpy(stored).to(self.device).float()
+
+    def forward_train(self, batch: Dict[str, Any]) -> Dict[str, Any]:
+        out_dict = self.model(batch)
+        student = out_dict["out"]
+        teacher = self.teacher_logits(batch)
+        if teacher.shape[-2:] != student.shape[-2:]:
+            teacher = F.interpolate(teacher, size=student.shape[-2:], mode="bilinear", align_corners=False)
+        kd_loss = pixelwise_kd_loss(student, teacher, self.temperature)
+        task_loss = out_dict["loss"]
+        out_dict["loss"] = (1 - self.alpha) * task_loss + self.alpha * kd_loss
+        self.kd_sum = self.kd_sum + kd_loss.detach().double()
+        self.task_sum = self.task_sum + task_loss.detach().double()
+        self.num_batches += 1
+        return out_dict
+
+    def train_epoch(self, epoch: int, dataloader: DataLoader) -> float:
+        self.kd_sum, self.task_sum, self.num_batches = 0.0, 0.0, 0
+        if self.cache is not None:
+            self.cache.hits, self.cache.misses = 0, 0
+        avg_loss = super().train_epoch(epoch, dataloader)
+        if self.num_batches:
+            self.tsboard.update_scalar("train/kd_loss", self.kd_sum / self.num_batches, epoch)
+            self.tsboard.update_scalar("train/task_loss", self.task_sum / self.num_batches, epoch)
+        if self.cache is not None:
+            self.cache.flush()
+            logging.info(self.cache.summary())
+        return avg_loss
@@ -1,17 +1,15 @@
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Optional
 
 import numpy as np
 import torch
-import torchvision
 from nncore.core.learner.supervisedlearner import SupervisedLearner
 from nncore.core.metrics.metric_template import Metric
 from nncore.utils.device import get_device
-from nncore.utils.utils import inverse_normalize_batch, tensor2plt
+from nncore.utils.utils import inverse_normalize_batch
 from torch import device
 from torch.nn import Module
 from torch.optim import Optimizer
 from torch.utils.data import DataLoader
-from torchvision.utils import save_image
 
 from . import LEARNER_REGISTRY
 
@@ -32,6 +30,7 @@ class SemanticLearner(SupervisedLearner):
         scheduler (lr_scheduler): learning rate scheduler  
         optimizer (torch.optim.Optimizer): optimizer 
         metrics (Dict[str, Metric]): evaluate metrics
+        batch_transform (Optional[Dict[str, Callable]], optional): on-device batch transforms keyed by stage. Defaults to None.
     """
 
     def __init__(
@@ -44,6 +43,7 @@ class SemanticLearner(SupervisedLearner):
         scheduler,
         optimizer: Optimizer,
         device: device = get_device(),
+        batch_transform: Optional[Dict[str, Callable]] = None,
     ):
         super().__init__(
             cfg=cfg,
@@ -54,9 +54,12 @@ class SemanticLearner(SupervisedLearner):
             scheduler=scheduler,
             optimizer=optimizer,
             device=device,
+            batch_transform=batch_transform,
         )
 
     def save_result(self, pred, batch, stage: str):
+        from torchvision.utils import save_image
+
         input_key = "input"
         label_key = "mask"
         save_dir = self.save_dir / "samples"
@@ -79,18 +82,15 @@ class SemanticLearner(SupervisedLearner):
         save_image(lbls, str(save_dir / "last_batch_labels.png"))
         save_image(outs, str(save_dir / "last_batch_preds.png"))
 
-        rbgs_plt = tensor2plt(rgbs, title="inputs")
-        lbls_plt = tensor2plt(lbls.long(), title="labels")
-        outs_plt = tensor2plt(outs.long(), title="predictions")
-
-        self.tsboard.update_figure(
-            f"{stage}/samples/last_batch",
-            [rbgs_plt, lbls_plt, outs_plt],
-            step=self.epoch,
-        )
+        # tensors go to the logger thread, no matplotlib rendering in the training loop
+        self.tsboard.update_image(f"{stage}/samples/inputs", rgbs, step=self.epoch)
+        self.tsboard.update_image(f"{stage}/samples/labels", lbls / 255, step=self.epoch)
+        self.tsboard.update_image(f"{stage}/samples/predictions", outs / 255, step=self.epoch)
 
     def _image_batch_show(self, batch, ncol=5, fig_size=(30, 10), normalize=False):
-        grid_img = torchvision.utils.make_grid(batch, nrow=ncol, normalize=normalize)
+        from torchvision.utils import make_grid
+
+        grid_img = make_grid(batch, nrow=ncol, normalize=normalize)
         return grid_img.float().cpu()
 
     def _tensor2cmap(self, tensor):
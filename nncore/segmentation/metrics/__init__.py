@@ -1,2 +1,6 @@
 from nncore.core.metrics import METRIC_REGISTRY
-from .pixelaccuracy import PixelAccuracy
\ No newline at end of file
+from nncore.core.registry import lazy_import
+
+METRIC_REGISTRY.register_lazy("PixelAccuracy", "nncore.segmentation.metrics.pixelaccuracy")
+
+__getattr__ = lazy_import(__name__, {"PixelAccuracy": ".pixelaccuracy"})
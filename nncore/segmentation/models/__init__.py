@@ -1,5 +1,8 @@
 from nncore.core.models import MODEL_REGISTRY
-from torchvision.models.segmentation.segmentation import deeplabv3_resnet50
-from .mobileunet import MobileUnet
+from nncore.core.registry import lazy_import
 
-MODEL_REGISTRY.register(deeplabv3_resnet50)
+# model modules pull in torchvision, they are imported on first use
+MODEL_REGISTRY.register_lazy("MobileUnet", "nncore.segmentation.models.mobileunet")
+MODEL_REGISTRY.register_lazy("deeplabv3_resnet50", "nncore.segmentation.models.deeplabv3")
+
+__getattr__ = lazy_import(__name__, {"MobileUnet": ".mobileunet", "deeplabv3_resnet50": ".deeplabv3"})
@@ -57,11 +57,15 @@ class InvertedResidual(nn.Module):
 
 @MODEL_REGISTRY.register()
 class MobileUnet(nn.Module):
-    """Some Information about MobileUnet"""
+    """MobileNetV2 encoder with a U-Net decoder
+
+    Args:
+        num_classes (int, optional): output channels of the score layer. Defaults to 2.
+    """
 
     __constants__ = ["mobilenet"]
 
-    def __init__(self):
+    def __init__(self, num_classes: int = 2):
         super(MobileUnet, self).__init__()
 
         mobilenet = mobilenet_v2(pretrained=True, progress=True)
@@ -97,7 +101,7 @@ class MobileUnet(nn.Module):
         self.invres5 = InvertedResidual(6, 3, 1, 6)
 
         self.conv_last = nn.Conv2d(3, 3, 1)
-        self.conv_score = nn.Conv2d(3, 2, 1)
+        self.conv_score = nn.Conv2d(3, num_classes, 1)
 
         # init weights...
 
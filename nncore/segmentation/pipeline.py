@@ -1,17 +1,22 @@
 import logging
+import time
 from typing import Optional
 
 import yaml
+from nncore.core.datasets import input_normalization
 from nncore.core.models.wrapper import ModelWithLoss
-from nncore.core.test import evaluate
+from nncore.core.pruning import prune_from_cfg
+from nncore.core.runstore import config_hash
+from nncore.core.test import compare_tta, evaluate
+from nncore.core.transforms import BatchCompose
 from nncore.segmentation.datasets import DATASET_REGISTRY
 from nncore.segmentation.criterion import CRITERION_REGISTRY
 from nncore.segmentation.models import MODEL_REGISTRY
 from nncore.segmentation.metrics import METRIC_REGISTRY
 from nncore.segmentation.learner import LEARNER_REGISTRY
-from nncore.utils.getter import get_data, get_instance
+from nncore.utils.getter import get_data, get_instance, get_scheduler
 from nncore.utils.loading import load_yaml
-from torchvision.transforms import transforms as tf
+from nncore.utils.utils import set_seed
 from nncore.core.opt import opts
 
 
@@ -28,14 +33,23 @@ class Pipeline(object):
             load_yaml(cfg_path) if cfg_path is not None else load_yaml(opt.cfg_pipeline)
         )
 
+        if getattr(opt, "seed", None) is not None:
+            set_seed(opt.seed)
+
         self.device = get_instance(self.cfg["device"])
         print(self.device)
 
         self.train_dataloader, self.val_dataloader = get_data(
-            self.cfg["data"], return_dataset=False
+            self.cfg["data"], return_dataset=False, opt=self.opt
         )
 
         model = get_instance(self.cfg["model"], registry=MODEL_REGISTRY).to(self.device)
+        # structured pruning before the optimizer sees the parameters, the run fine-tunes the pruned model
+        self.pruned_shapes, pruning_report = (
+            prune_from_cfg(model, self.cfg["pruning"], device=self.device)
+            if self.cfg.get("pruning")
+            else (None, None)
+        )
         criterion = get_instance(self.cfg["criterion"], registry=CRITERION_REGISTRY).to(self.device)
         self.model = ModelWithLoss(model, criterion)
 
@@ -46,8 +60,17 @@ class Pipeline(object):
             self.cfg["optimizer"], params=self.model.parameters()
         )
 
-        self.scheduler = get_instance(
-            self.cfg["scheduler"], optimizer=self.optimizer)
+        self.scheduler = get_scheduler(
+            self.cfg.get("scheduler"),
+            optimizer=self.optimizer,
+            steps_per_epoch=len(self.train_dataloader),
+        )
+
+        # optional on-device batch transforms, e.g. batch_transform: {train: [...], val: [...]}
+        self.batch_transform = {
+            stage: BatchCompose.from_cfg(tcfg, getter=get_instance).to(self.device)
+            for stage, tcfg in (self.cfg.get("batch_transform") or {}).items()
+        }
 
         self.learner = get_instance(
             self.cfg["learner"],
@@ -58,6 +81,7 @@ class Pipeline(object):
             model=self.model,
             metrics=self.metric,
             optimizer=self.optimizer,
+            batch_transform=self.batch_transform,
             registry=LEARNER_REGISTRY,
         )
 
@@ -65,27 +89,65 @@ class Pipeline(object):
         save_cfg["opt"] = vars(opt)
         save_cfg["pipeline"] = self.cfg
         save_cfg["opt"]["save_dir"] = str(save_cfg["opt"]["save_dir"])
+        if self.pruned_shapes:
+            save_cfg["pruned_shapes"] = self.pruned_shapes
+        # the inference helpers normalize inputs the way validation did
+        normalization = input_normalization(self.val_dataloader.dataset, self.batch_transform.get("val"))
+        if normalization is not None:
+            save_cfg["normalization"] = normalization
         with open(
             self.learner.save_dir / "checkpoints" / "config.yaml", "w"
         ) as outfile:
             yaml.dump(save_cfg, outfile, default_flow_style=False)
+        self.learner.tsboard.update_info(
+            {
+                "config": save_cfg,
+                "config_hash": config_hash(save_cfg["opt"], self.cfg),
+                "status": "created",
+                "created": time.time(),
+            }
+        )
+        if pruning_report is not None:
+            self.learner.tsboard.update_info({"pruning": pruning_report})
         self.logger = logging.getLogger()
 
     def sanitycheck(self):
         self.logger.info("Sanity checking before training")
-        self.evaluate()
+        self.evaluate(tta=False)
 
     def fit(self):
-        self.sanitycheck()
-        self.learner.fit()
+        tsboard = self.learner.tsboard
+        tsboard.update_info({"status": "running"})
+        try:
+            self.sanitycheck()
+            self.learner.fit()
+        except BaseException:
+            tsboard.update_info({"status": "failed", "finished": time.time()})
+            raise
+        else:
+            tsboard.update_info({"status": "finished", "finished": time.time()})
+        finally:
+            tsboard.flush()
 
-    def evaluate(self):
+    def evaluate(self, tta: bool = True):
+        """Evaluate on the validation data, compared with test-time augmentation when the config has a `tta` section"""
+        if tta and self.cfg.get("tta"):
+            return compare_tta(
+                model=self.model,
+                dataloader=self.val_dataloader,
+                metric=self.metric,
+                device=self.device,
+                tta=self.cfg["tta"],
+                verbose=self.opt.verbose,
+                batch_transform=self.batch_transform.get("val"),
+            )
         avg_loss, metric = evaluate(
             model=self.model,
             dataloader=self.val_dataloader,
             metric=self.metric,
             device=self.device,
             verbose=self.opt.verbose,
+            batch_transform=self.batch_transform.get("val"),
         )
         print("Evaluate result")
         print(f"Loss: {avg_loss}")
@@ -0,0 +1,347 @@
+r"""Hyperparameter sweep over Pipeline configs
+
+Expands a grid or random search over opts and pipeline YAML keys, trains the
+trials concurrently in a process pool and writes a summary table. Every worker
+owns one device slot (a GPU index or "cpu") and a number of CPU threads, and
+trials whose intermediate validation value falls behind the other trials are
+pruned.
+
+Example sweep config::
+
+    sweep:
+      opt: ./opt.yaml
+      pipeline: ./pipeline.yml
+      save_dir: ./sweeps
+      method: grid # grid or random
+      num_trials: 8 # random only
+      seed: 0
+      devices: [0, 1] # GPU indices or cpu, one worker per slot
+      trials_per_device: 2
+      threads: 4 # torch CPU threads per trial
+      metric: loss # loss or a metric name
+      imports: [] # modules registering custom classes, e.g. [learner, dataset]
+      prune:
+        enabled: True
+        warmup: 1 # validations before a trial can be pruned
+        min_trials: 3 # trials reported at the same validation before pruning
+        percentile: 50 # pruned when worse than this percentile of the others
+    params:
+      opts.batch_size: [4, 8] # opts keys
+      optimizer.args.lr: [0.001, 0.0001] # dotted pipeline keys, a list of values
+      scheduler.args.gamma: {low: 0.1, high: 0.9} # random only, also log: True, int: True
+
+Run it with `python -m nncore.segmentation.sweep sweep.yaml`.
+"""
+import argparse
+import contextlib
+import copy
+import importlib
+import itertools
+import logging
+import math
+import multiprocessing as mp
+import os
+import random
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import yaml
+from nncore.core.runstore import print_table, rank_rows, write_csv
+
+__all__ = ["expand_params", "run_sweep", "TrialPruner"]
+
+
+def set_key(cfg: Dict[str, Any], key: str, value: Any) -> None:
+    """Set a dotted key such as `optimizer.args.lr`, creating missing levels"""
+    *parents, last = key.split(".")
+    for k in parents:
+        if cfg.get(k) is None:
+            cfg[k] = {}
+        cfg = cfg[k]
+    cfg[last] = value
+
+
+def sample_value(spec: Any, rng: random.Random) -> Any:
+    if isinstance(spec, (list, tuple)):
+        return rng.choice(list(spec))
+    if isinstance(spec, dict):
+        low, high = spec["low"], spec["high"]
+        if spec.get("log", False):
+            value = math.exp(rng.uniform(math.log(low), math.log(high)))
+        else:
+            value = rng.uniform(low, high)
+        return int(round(value)) if spec.get("int", False) else value
+    return spec
+
+
+def expand_params(
+    params: Dict[str, Any],
+    method: str = "grid",
+    num_trials: Optional[int] = None,
+    seed: int = 0,
+) -> List[Dict[str, Any]]:
+    r"""Expand the search space into the parameters of every trial
+
+    Args:
+        params (Dict[str, Any]): dotted key to a list of values, or a {low, high} range for random search
+        method (str, optional): "grid" or "random". Defaults to "grid".
+        num_trials (Optional[int], optional): number of random trials, the grid size if None. Defaults to None.
+        seed (int, optional): seed of the random search. Defaults to 0.
+
+    Returns:
+        List[Dict[str, Any]]: parameters of every trial
+    """
+    if method == "grid":
+        for k, spec in params.items():
+            assert isinstance(spec, (list, tuple)), f"grid search needs a list of values for {k}"
+        keys = list(params)
+        trials = [dict(zip(keys, values)) for values in itertools.product(*params.values())]
+        return trials[:num_trials] if num_trials else trials
+    if method == "random":
+        assert num_trials, "random search needs num_trials"
+        rng = random.Random(seed)
+        return [{k: sample_value(spec, rng) for k, spec in params.items()} for _ in range(num_trials)]
+    raise ValueError(f"Unknown sweep method {method}")
+
+
+class TrialPruner:
+    r"""Prunes a trial whose validation value falls behind the other trials
+
+    Plugs into the learner in place of its early stopping: `fit` calls `step`
+    after every validation and stops when it returns True. Values are shared
+    between trials through a `multiprocessing.Manager` dict keyed by
+    (trial, validation index). An early stopping the trial already has keeps
+    working and is consulted too.
+
+    Args:
+        trial (int): trial index
+        reports (Dict): shared dict of reported values
+        monitor (str): "loss" or a metric name, the loss is minimized and metrics maximized
+        warmup (int, optional): validations before the trial can be pruned. Defaults to 1.
+        min_trials (int, optional): other trials reported at the same validation before pruning. Defaults to 3.
+        percentile (float, optional): pruned when worse than this percentile of the others. Defaults to 50.
+        early_stopping (optional): early stopping of the trial. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        trial: int,
+        reports,
+        monitor: str,
+        warmup: int = 1,
+        min_trials: int = 3,
+        percentile: float = 50,
+        early_stopping=None,
+    ):
+        assert early_stopping is None or early_stopping.monitor == monitor, (
+            "early_stop of the trials should monitor the sweep metric"
+        )
+        self.trial, self.reports, self.monitor = trial, reports, monitor
+        self.warmup, self.min_trials, self.percentile = warmup, min_trials, percentile
+        self.early_stopping = early_stopping
+        self.sign = 1.0 if monitor == "loss" else -1.0
+        self.num_reports = 0
+        self.best: Optional[float] = None
+        self.pruned = False
+
+    def step(self, value: float) -> bool:
+        value = float(value)
+        if self.best is None or self.sign * (self.best - value) > 0:
+            self.best = value
+        k = self.num_reports
+        self.reports[(self.trial, k)] = value
+        self.num_reports += 1
+        if self.early_stopping is not None and self.early_stopping.step(value):
+            return True
+        if self.num_reports <= self.warmup:
+            return False
+        others = sorted(
+            self.sign * v
+            for (t, i), v in self.reports.items()
+            if i == k and t != self.trial
+        )
+        if len(others) < self.min_trials:
+            return False
+        # lower is better after the sign flip
+        threshold = others[min(len(others) - 1, int(len(others) * self.percentile / 100))]
+        self.pruned = self.sign * value > threshold
+        return self.pruned
+
+    def summary(self) -> str:
+        if self.pruned:
+            return f"trial {self.trial} pruned after {self.num_reports} validations"
+        return self.early_stopping.summary()
+
+    def state_dict(self) -> Dict[str, Any]:
+        return self.early_stopping.state_dict() if self.early_stopping is not None else {}
+
+    def load_state_dict(self, state: Dict[str, Any]) -> None:
+        if self.early_stopping is not None:
+            self.early_stopping.load_state_dict(state)
+
+
+def run_trial(
+    trial: int,
+    params: Dict[str, Any],
+    opt_cfg: Dict[str, Any],
+    pipeline_cfg: Dict[str, Any],
+    sweep_cfg: Dict[str, Any],
+    slots,
+    reports,
+) -> Dict[str, Any]:
+    """Train one trial in a pool worker and return its summary row"""
+    slot = slots.get()
+    save_dir = Path(sweep_cfg["save_dir"])
+    result = {"trial": trial, "device": slot, **params}
+    start = time.perf_counter()
+    try:
+        # the device and threads are set before torch initializes them
+        os.environ["CUDA_VISIBLE_DEVICES"] = "" if str(slot) == "cpu" else str(slot)
+        threads = sweep_cfg.get("threads")
+        if threads:
+            os.environ["OMP_NUM_THREADS"] = os.environ["MKL_NUM_THREADS"] = str(threads)
+        sys.path.insert(0, os.getcwd())
+        with open(save_dir / f"trial_{trial:03d}.log", "w") as log, contextlib.redirect_stdout(
+            log
+        ), contextlib.redirect_stderr(log):
+            root = logging.getLogger()
+            root.handlers = [logging.StreamHandler(log)]
+            root.setLevel(logging.INFO)
+            import torch
+
+            if threads:
+                torch.set_num_threads(threads)
+            for module in sweep_cfg.get("imports") or []:
+                importlib.import_module(module)
+            from nncore.core.opt import opts
+            from nncore.segmentation.pipeline import Pipeline
+
+            opt_cfg, pipeline_cfg = copy.deepcopy(opt_cfg), copy.deepcopy(pipeline_cfg)
+            for k, v in params.items():
+                if k.startswith("opts."):
+                    set_key(opt_cfg, k[len("opts."):], v)
+                else:
+                    set_key(pipeline_cfg, k, v)
+            pipeline_path = save_dir / f"trial_{trial:03d}_pipeline.yaml"
+            with open(pipeline_path, "w") as f:
+                yaml.safe_dump(pipeline_cfg, f)
+            opt_cfg.update(
+                id=f"trial_{trial:03d}",
+                save_dir=str(save_dir / "trials"),
+                cfg_pipeline=str(pipeline_path),
+                verbose=False,
+            )
+            opt_path = save_dir / f"trial_{trial:03d}_opt.yaml"
+            with open(opt_path, "w") as f:
+                yaml.safe_dump({"opts": opt_cfg}, f)
+
+            pipeline = Pipeline(opts(cfg_path=str(opt_path)).parse())
+            learner = pipeline.learner
+            prune = sweep_cfg.get("prune") or {}
+            pruner = TrialPruner(
+                trial,
+                reports,
+                monitor=sweep_cfg.get("metric", "loss"),
+                warmup=prune.get("warmup", 1),
+                min_trials=prune.get("min_trials", 3),
+                percentile=prune.get("percentile", 50),
+                early_stopping=learner.early_stopping,
+            )
+            if not prune.get("enabled", True):
+                pruner.min_trials = math.inf
+            learner.early_stopping = pruner
+            pipeline.fit()
+        result.update(
+            status="pruned" if pruner.pruned else "complete",
+            value=pruner.best,
+            validations=pruner.num_reports,
+            run_dir=str(learner.save_dir),
+        )
+    except Exception:
+        result.update(status="failed", error=traceback.format_exc().strip().splitlines()[-1])
+        with open(save_dir / f"trial_{trial:03d}.log", "a") as log:
+            traceback.print_exc(file=log)
+    finally:
+        slots.put(slot)
+    result["minutes"] = round((time.perf_counter() - start) / 60, 3)
+    return result
+
+
+def write_summary(rows: List[Dict[str, Any]], path: Path, monitor: str) -> List[Dict[str, Any]]:
+    """Rank the trials by their best value, write them as CSV and print a table"""
+    rows = rank_rows(rows, "value", "min" if monitor == "loss" else "max")
+    write_csv(rows, path)
+    print_table(rows, exclude=("run_dir", "error"))
+    return rows
+
+
+def run_sweep(cfg: Dict[str, Any]) -> List[Dict[str, Any]]:
+    r"""Run a sweep config, see the module docstring for its format
+
+    Args:
+        cfg (Dict[str, Any]): sweep config with `sweep` and `params` sections
+
+    Returns:
+        List[Dict[str, Any]]: one row per trial, best first
+    """
+    sweep_cfg = dict(cfg["sweep"])
+    with open(sweep_cfg["opt"]) as f:
+        opt_cfg = yaml.safe_load(f)["opts"]
+    with open(sweep_cfg["pipeline"]) as f:
+        pipeline_cfg = yaml.safe_load(f)
+
+    trials = expand_params(
+        cfg["params"],
+        method=sweep_cfg.get("method", "grid"),
+        num_trials=sweep_cfg.get("num_trials"),
+        seed=sweep_cfg.get("seed", 0),
+    )
+    save_dir = Path(sweep_cfg.get("save_dir", "./sweeps")) / time.strftime("sweep_%Y_%m_%d-%H_%M_%S")
+    save_dir.mkdir(parents=True, exist_ok=True)
+    sweep_cfg["save_dir"] = str(save_dir)
+    with open(save_dir / "sweep.yaml", "w") as f:
+        yaml.safe_dump(cfg, f)
+
+    devices = sweep_cfg.get("devices") or ["cpu"]
+    slots_list = [d for d in devices for _ in range(sweep_cfg.get("trials_per_device", 1))]
+    print(f"{len(trials)} trials on {len(slots_list)} workers, saving to {save_dir}")
+
+    # spawn keeps CUDA out of the parent, one fresh process per trial
+    ctx = mp.get_context("spawn")
+    manager = ctx.Manager()
+    slots, reports = manager.Queue(), manager.dict()
+    for slot in slots_list:
+        slots.put(slot)
+    try:
+        pool = ProcessPoolExecutor(len(slots_list), mp_context=ctx, max_tasks_per_child=1)
+    except TypeError:
+        # max_tasks_per_child needs python 3.11
+        pool = ProcessPoolExecutor(len(slots_list), mp_context=ctx)
+
+    rows = []
+    with pool:
+        futures = [
+            pool.submit(run_trial, i, params, opt_cfg, pipeline_cfg, sweep_cfg, slots, reports)
+            for i, params in enumerate(trials)
+        ]
+        for future in as_completed(futures):
+            row = future.result()
+            rows.append(row)
+            print(
+                f"[{len(rows)}/{len(trials)}] trial {row['trial']}: {row['status']} "
+                f"{row.get('value', row.get('error'))}"
+            )
+    manager.shutdown()
+    return write_summary(rows, save_dir / "summary.csv", sweep_cfg.get("metric", "loss"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a hyperparameter sweep over Pipeline configs")
+    parser.add_argument("cfg", help="path to the sweep yaml")
+    args = parser.parse_args()
+    with open(args.cfg) as f:
+        run_sweep(yaml.safe_load(f))
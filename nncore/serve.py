@@ -0,0 +1,400 @@
+"""Local HTTP model server with dynamic batching
+
+Serves a segmentation checkpoint folder with asyncio and the standard library:
+
+    python -m nncore.serve runs/<run>/checkpoints --port 8080 --image-size 224 224 --max-batch-size 8 --max-wait-ms 5
+
+Endpoints:
+
+-   POST /predict: PNG/JPEG bytes (or a .npy uint8 H x W x 3 array), returns the
+    class index mask as a grayscale PNG, or as .npy with `?format=npy`
+-   GET /metrics: request counts, batch sizes and latency percentiles as JSON
+-   GET /health
+
+Requests are queued and the batcher runs the model on up to `max_batch_size`
+of them, waiting at most `max_wait_ms` after the first one for others to
+arrive. While a batch runs the next one fills up, so the batch size follows
+the load. The queue holds `max_queue` requests, above that requests are
+answered with 503 and `Retry-After` instead of piling up latency.
+"""
+import argparse
+import asyncio
+import importlib
+import io
+import json
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+Handler = Callable[..., Any]
+
+STATUS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class LatencyStats:
+    r"""Percentiles over the last `window` values
+
+    Args:
+        window (int, optional): values kept. Defaults to 10000.
+    """
+
+    def __init__(self, window: int = 10000):
+        self.values: deque = deque(maxlen=window)
+
+    def add(self, value: float) -> None:
+        self.values.append(value)
+
+    def summary(self, percentiles: Sequence[int] = (50, 90, 99)) -> Dict[str, Optional[float]]:
+        if not self.values:
+            return {f"p{p}": None for p in percentiles}
+        values = np.asarray(self.values)
+        out = {f"p{p}": round(float(np.percentile(values, p)), 3) for p in percentiles}
+        out["mean"] = round(float(values.mean()), 3)
+        return out
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class DynamicBatcher:
+    r"""Collects queued requests into batches for a blocking batch function
+
+    Args:
+        predict_batch (Callable[[List[Any]], List[Any]]): one output per input, run in a worker thread
+        max_batch_size (int, optional): inputs per call. Defaults to 8.
+        max_wait_ms (float, optional): time to wait for a batch to fill after its first input. Defaults to 5.
+        max_queue (int, optional): pending inputs before `submit` raises `QueueFullError`. Defaults to 64.
+    """
+
+    def __init__(
+        self,
+        predict_batch: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 5.0,
+        max_queue: int = 64,
+    ):
+        assert max_batch_size >= 1 and max_queue >= 1
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        # the model runs in one thread, torch parallelizes inside the batch
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="batcher")
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        self.batch_sizes: Dict[int, int] = {}
+        self.queue_ms = LatencyStats()
+        self.batch_ms = LatencyStats()
+
+    def start(self) -> None:
+        self.queue = asyncio.Queue(maxsize=self.max_queue)
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.executor.shutdown(wait=True)
+
+    async def submit(self, item: Any) -> Any:
+        """Output of `item`, raises `QueueFullError` when the queue is full"""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((item, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            raise QueueFullError from None
+        return await future
+
+    async def _collect(self) -> List[Tuple[Any, asyncio.Future, float]]:
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # requests whose client went away
+            batch = [entry for entry in batch if not entry[1].done()]
+            if not batch:
+                continue
+            start = time.perf_counter()
+            for _, _, queued in batch:
+                self.queue_ms.add(1000 * (start - queued))
+            try:
+                outputs = await loop.run_in_executor(
+                    self.executor, self.predict_batch, [item for item, _, _ in batch]
+                )
+            except Exception as e:
+                logging.exception("Batch failed")
+                outputs = [e] * len(batch)
+            self.batch_ms.add(1000 * (time.perf_counter() - start))
+            self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+            for (_, future, _), output in zip(batch, outputs):
+                if future.done():
+                    continue
+                if isinstance(output, Exception):
+                    future.set_exception(output)
+                else:
+                    future.set_result(output)
+
+    def stats(self) -> Dict[str, Any]:
+        batches = sum(self.batch_sizes.values())
+        items = sum(k * v for k, v in self.batch_sizes.items())
+        return {
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "batches": batches,
+            "mean_batch_size": round(items / batches, 3) if batches else None,
+            "batch_sizes": dict(sorted(self.batch_sizes.items())),
+            "queue_ms": self.queue_ms.summary(),
+            "batch_ms": self.batch_ms.summary(),
+        }
+
+
+def decode_image(body: bytes, content_type: str) -> np.ndarray:
+    """uint8 H x W x 3 array of an encoded image or a .npy array"""
+    if "npy" in content_type or body[:6] == b"\x93NUMPY":
+        image = np.load(io.BytesIO(body), allow_pickle=False)
+    else:
+        from PIL import Image
+
+        image = np.asarray(Image.open(io.BytesIO(body)).convert("RGB"))
+    if image.dtype != np.uint8 or image.ndim != 3 or image.shape[2] < 3:
+        raise ValueError(f"expected a uint8 H x W x 3 image, got {image.dtype} {image.shape}")
+    return image
+
+
+def encode_mask(mask: np.ndarray, fmt: str = "png") -> Tuple[bytes, str]:
+    buffer = io.BytesIO()
+    if fmt == "npy":
+        np.save(buffer, mask)
+        return buffer.getvalue(), "application/x-npy"
+    from PIL import Image
+
+    Image.fromarray(mask).save(buffer, format="PNG")
+    return buffer.getvalue(), "image/png"
+
+
+class ModelServer:
+    r"""HTTP/1.1 server in front of a `DynamicBatcher`
+
+    Args:
+        predict_batch (Callable[[List[np.ndarray]], List[np.ndarray]]): masks of a list of uint8 images
+        host (str, optional): bind address. Defaults to "127.0.0.1".
+        port (int, optional): bind port, 0 picks a free one. Defaults to 8080.
+        max_body_mb (float, optional): largest accepted request body. Defaults to 32.
+        **batcher_kwargs: `DynamicBatcher` args
+    """
+
+    def __init__(
+        self,
+        predict_batch: Callable[[List[np.ndarray]], List[np.ndarray]],
+        host: str = "127.0.0.1",
+        port: int = 8080,
+        max_body_mb: float = 32.0,
+        **batcher_kwargs,
+    ):
+        self.batcher = DynamicBatcher(predict_batch, **batcher_kwargs)
+        self.host, self.port = host, port
+        self.max_body = int(max_body_mb * 2 ** 20)
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.latency_ms = LatencyStats()
+        self.counts = {"requests": 0, "ok": 0, "rejected": 0, "errors": 0}
+        self.started = time.time()
+        self.routes: Dict[Tuple[str, str], Handler] = {
+            ("GET", "/health"): self.health,
+            ("GET", "/metrics"): self.metrics,
+            ("POST", "/predict"): self.predict,
+        }
+
+    async def start(self) -> None:
+        self.batcher.start()
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        await self.batcher.stop()
+
+    async def serve_forever(self) -> None:
+        await self.start()
+        logging.info(f"Serving on http://{self.host}:{self.port}")
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def health(self, query, headers, body):
+        return 200, {"status": "ok"}
+
+    async def metrics(self, query, headers, body):
+        return 200, {
+            **self.counts,
+            "uptime_s": round(time.time() - self.started, 1),
+            "latency_ms": self.latency_ms.summary(),
+            **self.batcher.stats(),
+        }
+
+    async def predict(self, query, headers, body):
+        loop = asyncio.get_running_loop()
+        try:
+            image = await loop.run_in_executor(
+                None, decode_image, body, headers.get("content-type", "")
+            )
+        except Exception as e:
+            return 400, {"error": f"could not decode the image: {e}"}
+        try:
+            mask = await self.batcher.submit(image)
+        except QueueFullError:
+            self.counts["rejected"] += 1
+            return 503, {"error": "queue full"}
+        fmt = query.get("format", ["png"])[0]
+        payload, content_type = await loop.run_in_executor(None, encode_mask, mask, fmt)
+        return 200, (payload, content_type)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ", 2)
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "bad request line"}, keep_alive=False)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        key, value = line.split(":", 1)
+                        headers[key.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get("content-length", 0) or 0)
+                    if length < 0:
+                        raise ValueError(length)
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "bad content-length"}, keep_alive=False)
+                    break
+                keep_alive = (
+                    headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                ) or headers.get("connection", "").lower() == "keep-alive"
+                if length > self.max_body:
+                    await self._respond(writer, 413, {"error": "body too large"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                start = time.perf_counter()
+                url = urlsplit(target)
+                route = self.routes.get((method, url.path))
+                if route is None:
+                    known = any(path == url.path for _, path in self.routes)
+                    status, payload = (405 if known else 404), {"error": f"{method} {url.path}"}
+                else:
+                    try:
+                        status, payload = await route(parse_qs(url.query), headers, body)
+                    except Exception as e:
+                        logging.exception("Request failed")
+                        status, payload = 500, {"error": str(e)}
+                if url.path == "/predict":
+                    self.counts["requests"] += 1
+                    if status == 200:
+                        self.counts["ok"] += 1
+                        self.latency_ms.add(1000 * (time.perf_counter() - start))
+                    elif status != 503:
+                        self.counts["errors"] += 1
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status: int, payload, keep_alive: bool) -> None:
+        if isinstance(payload, tuple):
+            body, content_type = payload
+        else:
+            body, content_type = json.dumps(payload).encode(), "application/json"
+        headers = [
+            f"HTTP/1.1 {status} {STATUS.get(status, '')}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        if status == 503:
+            headers.append("Retry-After: 1")
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a segmentation checkpoint over HTTP")
+    parser.add_argument("checkpoint_dir", help="folder with config.yaml and the checkpoints")
+    parser.add_argument("--checkpoint", default="best_loss.pth")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--threads", type=int, help="torch intra-op threads")
+    parser.add_argument("--image-size", type=int, nargs=2, help="H W the inputs are resized to, native resolution if not set")
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--max-queue", type=int, default=64, help="pending requests before answering 503")
+    parser.add_argument("--imports", nargs="*", default=[], help="modules registering custom models")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    for module in args.imports:
+        importlib.import_module(module)
+    import torch
+    from nncore.segmentation.inference import SegmentationPredictor
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    predictor = SegmentationPredictor.from_checkpoint(
+        args.checkpoint_dir, args.checkpoint, device=args.device, image_size=args.image_size
+    )
+    server = ModelServer(
+        predictor.predict_batch,
+        host=args.host,
+        port=args.port,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        max_queue=args.max_queue,
+    )
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
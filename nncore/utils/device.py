@@ -1,34 +1,122 @@
+import logging
+
 import torch
-from typing import Any
+from typing import Any, Iterable, Iterator
 
 
 def get_device() -> torch.device:
     return torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 
-def move_to(obj: Any, device: torch.device):
+def move_to(obj: Any, device: torch.device, non_blocking: bool = False):
     """Credit: https://discuss.pytorch.org/t/pytorch-tensor-to-device-for-a-list-of-dict/66283
     Arguments:
         obj {dict, list} -- Object to be moved to device
         device {torch.device} -- Device that object will be moved to
+        non_blocking {bool} -- Asynchronous copy, only effective from pinned memory
     Raises:
         TypeError: object is of type that is not implemented to process
     Returns:
         type(obj) -- same object but moved to specified device
     """
     if torch.is_tensor(obj):
-        return obj.to(device)
+        return obj.to(device, non_blocking=non_blocking)
     elif isinstance(obj, dict):
-        res = {k: move_to(v, device) for k, v in obj.items()}
+        res = {k: move_to(v, device, non_blocking) for k, v in obj.items()}
         return res
     elif isinstance(obj, list):
-        return [move_to(v, device) for v in obj]
+        return [move_to(v, device, non_blocking) for v in obj]
     elif isinstance(obj, tuple):
-        return tuple(move_to(list(obj), device))
+        return tuple(move_to(list(obj), device, non_blocking))
     else:
         raise TypeError("Invalid type for move_to")
 
 
+def is_pinned(obj: Any) -> bool:
+    """Whether every tensor of a (nested) batch is in page-locked memory"""
+    if torch.is_tensor(obj):
+        return obj.is_pinned()
+    elif isinstance(obj, dict):
+        return all(is_pinned(v) for v in obj.values())
+    elif isinstance(obj, (list, tuple)):
+        return all(is_pinned(v) for v in obj)
+    return True
+
+
+def record_stream(obj: Any, stream: torch.cuda.Stream) -> None:
+    """Mark every tensor of a (nested) batch as used by `stream`, so the caching
+    allocator does not reuse its memory while the stream still reads it.
+    """
+    if torch.is_tensor(obj):
+        obj.record_stream(stream)
+    elif isinstance(obj, dict):
+        for v in obj.values():
+            record_stream(v, stream)
+    elif isinstance(obj, (list, tuple)):
+        for v in obj:
+            record_stream(v, stream)
+
+
+class DevicePrefetcher:
+    r"""DevicePrefetcher wraps a dataloader and yields batches already on device
+
+    On CUDA the next batch is copied with `non_blocking=True` on a side stream
+    while the current batch is consumed, so the host-to-device copy overlaps
+    with compute. Batches are not pinned here, which would add a host copy on
+    the main thread: the copy is only asynchronous from a DataLoader with
+    `pin_memory=True`, the default of `get_loader_args` on CUDA, and a warning
+    is logged once otherwise. On other devices it falls back to a plain `move_to`.
+
+    Args:
+        dataloader (Iterable): source of (nested) batches
+        device (torch.device): target device
+
+    Examples:
+
+        for batch in DevicePrefetcher(dataloader, device):
+            out = model(batch)
+    """
+
+    _END = object()
+
+    def __init__(self, dataloader: Iterable, device: torch.device):
+        self.dataloader = dataloader
+        self.device = torch.device(device)
+        self.enabled = self.device.type == "cuda" and torch.cuda.is_available()
+        self.stream = torch.cuda.Stream(device=self.device) if self.enabled else None
+        self.warned = False
+
+    def __len__(self) -> int:
+        return len(self.dataloader)
+
+    def __iter__(self) -> Iterator[Any]:
+        if not self.enabled:
+            for batch in self.dataloader:
+                yield move_to(batch, self.device)
+            return
+
+        loader_iter = iter(self.dataloader)
+        next_batch = self._preload(loader_iter)
+        while next_batch is not self._END:
+            current_stream = torch.cuda.current_stream(self.device)
+            current_stream.wait_stream(self.stream)
+            batch = next_batch
+            record_stream(batch, current_stream)
+            next_batch = self._preload(loader_iter)
+            yield batch
+
+    def _preload(self, loader_iter: Iterator[Any]) -> Any:
+        try:
+            batch = next(loader_iter)
+        except StopIteration:
+            return self._END
+        if not self.warned and not is_pinned(batch):
+            logging.warning("Batches are not in pinned memory, set pin_memory=True in the DataLoader to overlap copies")
+            self.warned = True
+        with torch.cuda.stream(self.stream):
+            return move_to(batch, self.device, non_blocking=True)
+
+
 def detach(obj: Any):
     """Credit: https://discuss.pytorch.org/t/pytorch-tensor-to-device-for-a-list-of-dict/66283
     Arguments:
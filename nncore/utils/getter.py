@@ -1,8 +1,23 @@
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import torch
 from torch.optim import SGD, Adam, RMSprop
-from torch.optim.lr_scheduler import ReduceLROnPlateau, StepLR
-from torch.utils.data import DataLoader, random_split
+from torch.optim.lr_scheduler import (
+    CosineAnnealingLR,
+    CyclicLR,
+    ExponentialLR,
+    MultiStepLR,
+    OneCycleLR,
+    ReduceLROnPlateau,
+    StepLR,
+)
+from torch.utils.data import DataLoader, IterableDataset, random_split
 from nncore.core.models.wrapper import ModelWithLoss
-from nncore.core.datasets import DATASET_REGISTRY
+from nncore.core.schedulers import LRScheduler
+from nncore.core.datasets import DATASET_REGISTRY, IndexedDataset, ResumableSampler, SharedCacheDataset
 from nncore.core.metrics import METRIC_REGISTRY
 from nncore.utils.device import get_device
 
@@ -24,39 +39,198 @@ def get_function(name):
     return globals()[name]
 
 
-def get_dataloader(cfg, dataset):
+def get_scheduler(cfg: Optional[Dict[str, Any]], optimizer, steps_per_epoch: Optional[int] = None) -> LRScheduler:
+    """Build the lr scheduler wrapped with its stepping policy
+
+    Besides `name` and `args`, the config accepts `interval` ("iteration" or
+    "epoch"), `warmup_steps` and `warmup_start` (see `LRScheduler`). `OneCycleLR`
+    gets `steps_per_epoch` filled in when it is not given. The wrapped scheduler
+    only steps after the warmup, so the cycle of `OneCycleLR` is shortened by
+    `warmup_steps` to still end with the training. A missing config or
+    `name: null` keeps the lr constant, apart from the warmup.
+
+    Args:
+        cfg (Optional[Dict[str, Any]]): scheduler config from the pipeline config
+        optimizer (Optimizer): optimizer to schedule
+        steps_per_epoch (Optional[int], optional): number of iterations per epoch. Defaults to None.
+
+    Returns:
+        LRScheduler: wrapped scheduler
+    """
+    cfg = dict(cfg or {})
+    policy = {
+        k: cfg.pop(k) for k in ("interval", "warmup_steps", "warmup_start") if k in cfg
+    }
+    scheduler = None
+    if cfg.get("name") is not None:
+        cfg["args"] = dict(cfg.get("args") or {})
+        if (
+            cfg["name"] == "OneCycleLR"
+            and steps_per_epoch is not None
+            and "total_steps" not in cfg["args"]
+        ):
+            cfg["args"].setdefault("steps_per_epoch", steps_per_epoch)
+        warmup_steps = policy.get("warmup_steps") or 0
+        if cfg["name"] == "OneCycleLR" and warmup_steps:
+            args = cfg["args"]
+            total_steps = args.get("total_steps") or args.pop("epochs") * args.pop("steps_per_epoch")
+            assert total_steps > warmup_steps, (
+                f"warmup_steps ({warmup_steps}) must be shorter than the OneCycleLR cycle ({total_steps} steps)"
+            )
+            args["total_steps"] = total_steps - warmup_steps
+        scheduler = get_instance(cfg, optimizer=optimizer)
+    return LRScheduler(scheduler, optimizer, **policy)
+
+
+def get_loader_args(args: Optional[Dict[str, Any]], opt: Any = None) -> Dict[str, Any]:
+    """Fill dataloader arguments with defaults taken from `opt`
+
+    `num_workers` comes from `opt.num_workers`, `pin_memory` is enabled when CUDA
+    is available, and worker processes are kept alive across epochs with
+    `persistent_workers` and `opt.prefetch_factor`. Values set explicitly in the
+    loader config take precedence.
+
+    Persistent workers keep their dataset copy and worker seed across epochs,
+    so iterable datasets that shuffle themselves have to be told the epoch:
+    the learners call `dataset.set_epoch(epoch)` when it exists (see
+    `ShardDataset`). Set `persistent_workers: False` for other iterable
+    datasets that reseed from the worker seed.
+
+    Args:
+        args (Optional[Dict[str, Any]]): loader args from the pipeline config
+        opt (Any, optional): parsed opts. Defaults to None.
+
+    Returns:
+        Dict[str, Any]: DataLoader keyword arguments
+    """
+    defaults = {
+        "num_workers": getattr(opt, "num_workers", None) or 0,
+        "pin_memory": torch.cuda.is_available(),
+        "persistent_workers": True,
+        "prefetch_factor": getattr(opt, "prefetch_factor", None) or 2,
+    }
+    loader_args = {**defaults, **(args or {})}
+    if loader_args["num_workers"] == 0:
+        # DataLoader rejects these options without worker processes
+        loader_args.pop("persistent_workers")
+        loader_args.pop("prefetch_factor")
+    return loader_args
+
+
+def autotune_num_workers(
+    dataset,
+    loader_args: Dict[str, Any],
+    collate_fn=None,
+    candidates: Optional[List[int]] = None,
+    num_batches: int = 10,
+) -> int:
+    """Pick the fastest `num_workers` for this machine
+
+    Every candidate loads one warm-up batch, then `num_batches` timed batches.
+
+    Args:
+        dataset (Dataset): dataset to load
+        loader_args (Dict[str, Any]): DataLoader keyword arguments
+        collate_fn (optional): collate function. Defaults to None.
+        candidates (Optional[List[int]], optional): worker counts to try. Defaults to 0 and powers of two up to the cpu count.
+        num_batches (int, optional): number of timed batches. Defaults to 10.
+
+    Returns:
+        int: the fastest worker count
+    """
+    if candidates is None:
+        cpu_count = os.cpu_count() or 1
+        candidates = sorted({0, cpu_count} | {2 ** i for i in range(1, cpu_count.bit_length())})
+
+    timings = {}
+    for num_workers in candidates:
+        args = get_loader_args({**loader_args, "num_workers": num_workers})
+        args.pop("persistent_workers", None)
+        loader_iter = iter(DataLoader(dataset, collate_fn=collate_fn, **args))
+        next(loader_iter, None)
+        start = time.perf_counter()
+        for _ in range(num_batches):
+            if next(loader_iter, None) is None:
+                break
+        timings[num_workers] = time.perf_counter() - start
+        del loader_iter
+
+    best = min(timings, key=timings.get)
+    logging.info(
+        "Autotuned num_workers=%d (%s)",
+        best,
+        ", ".join(f"{n}: {t:.3f}s" for n, t in timings.items()),
+    )
+    return best
+
+
+def get_dataloader(cfg, dataset, opt=None):
     collate_fn = None
     if cfg.get("collate_fn", False):
         collate_fn = get_function(cfg["collate_fn"])
 
-    dataloader = get_instance(cfg, dataset=dataset, collate_fn=collate_fn)
+    loader_args = get_loader_args(cfg.get("args"), opt)
+    if cfg["name"] == "DataLoader" and not isinstance(dataset, IterableDataset):
+        # seeded order that a resumed run can fast-forward into
+        loader_args["sampler"] = ResumableSampler(
+            dataset,
+            shuffle=loader_args.pop("shuffle", False),
+            seed=getattr(opt, "seed", None) or 0,
+        )
+    if cfg["name"] == "DataLoader" and getattr(opt, "autotune_workers", False):
+        num_workers = autotune_num_workers(dataset, loader_args, collate_fn)
+        loader_args = get_loader_args({**loader_args, "num_workers": num_workers}, opt)
+    if cfg["name"] == "DataLoader":
+        # draws the worker seeds, the learner reseeds it every epoch
+        loader_args.setdefault("generator", torch.Generator())
+
+    dataloader = get_instance(
+        {"name": cfg["name"], "args": loader_args},
+        dataset=dataset,
+        collate_fn=collate_fn,
+    )
     return dataloader
 
 
-def get_single_data(cfg, return_dataset=True):
+def get_dataset(cfg):
     dataset = get_instance(cfg, registry=DATASET_REGISTRY)
-    dataloader = get_dataloader(cfg["loader"], dataset)
+    if cfg.get("cache", None):
+        # e.g. cache: {capacity_mb: 4096}
+        dataset = SharedCacheDataset(dataset, **cfg["cache"])
+    if cfg.get("return_index", False):
+        # samples carry their index, e.g. for cached teacher logits
+        dataset = IndexedDataset(dataset)
+    return dataset
+
+
+def get_single_data(cfg, return_dataset=True, opt=None):
+    dataset = get_dataset(cfg)
+    dataloader = get_dataloader(cfg["loader"], dataset, opt)
     return dataloader, dataset if return_dataset else dataloader
 
 
-def get_data(cfg, return_dataset=False):
+def get_data(cfg, return_dataset=False, opt=None):
     if cfg.get("train", False) and cfg.get("val", False):
         train_dataloader, train_dataset = get_single_data(
-            cfg["train"], return_dataset=True
+            cfg["train"], return_dataset=True, opt=opt
+        )
+        val_dataloader, val_dataset = get_single_data(
+            cfg["val"], return_dataset=True, opt=opt
         )
-        val_dataloader, val_dataset = get_single_data(cfg["val"], return_dataset=True)
     elif cfg.get("trainval", False):
         trainval_cfg = cfg["trainval"]
         # Split dataset train:val = ratio:(1-ratio)
         ratio = trainval_cfg["test_ratio"]
-        dataset = get_instance(trainval_cfg["dataset"], registry=DATASET_REGISTRY)
+        dataset = get_dataset(trainval_cfg["dataset"])
         train_sz, val_sz = get_dataset_size(ratio=ratio, dataset_sz=len(dataset))
         train_dataset, val_dataset = random_split(dataset, [train_sz, val_sz])
         # Get dataloader
         train_dataloader = get_dataloader(
-            trainval_cfg["loader"]["train"], train_dataset
+            trainval_cfg["loader"]["train"], train_dataset, opt
+        )
+        val_dataloader = get_dataloader(
+            trainval_cfg["loader"]["val"], val_dataset, opt
         )
-        val_dataloader = get_dataloader(trainval_cfg["loader"]["val"], val_dataset)
     else:
         raise Exception("Dataset config is not correctly formatted.")
     return (
@@ -0,0 +1,85 @@
+"""Import-time benchmark of nncore entry points
+
+Every module is imported in a fresh interpreter with `python -X importtime`,
+the best of `--repeat` runs is reported with the slowest imported packages
+and the heavy optional dependencies that were pulled in. With `--max-seconds`
+the exit code is 1 when an import gets slower than the budget, so it can
+guard startup time in CI:
+
+    python -m nncore.utils.importtime nncore.segmentation.pipeline --max-seconds 3
+"""
+import argparse
+import subprocess
+import sys
+from typing import Dict, List, Optional, Tuple
+
+# optional dependencies that should only be imported when they are used
+HEAVY_MODULES = ("torchvision", "albumentations", "matplotlib", "tensorboard", "cv2", "tabulate")
+
+DEFAULT_MODULES = (
+    "nncore.core.registry",
+    "nncore.utils.getter",
+    "nncore.segmentation.pipeline",
+)
+
+
+def measure_import(module: str, python: str = sys.executable) -> Tuple[float, Dict[str, float], List[str]]:
+    """Import `module` in a fresh interpreter
+
+    Args:
+        module (str): module to import
+        python (str, optional): interpreter. Defaults to the current one.
+
+    Returns:
+        Tuple[float, Dict[str, float], List[str]]: import time in seconds, seconds spent
+        in the modules of every top level package, heavy modules that were imported
+    """
+    code = (
+        f"import sys, time; t = time.perf_counter(); import {module}; "
+        f"print(time.perf_counter() - t); "
+        f"print('heavy:' + ','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    proc = subprocess.run(
+        [python, "-X", "importtime", "-c", code], capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    total, heavy = proc.stdout.strip().splitlines()[-2:]
+    heavy = heavy[len("heavy:"):]
+
+    packages: Dict[str, float] = {}
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue
+        top = name.strip().split(".")[0]
+        packages[top] = packages.get(top, 0.0) + int(self_us) / 1e6
+    return float(total), packages, [m for m in heavy.split(",") if m]
+
+
+def benchmark(modules: List[str], repeat: int = 3, top: int = 5, max_seconds: Optional[float] = None) -> int:
+    """Print the import time of every module, returns the number of modules over `max_seconds`"""
+    failures = 0
+    for module in modules:
+        runs = [measure_import(module) for _ in range(repeat)]
+        total, packages, heavy = min(runs, key=lambda r: r[0])
+        over = max_seconds is not None and total > max_seconds
+        failures += over
+        print(f"{module}: {total:.3f}s (best of {repeat}){'  OVER BUDGET' if over else ''}")
+        for name, seconds in sorted(packages.items(), key=lambda kv: -kv[1])[:top]:
+            print(f"    {name:<24} {seconds:.3f}s")
+        print(f"    heavy modules: {', '.join(heavy) or 'none'}")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure nncore import times")
+    parser.add_argument("modules", nargs="*", default=list(DEFAULT_MODULES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=5, help="slowest packages to show")
+    parser.add_argument("--max-seconds", type=float, help="fail when an import is slower")
+    args = parser.parse_args()
+    sys.exit(1 if benchmark(args.modules, args.repeat, args.top, args.max_seconds) else 0)
@@ -1,7 +1,10 @@
 import copy
+import os
+import random
+from pathlib import Path
 from typing import Any, Dict, List
 
-import matplotlib.pyplot as plt
+import numpy as np
 import torch
 import yaml
 from torch.nn import Module
@@ -11,14 +14,60 @@ def copy_model(model: Module) -> Module:
     return copy.deepcopy(model)
 
 
+# keys kept in the weights file, everything else goes to the training state side file
+WEIGHT_KEYS = ("model_state_dict", "epoch")
+
+
+def state_path(path: str) -> Path:
+    """Training state side file of a checkpoint, e.g. best_loss.pth -> best_loss.state.pth"""
+    path = Path(path)
+    return path.with_name(f"{path.stem}.state{path.suffix}")
+
+
+def _atomic_save(obj: Any, path: Path):
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    torch.save(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+
 def save_model(data: Dict[str, Any], path: str, verbose: bool = True):
-    torch.save(data, path)
+    """Save a checkpoint as a weights file plus a training state side file
+
+    The weights file only holds `model_state_dict` (and the epoch), so inference
+    can map it without reading the optimizer state. The other entries
+    (optimizer, scheduler, ...) are written to `state_path(path)`.
+    """
+    path = Path(path)
+    weights = {k: v for k, v in data.items() if k in WEIGHT_KEYS}
+    state = {k: v for k, v in data.items() if k not in WEIGHT_KEYS}
+    _atomic_save(weights, path)
+    if state:
+        _atomic_save(state, state_path(path))
     if verbose:
         print("Model saved")
 
 
+def load_weights(path: str, map_location="cpu", key="model_state_dict"):
+    """Load only the model weights of a checkpoint, memory-mapped when supported
+
+    With `mmap=True` tensors are read lazily from the page cache instead of
+    being copied into memory up front, which also skips any optimizer state
+    stored in older single-file checkpoints.
+    """
+    try:
+        cp = torch.load(path, map_location=map_location, mmap=True, weights_only=True)
+    except TypeError:
+        # torch < 2.1 has no mmap loading
+        cp = torch.load(path, map_location=map_location)
+    return cp[key]
+
+
 def load_checkpoint(path: str, map_location="cpu"):
-    return torch.load(path, map_location=map_location)
+    """Load a full checkpoint, merging the training state side file if present"""
+    cp = torch.load(path, map_location=map_location)
+    if state_path(path).exists():
+        cp.update(torch.load(state_path(path), map_location=map_location))
+    return cp
 
 
 def load_model(
@@ -28,12 +77,41 @@ def load_model(
     map_location="cpu",
     key="model_state_dict",
 ):
-    model.load_state_dict(torch.load(path, map_location=map_location)[key])
+    model.load_state_dict(load_weights(path, map_location=map_location, key=key))
     if verbose:
         print("Model loaded")
 
 
+def set_seed(seed: int) -> None:
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+
+def get_rng_state() -> Dict[str, Any]:
+    """Random states of python, numpy and torch (cpu and cuda)"""
+    # numpy keys are stored as a tensor so the state loads with weights_only
+    name, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    return {
+        "python": random.getstate(),
+        "numpy": (name, torch.from_numpy(keys.copy()), pos, has_gauss, cached_gaussian),
+        "torch": torch.get_rng_state(),
+        "cuda": torch.cuda.get_rng_state_all() if torch.cuda.is_available() else [],
+    }
+
+
+def set_rng_state(state: Dict[str, Any]) -> None:
+    name, keys, pos, has_gauss, cached_gaussian = state["numpy"]
+    random.setstate(state["python"])
+    np.random.set_state((name, keys.numpy(), pos, has_gauss, cached_gaussian))
+    torch.set_rng_state(state["torch"])
+    if state["cuda"] and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+
 def tensor2plt(obj: torch.Tensor, title: List[Any]):
+    import matplotlib.pyplot as plt
+
     fig = plt.figure()
     plt.imshow(obj.permute(1, 2, 0))
     plt.title(title)